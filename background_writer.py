@@ -0,0 +1,285 @@
+"""
+后台批量写入
+保存内容时只把数据放入队列，由后台线程批量写入临时文件、统一fsync后原子重命名
+调用方不会阻塞在磁盘IO上，读取方也不会看到写了一半的文件
+"""
+
+import atexit
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import WRITER_CONFIG
+from metrics import metrics
+
+
+def atomic_write_bytes(file_path: str, data: bytes) -> None:
+    """先写入同目录下的临时文件再重命名，保证读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def is_temp_file(filename: str) -> bool:
+    """判断文件是否为尚未完成重命名的临时文件"""
+    return filename.startswith(".") and filename.endswith(".tmp")
+
+
+def _fsync_directory(directory: str) -> None:
+    """同步目录项，保证重命名在断电后仍然有效（Windows不支持，直接跳过）"""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# 队列中的任务类型
+_WRITE = "write"
+_CALL = "call"
+_STOP = object()
+
+
+class BackgroundWriter:
+    """后台批量写入线程"""
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        enabled: Optional[bool] = None,
+    ):
+        self.batch_size = batch_size or WRITER_CONFIG["batch_size"]
+        self.flush_interval = (
+            flush_interval
+            if flush_interval is not None
+            else WRITER_CONFIG["flush_interval"]
+        )
+        self.enabled = WRITER_CONFIG["enabled"] if enabled is None else enabled
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.files_written = 0
+        self.errors = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="background-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(
+        self,
+        file_path: str,
+        content: str,
+        callback: Optional[Callable[[str, str], None]] = None,
+    ) -> str:
+        """提交一个文件写入任务
+
+        Args:
+            file_path: 目标文件路径
+            content: 文件内容
+            callback: 文件重命名到位后在写入线程中调用，参数为 (file_path, content)
+
+        Returns:
+            str: 目标文件路径
+        """
+        if not self.enabled:
+            self._write_batch([(_WRITE, (file_path, content, callback))])
+            return file_path
+
+        self._ensure_started()
+        self._queue.put((_WRITE, (file_path, content, callback)))
+        return file_path
+
+    def submit_call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """提交一个在写入线程中执行的任务，用于其他需要落盘的操作"""
+        if not self.enabled:
+            self._write_batch([(_CALL, (func, args, kwargs))])
+            return
+
+        self._ensure_started()
+        self._queue.put((_CALL, (func, args, kwargs)))
+
+    def flush(self) -> None:
+        """等待已提交的任务全部完成"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def barrier(self, timeout: Optional[float] = None) -> bool:
+        """等待调用线程此前提交的任务完成，不等待之后其他线程提交的任务
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        done = threading.Event()
+        # 同一批中先写文件再按提交顺序执行任务，这个任务执行时此前提交的任务都已完成
+        self.submit_call(done.set)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """完成剩余任务并停止写入线程"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+
+    def pending(self) -> int:
+        """尚未完成的任务数"""
+        return self._queue.unfinished_tasks
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pending": self.pending(),
+            "batches": self.batches,
+            "files_written": self.files_written,
+            "errors": self.errors,
+        }
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+
+            # 在flush_interval内尽量凑满一批
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_item is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                batch.append(next_item)
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                # 写入线程不能退出，否则之后提交的任务永远不会完成
+                self.errors += 1
+                print(f"❌ 批量写入失败: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    @metrics.timed("writer_batch_seconds")
+    def _write_batch(self, batch: List[Tuple[str, Any]]) -> None:
+        """写入一批任务：先写全部临时文件，统一fsync，再依次重命名"""
+        # 同一批中对同一文件的多次写入只保留最后一次
+        writes: Dict[str, Tuple[str, List[Callable[[str, str], None]]]] = {}
+        calls = []
+        for kind, payload in batch:
+            if kind == _WRITE:
+                file_path, content, callback = payload
+                callbacks = writes.pop(file_path, ("", []))[1]
+                if callback:
+                    callbacks.append(callback)
+                writes[file_path] = (content, callbacks)
+            else:
+                calls.append(payload)
+
+        staged = []
+        for file_path, (content, callbacks) in writes.items():
+            directory = os.path.dirname(file_path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=directory, prefix=".", suffix=".tmp"
+                )
+                f = os.fdopen(fd, "w", encoding="utf-8")
+                f.write(content)
+                f.flush()
+                metrics.inc("writer_bytes_total", f.tell())
+                staged.append((file_path, tmp_path, f, content, callbacks))
+            except OSError as e:
+                self.errors += 1
+                print(f"❌ 写入文件失败: {file_path}: {e}", file=sys.stderr)
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        # 统一同步到磁盘，同步失败的文件不再重命名
+        synced = []
+        for item in staged:
+            file_path, tmp_path, f = item[:3]
+            try:
+                os.fsync(f.fileno())
+            except OSError as e:
+                self.errors += 1
+                print(f"❌ 写入文件失败: {file_path}: {e}", file=sys.stderr)
+                f.close()
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                continue
+            f.close()
+            synced.append(item)
+
+        written = []
+        directories = set()
+        for file_path, tmp_path, _, content, callbacks in synced:
+            try:
+                os.replace(tmp_path, file_path)
+            except OSError as e:
+                self.errors += 1
+                print(f"❌ 写入文件失败: {file_path}: {e}", file=sys.stderr)
+                continue
+            directories.add(os.path.dirname(file_path) or ".")
+            written.append((file_path, content, callbacks))
+            self.files_written += 1
+
+        for directory in directories:
+            try:
+                _fsync_directory(directory)
+            except OSError:
+                pass
+
+        for file_path, content, callbacks in written:
+            for callback in callbacks:
+                self._safe_call(callback, (file_path, content), {})
+
+        for func, args, kwargs in calls:
+            self._safe_call(func, args, kwargs)
+        self.batches += 1
+
+    def _safe_call(self, func: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ 后台任务失败: {e}", file=sys.stderr)
+
+
+writer = BackgroundWriter()
+
+# 进程退出前写完队列中剩余的内容
+atexit.register(writer.close)
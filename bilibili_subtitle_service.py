@@ -5,17 +5,61 @@ Bilibili字幕获取服务
 
 import re
 import json
+import math
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
 from typing import Dict, List, Any, Optional, Tuple
 from urllib.parse import urlparse, parse_qs
 
-from config import BILIBILI_COOKIES, USER_AGENT, API_CONFIG
+from config import (
+    USER_AGENT,
+    API_CONFIG,
+    CHAPTER_CONFIG,
+    DANMAKU_CONFIG,
+    NEGATIVE_CACHE_CONFIG,
+)
+from chapters import detect_chapters
+from normalize import VERSION as NORMALIZE_VERSION, normalize_subtitle
+from danmaku import SEGMENT_SECONDS, DanmakuTrack, iter_segment
+from cookie_pool import CookiePool, get_cookie_pool
+from metrics import metrics
+from rate_limiter import get_rate_limiter
+from tracing import tracer
+from shared_state import SharedState, get_shared_state
+from video_id import av_to_bv, normalize_bvid
+from wbi import NAV_URL, SIGNATURE_ERROR_CODES, parse_nav_keys, sign_params
+
+# 同一进程内刷新WBI密钥时加锁，避免多个线程同时请求nav接口
+_wbi_keys_lock = threading.Lock()
+WBI_KEYS_CACHE_KEY = 'wbi:keys'
+
+# 指标中使用的接口名称，其他地址均视为字幕CDN
+API_ENDPOINTS = {
+    '/x/web-interface/view': 'view',
+    '/x/web-interface/nav': 'nav',
+    '/x/player/wbi/v2': 'wbi_v2',
+    '/x/v2/dm/web/seg.so': 'danmaku',
+}
+
+# 弹幕分段接口，返回protobuf格式
+DANMAKU_SEGMENT_URL = "https://api.bilibili.com/x/v2/dm/web/seg.so"
+
+# 表示视频不存在或不可见的错误码，结果会被缓存
+VIDEO_NOT_FOUND_CODES = {-404, 62002, 62004, 62012}
 
 
 class BilibiliSubtitleService:
     """Bilibili字幕获取服务类"""
-    
-    def __init__(self, cookies: Optional[Dict[str, str]] = None):
+
+    def __init__(
+        self,
+        cookies: Optional[Dict[str, str]] = None,
+        metadata_cache: Optional[SharedState] = None,
+        refresh: bool = False,
+    ):
         self.session = requests.Session()
         # 设置User-Agent以避免被识别为爬虫
         self.session.headers.update({
@@ -24,17 +68,28 @@ class BilibiliSubtitleService:
             'Accept': 'application/json, text/plain, */*',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
         })
-        
+
         # 设置请求超时
         self.session.timeout = API_CONFIG['timeout']
-        
-        # 设置cookies - 优先使用传入的cookies，否则使用配置文件中的
-        cookies_to_use = cookies or BILIBILI_COOKIES
-        if cookies_to_use:
-            self.session.cookies.update(cookies_to_use)
-        
-        self.has_cookies = cookies_to_use is not None
-    
+
+        # session可能被多个线程共用，不保存响应中设置的Cookie，每个请求只带分配到的账号的Cookie
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        # 登录账号池 - 传入cookies时只使用这一个账号，否则使用配置文件中的所有账号
+        # Cookie在每次请求时按分配到的账号设置，不保存在session中
+        self.cookie_pool = CookiePool([cookies]) if cookies else get_cookie_pool()
+        self.has_cookies = len(self.cookie_pool) > 0
+
+        # 视频元数据缓存，不指定时使用默认的共享状态
+        self.metadata_cache = metadata_cache
+
+        # 为True时忽略"视频不存在"、"没有字幕"的缓存结果，重新请求接口
+        self.refresh = refresh
+
+        # 最近一次WBI签名失败的时间，用于判断缓存的密钥是否需要刷新
+        self._wbi_failed_at = 0.0
+
+    @tracer.traced()
     def extract_video_id(self, url: str) -> Dict[str, Any]:
         """
         从Bilibili URL中提取视频ID
@@ -44,7 +99,7 @@ class BilibiliSubtitleService:
         - https://www.bilibili.com/list/watchlater?bvid=BV1bK411W7t8&oid=123
         """
         parsed_url = urlparse(url)
-        
+
         # 处理稍后再看的URL
         if '/list/watchlater' in parsed_url.path:
             query_params = parse_qs(parsed_url.query)
@@ -52,15 +107,15 @@ class BilibiliSubtitleService:
                 return {'type': 'bvid', 'id': query_params['bvid'][0]}
             elif 'aid' in query_params:
                 return {'type': 'aid', 'id': int(query_params['aid'][0])}
-        
+
         # 处理普通视频URL
         path = parsed_url.path
         if path.endswith('/'):
             path = path[:-1]
-        
+
         path_parts = path.split('/')
         video_id = path_parts[-1]
-        
+
         if video_id.lower().startswith('av'):
             # av号格式
             aid = int(video_id[2:])
@@ -70,115 +125,465 @@ class BilibiliSubtitleService:
             return {'type': 'bvid', 'id': video_id}
         else:
             raise ValueError(f"无法识别的视频ID格式: {video_id}")
-    
+
+    @tracer.traced()
     def get_video_info(self, url: str) -> Dict[str, Any]:
-        """获取视频基本信息"""
+        """获取视频基本信息
+
+        av号在本地转换为BV号，统一通过view接口获取完整信息
+        """
         video_id_info = self.extract_video_id(url)
-        
+
         if video_id_info['type'] == 'aid':
-            # 使用aid获取信息
-            aid = video_id_info['id']
-            api_url = f"https://api.bilibili.com/x/player/pagelist?aid={aid}"
-            
-            response = self.session.get(api_url)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['code'] != 0:
-                raise Exception(f"获取视频信息失败: {data['message']}")
-            
-            pages = data['data']
-            if not pages:
-                raise Exception("视频信息为空")
-            
-            first_page = pages[0]
-            return {
-                'aid': aid,
-                'cid': first_page['cid'],
-                'title': first_page['part'],
-                'author': first_page.get('owner', {}).get('name', '未知'),
-                'ctime': first_page.get('ctime'),
-                'pages': pages
-            }
-        
-        else:  # bvid
-            bvid = video_id_info['id']
-            api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
-            
-            response = self.session.get(api_url)
+            bvid = av_to_bv(video_id_info['id'])
+        else:
+            bvid = normalize_bvid(video_id_info['id'])
+
+        return self.get_video_info_by_bvid(bvid)
+
+    def get_video_info_by_bvid(self, bvid: str) -> Dict[str, Any]:
+        """按BV号获取视频基本信息
+
+        结果缓存在共享状态中，再次查询同一视频时不再请求元数据接口
+        """
+        cache = self._get_metadata_cache()
+        cache_key = f"video:{bvid}"
+        if cache is not None and not self.refresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                metrics.inc('cache_requests_total', cache='video_info', result='hit')
+                return cached
+            missing = cache.get(f"missing:{cache_key}")
+            if missing is not None:
+                metrics.inc(
+                    'cache_requests_total', cache='video_not_found', result='hit'
+                )
+                raise Exception(f"获取视频信息失败: {missing}")
+            metrics.inc('cache_requests_total', cache='video_info', result='miss')
+
+        api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
+
+        response = self._api_get(api_url)
+        response.raise_for_status()
+        data = response.json()
+
+        if data['code'] != 0:
+            # 视频不存在或不可见时缓存结果，避免重复请求
+            if cache is not None and data['code'] in VIDEO_NOT_FOUND_CODES:
+                cache.set(
+                    f"missing:{cache_key}",
+                    data['message'],
+                    ttl=NEGATIVE_CACHE_CONFIG['not_found_ttl'],
+                )
+            raise Exception(f"获取视频信息失败: {data['message']}")
+
+        video_data = data['data']
+        video_info = {
+            'aid': video_data['aid'],
+            'bvid': video_data.get('bvid', bvid),
+            'cid': video_data['cid'],
+            'title': video_data['title'],
+            'author': video_data['owner']['name'],
+            'ctime': video_data['ctime'],
+            'duration': video_data.get('duration'),
+            'pages': video_data['pages'],
+        }
+
+        if cache is not None:
+            cache.set(cache_key, video_info, ttl=API_CONFIG['metadata_cache_ttl'])
+        return video_info
+
+    def _get_metadata_cache(self) -> Optional[SharedState]:
+        """视频元数据缓存，首次使用时再打开，未启用时返回None"""
+        if self.metadata_cache is None and API_CONFIG['metadata_cache_ttl'] > 0:
+            self.metadata_cache = get_shared_state()
+        return self.metadata_cache
+
+    def _http_get(self, url: str, **kwargs: Any) -> requests.Response:
+        """发送GET请求并记录耗时、请求次数、响应字节数和HTTP错误
+
+        所有请求都经过这里，发送前先从跨进程共享的令牌桶中取得额度
+        """
+        endpoint = API_ENDPOINTS.get(urlparse(url).path, 'subtitle_cdn')
+        limiter = get_rate_limiter('cdn' if endpoint == 'subtitle_cdn' else 'api')
+        if limiter is not None:
+            with tracer.span('rate_limit'):
+                limiter.acquire()
+        metrics.inc('bilibili_requests_total', endpoint=endpoint)
+        try:
+            with (
+                metrics.timer('bilibili_request_seconds', endpoint=endpoint),
+                tracer.span(f"GET {endpoint}"),
+            ):
+                response = self.session.get(
+                    url, timeout=API_CONFIG['timeout'], **kwargs
+                )
+        except requests.RequestException:
+            metrics.inc('bilibili_errors_total', endpoint=endpoint, code='network')
+            raise
+        metrics.inc(
+            'bilibili_response_bytes_total',
+            len(response.content or b''),
+            endpoint=endpoint,
+        )
+        if response.status_code >= 400:
+            metrics.inc(
+                'bilibili_errors_total',
+                endpoint=endpoint,
+                code=f"http_{response.status_code}",
+            )
+        return response
+
+    def _record_api_code(self, api_url: str, code: Any) -> None:
+        """记录B站接口返回的非0错误码"""
+        if code not in (0, None):
+            endpoint = API_ENDPOINTS.get(urlparse(api_url).path, 'subtitle_cdn')
+            metrics.inc('bilibili_errors_total', endpoint=endpoint, code=code)
+
+    def _api_get(
+        self, api_url: str, params: Optional[Dict[str, Any]] = None
+    ) -> requests.Response:
+        """请求api.bilibili.com接口，有登录账号时从账号池分配一个账号的Cookie"""
+        if not self.has_cookies:
+            response = self._http_get(api_url, params=params)
+            try:
+                self._record_api_code(api_url, response.json().get('code'))
+            except ValueError:
+                pass
+            return response
+
+        account = self.cookie_pool.acquire(self._check_login)
+        code, error = None, None
+        try:
+            response = self._http_get(api_url, params=params, cookies=account.cookies)
+            try:
+                code = response.json().get('code')
+                self._record_api_code(api_url, code)
+            except ValueError:
+                error = f"HTTP {response.status_code}"
+            return response
+        except requests.RequestException as e:
+            error = str(e)
+            raise
+        finally:
+            self.cookie_pool.release(account, code, error)
+
+    def _check_login(self, cookies: Dict[str, str]) -> bool:
+        """通过nav接口检查Cookie是否仍处于登录状态"""
+        response = self._http_get(NAV_URL, cookies=cookies)
+        response.raise_for_status()
+        return bool((response.json().get('data') or {}).get('isLogin'))
+
+    def _get_wbi_keys(self, force_refresh: bool = False) -> Tuple[str, str]:
+        """获取WBI签名密钥 (img_key, sub_key)
+
+        密钥缓存在共享状态中，由所有线程和进程共用，过期或签名失败时才重新请求nav接口
+        """
+        state = get_shared_state()
+        if not force_refresh:
+            cached = state.get(WBI_KEYS_CACHE_KEY)
+            if cached:
+                metrics.inc('cache_requests_total', cache='wbi_keys', result='hit')
+                return cached['img_key'], cached['sub_key']
+        metrics.inc('cache_requests_total', cache='wbi_keys', result='miss')
+
+        with _wbi_keys_lock:
+            # 等锁期间其他线程或进程可能已经刷新过
+            cached = state.get(WBI_KEYS_CACHE_KEY)
+            if cached and not (
+                force_refresh and cached['refreshed_at'] < self._wbi_failed_at
+            ):
+                return cached['img_key'], cached['sub_key']
+
+            # 未登录也可以获取密钥，不占用账号额度
+            response = self._http_get(NAV_URL)
             response.raise_for_status()
-            data = response.json()
-            
-            if data['code'] != 0:
-                raise Exception(f"获取视频信息失败: {data['message']}")
-            
-            video_data = data['data']
-            return {
-                'aid': video_data['aid'],
-                'cid': video_data['cid'],
-                'title': video_data['title'],
-                'author': video_data['owner']['name'],
-                'ctime': video_data['ctime'],
-                'pages': video_data['pages']
-            }
-    
+            img_key, sub_key = parse_nav_keys(response.json())
+            state.set(
+                WBI_KEYS_CACHE_KEY,
+                {'img_key': img_key, 'sub_key': sub_key, 'refreshed_at': time.time()},
+                ttl=API_CONFIG['wbi_key_ttl'],
+            )
+            return img_key, sub_key
+
+    def _wbi_get(self, api_url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """发送带WBI签名的GET请求，签名失败时刷新密钥并重试一次"""
+        data: Dict[str, Any] = {}
+        for attempt in range(2):
+            img_key, sub_key = self._get_wbi_keys(force_refresh=attempt > 0)
+            response = self._api_get(
+                api_url, params=sign_params(params, img_key, sub_key)
+            )
+
+            if response.status_code not in (403, 412):
+                response.raise_for_status()
+                data = response.json()
+                if data.get('code') not in SIGNATURE_ERROR_CODES:
+                    return data
+            elif attempt > 0:
+                response.raise_for_status()
+
+            self._wbi_failed_at = time.time()
+        return data
+
+    @tracer.traced()
     def get_subtitle_list(self, aid: int, cid: int) -> List[Dict[str, Any]]:
         """
         获取字幕列表
-        参考bilibili-subtitle扩展的实现方式
+        参考bilibili-subtitle扩展的实现方式，请求使用WBI签名
+        没有字幕的结果会被缓存，缓存期间不再请求接口
         """
-        api_url = f"https://api.bilibili.com/x/player/wbi/v2?aid={aid}&cid={cid}"
-        
-        response = self.session.get(api_url)
-        response.raise_for_status()
-        data = response.json()
-        
+        cache = self._get_metadata_cache()
+        cache_key = f"no_subtitle:{aid}:{cid}"
+        if cache is not None and not self.refresh and cache.get(cache_key):
+            metrics.inc('cache_requests_total', cache='no_subtitle', result='hit')
+            return []
+
+        data = self._wbi_get(
+            "https://api.bilibili.com/x/player/wbi/v2", {'aid': aid, 'cid': cid}
+        )
+
         if data['code'] != 0:
             error_msg = f"获取字幕列表失败: {data['message']}"
             if not self.has_cookies and data['code'] == -101:
                 error_msg += " (可能需要登录Cookie)"
             raise Exception(error_msg)
-        
+
         subtitle_data = data['data'].get('subtitle', {})
         subtitles = subtitle_data.get('subtitles', [])
-        
+
         # 过滤掉没有subtitle_url的字幕（参考扩展的实现）
         valid_subtitles = [
             subtitle for subtitle in subtitles 
             if subtitle.get('subtitle_url')
         ]
-        
+
+        # 未登录时没有字幕可能只是因为缺少Cookie，不缓存
+        if not valid_subtitles and self.has_cookies and cache is not None:
+            cache.set(cache_key, True, ttl=NEGATIVE_CACHE_CONFIG['no_subtitle_ttl'])
+
         return valid_subtitles
-    
+
+    @tracer.traced()
     def get_subtitle_content(self, subtitle_url: str) -> Dict[str, Any]:
         """
         获取字幕内容
         参考bilibili-subtitle扩展的实现方式
         """
+        return self.fetch_subtitle_content(subtitle_url)['content']
+
+    @tracer.traced()
+    def get_subtitle_content_if_changed(
+        self, subtitle: Dict[str, Any], previous: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """获取字幕内容，已保存过的字幕尽量不重新下载
+
+        1. 字幕id与已保存的一致时直接使用已保存的内容，不发送请求
+        2. 没有字幕id时向CDN发送条件请求，返回304时使用已保存的内容
+
+        Args:
+            subtitle: get_subtitle_list返回的字幕
+            previous: 已保存的字幕，包含 subtitle_id、etag、last_modified、content
+
+        Returns:
+            Tuple[Dict, Dict]: (字幕内容, 校验信息)，
+                校验信息包含 subtitle_id、etag、last_modified、changed
+        """
+        subtitle_id = str(subtitle.get('id_str') or subtitle.get('id') or '')
+        if previous and previous.get('content') is not None:
+            if subtitle_id and subtitle_id == previous.get('subtitle_id'):
+                metrics.inc(
+                    'cache_requests_total', cache='stored_subtitle', result='hit'
+                )
+                return previous['content'], {
+                    'subtitle_id': subtitle_id,
+                    'etag': previous.get('etag'),
+                    'last_modified': previous.get('last_modified'),
+                    'changed': False,
+                }
+            if not subtitle_id:
+                result = self.fetch_subtitle_content(
+                    subtitle['subtitle_url'],
+                    previous.get('etag'),
+                    previous.get('last_modified'),
+                )
+                if result['not_modified']:
+                    metrics.inc(
+                        'cache_requests_total', cache='stored_subtitle', result='hit'
+                    )
+                    return previous['content'], {
+                        'subtitle_id': subtitle_id,
+                        'etag': result['etag'] or previous.get('etag'),
+                        'last_modified': result['last_modified']
+                        or previous.get('last_modified'),
+                        'changed': False,
+                    }
+                metrics.inc(
+                    'cache_requests_total', cache='stored_subtitle', result='miss'
+                )
+                return result['content'], {
+                    'subtitle_id': subtitle_id,
+                    'etag': result['etag'],
+                    'last_modified': result['last_modified'],
+                    'changed': True,
+                }
+
+        metrics.inc('cache_requests_total', cache='stored_subtitle', result='miss')
+        result = self.fetch_subtitle_content(subtitle['subtitle_url'])
+        return result['content'], {
+            'subtitle_id': subtitle_id,
+            'etag': result['etag'],
+            'last_modified': result['last_modified'],
+            'changed': True,
+        }
+
+    @tracer.traced()
+    def fetch_subtitle_content(
+        self,
+        subtitle_url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """获取字幕内容，提供etag或last_modified时发送条件请求
+
+        Returns:
+            Dict[str, Any]: content（未修改时为None）、not_modified、etag、last_modified
+        """
         # 确保使用HTTPS（参考扩展的实现）
         if subtitle_url.startswith('http://'):
             subtitle_url = subtitle_url.replace('http://', 'https://')
         elif subtitle_url.startswith('//'):
             subtitle_url = 'https:' + subtitle_url
-        
-        response = self.session.get(subtitle_url)
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        response = self._http_get(subtitle_url, headers=headers)
+        result = {
+            'content': None,
+            'not_modified': response.status_code == 304,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if result['not_modified']:
+            return result
+
         response.raise_for_status()
-        
+
         try:
-            return response.json()
+            result['content'] = response.json()
         except json.JSONDecodeError as e:
             raise Exception(f"解析字幕JSON失败: {e}")
-    
+        return result
+
+    def _fetch_danmaku_segment(self, cid: int, segment_index: int) -> bytes:
+        """下载一个弹幕分段（protobuf），没有弹幕的分段返回空内容
+
+        弹幕接口不需要登录，不占用账号池中账号的额度
+        """
+        response = self._http_get(
+            DANMAKU_SEGMENT_URL,
+            params={'type': 1, 'oid': cid, 'segment_index': segment_index},
+        )
+        response.raise_for_status()
+        # 出错时返回JSON
+        if 'json' in response.headers.get('Content-Type', ''):
+            data = response.json()
+            self._record_api_code(DANMAKU_SEGMENT_URL, data.get('code'))
+            if data.get('code'):
+                raise Exception(f"获取弹幕失败: {data.get('message')}")
+            return b''
+        return response.content
+
+    @tracer.traced()
+    def get_danmaku(self, cid: int, duration: Optional[float] = None) -> DanmakuTrack:
+        """获取视频（分P）的全部弹幕
+
+        各分段并发下载，按分段顺序逐个解析后丢弃原始数据。不知道视频时长时每次下载一批分段，
+        直到遇到没有弹幕的分段
+
+        Args:
+            cid: 视频分P的cid
+            duration: 视频时长（秒），用于计算分段数
+
+        Returns:
+            DanmakuTrack: 按时间排序的弹幕
+        """
+        track = DanmakuTrack()
+        workers = max(1, DANMAKU_CONFIG['workers'])
+        if duration:
+            segments = max(1, math.ceil(duration / SEGMENT_SECONDS))
+        else:
+            segments = DANMAKU_CONFIG['max_segments']
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='danmaku'
+        ) as executor:
+            for batch_start in range(1, segments + 1, workers):
+                indices = range(
+                    batch_start, min(segments, batch_start + workers - 1) + 1
+                )
+                # map按分段顺序返回结果，先完成的分段等待前面的分段解析完
+                for data in executor.map(
+                    lambda index: self._fetch_danmaku_segment(cid, index), indices
+                ):
+                    if not data and not duration:
+                        return track
+                    track.add_segment(iter_segment(data))
+        return track
+
+    def get_video_danmaku(self, video_info: Dict[str, Any]) -> DanmakuTrack:
+        """获取get_video_info返回的视频的弹幕，多P视频使用当前分P的时长计算分段数"""
+        duration = next(
+            (
+                page.get('duration')
+                for page in video_info.get('pages') or []
+                if page.get('cid') == video_info['cid']
+            ),
+            video_info.get('duration'),
+        )
+        return self.get_danmaku(video_info['cid'], duration)
+
+    @tracer.traced()
+    @metrics.timed('stage_seconds', stage='normalize')
+    def normalize_subtitle(
+        self, subtitle_data: Dict[str, Any], previous: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """规范化字幕文本，字幕未变化且已保存了相同规则的规范化结果时直接使用
+
+        Args:
+            subtitle_data: 原始字幕JSON
+            previous: 已保存的字幕，包含 content 和 normalized
+
+        Returns:
+            Dict: 规范化后的字幕JSON，交给各种格式化方法
+        """
+        stored = previous.get('normalized') if previous else None
+        if (
+            stored
+            and stored.get('normalized') == NORMALIZE_VERSION
+            and previous.get('content') == subtitle_data
+        ):
+            metrics.inc('cache_requests_total', cache='normalized', result='hit')
+            return stored
+        metrics.inc('cache_requests_total', cache='normalized', result='miss')
+        return normalize_subtitle(subtitle_data)
+
+    @tracer.traced()
+    @metrics.timed('stage_seconds', stage='format_subtitle')
     def format_subtitle(self, subtitle_data: Dict[str, Any], format_type: str = "txt") -> str:
         """格式化字幕输出"""
         body = subtitle_data.get('body', [])
-        
+
         if not body:
             return "字幕内容为空"
-        
+
         if format_type == "json":
             return json.dumps(subtitle_data, ensure_ascii=False, indent=2)
-        
+
         elif format_type == "srt":
             # SRT格式
             srt_content = []
@@ -186,39 +591,39 @@ class BilibiliSubtitleService:
                 start_time = self._seconds_to_srt_time(item['from'])
                 end_time = self._seconds_to_srt_time(item['to'])
                 content = item['content'].strip()
-                
+
                 srt_content.append(f"{i}")
                 srt_content.append(f"{start_time} --> {end_time}")
                 srt_content.append(content)
                 srt_content.append("")  # 空行分隔
-            
+
             return "\n".join(srt_content)
-        
+
         else:  # txt格式
             txt_content = []
             for item in body:
                 start_time = self._seconds_to_readable_time(item['from'])
                 end_time = self._seconds_to_readable_time(item['to'])
                 content = item['content'].strip()
-                
+
                 txt_content.append(f"[{start_time} - {end_time}] {content}")
-            
+
             return "\n".join(txt_content)
-    
+
     def _seconds_to_srt_time(self, seconds: float) -> str:
         """将秒数转换为SRT时间格式 (HH:MM:SS,mmm)"""
         hours = int(seconds // 3600)
         minutes = int((seconds % 3600) // 60)
         secs = int(seconds % 60)
         milliseconds = int((seconds % 1) * 1000)
-        
+
         return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
-    
+
     def _seconds_to_readable_time(self, seconds: float) -> str:
         """将秒数转换为可读时间格式 (MM:SS)"""
         minutes = int(seconds // 60)
         secs = int(seconds % 60)
-        
+
         return f"{minutes:02d}:{secs:02d}"
 
     def _is_sentence_end(self, text: str) -> bool:
@@ -231,28 +636,29 @@ class BilibiliSubtitleService:
         """为文本添加合适的标点符号"""
         if not text:
             return text
-        
+
         text = text.strip()
         if not text:
             return text
-        
+
         # 如果已经有标点符号，直接返回
         if self._is_sentence_end(text):
             return text
-        
+
         # 检查是否是疑问句
         question_words = ['什么', '为什么', '怎么', '如何', '哪里', '哪个', '谁', '吗', '呢']
         if any(word in text for word in question_words):
             return text + '？'
-        
+
         # 检查是否是感叹句
         exclamation_words = ['太', '非常', '真的', '居然', '竟然', '哇', '啊', '呀']
         if any(word in text for word in exclamation_words):
             return text + '！'
-        
+
         # 默认添加句号
         return text + '。'
 
+    @tracer.traced()
     def _merge_subtitle_segments(self, body: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """将字幕分段合并成更有意义的段落"""
         if not body:
@@ -298,6 +704,7 @@ class BilibiliSubtitleService:
         merged_segments.append(current_segment)
         return merged_segments
 
+    @tracer.traced()
     def _group_segments_into_paragraphs(self, segments: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
         """将段落分组成更大的章节"""
         if not segments:
@@ -305,10 +712,10 @@ class BilibiliSubtitleService:
 
         paragraphs = []
         current_paragraph = []
-        
+
         for segment in segments:
             current_paragraph.append(segment)
-            
+
             # 如果遇到明显的段落结束标志，开始新的段落
             if (len(current_paragraph) >= 5 and  # 最小段落长度
                 self._is_sentence_end(segment['content']) and
@@ -322,6 +729,34 @@ class BilibiliSubtitleService:
 
         return paragraphs
 
+    @tracer.traced()
+    @metrics.timed('stage_seconds', stage='format_as_chunks')
+    def format_as_chunks(
+        self,
+        subtitle_data: Dict[str, Any],
+        max_chars: Optional[int] = None,
+        overlap_chars: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """将字幕切分为带时间范围、相互重叠、按句子对齐的文本块，用于导入知识库
+
+        Returns:
+            List[Dict]: 文本块，包含 index、start、end（秒）和 text
+        """
+        from chunker import chunk_segments
+
+        segments = self._merge_subtitle_segments(subtitle_data.get('body', []))
+        return chunk_segments(segments, max_chars, overlap_chars)
+
+    @tracer.traced()
+    @metrics.timed('stage_seconds', stage='detect_chapters')
+    def detect_chapters(self, subtitle_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """按词汇连贯性和字幕间隔把字幕切分为章节，弹幕和短视频返回空列表"""
+        if subtitle_data.get('type') == 'danmaku':
+            return []
+        return detect_chapters(subtitle_data.get('body', []))
+
+    @tracer.traced()
+    @metrics.timed('stage_seconds', stage='format_as_article')
     def format_as_article(self, subtitle_data: Dict[str, Any], include_timestamp: bool = False) -> str:
         """将字幕格式化为文章格式
         
@@ -336,33 +771,49 @@ class BilibiliSubtitleService:
         if not body:
             return "字幕内容为空"
 
-        # 1. 合并相邻的字幕片段
-        merged_segments = self._merge_subtitle_segments(body)
-        
-        # 2. 将片段分组成段落
-        paragraphs = self._group_segments_into_paragraphs(merged_segments)
-        
-        # 3. 格式化文章
+        # 1. 长视频先切分章节，段落不跨越章节边界
+        chapters = (
+            self.detect_chapters(subtitle_data) if CHAPTER_CONFIG['enabled'] else []
+        )
+        sections = [
+            (chapter, body[chapter['start_cue'] : chapter['end_cue']])
+            for chapter in chapters
+        ] or [(None, body)]
+
         article_parts = []
-        
-        for i, paragraph in enumerate(paragraphs):
-            paragraph_lines = []
-            
-            # 添加时间戳（如果需要）
-            if include_timestamp:
-                start_time = self._seconds_to_readable_time(paragraph[0]['from'])
-                end_time = self._seconds_to_readable_time(paragraph[-1]['to'])
-                paragraph_lines.append(f"[{start_time} - {end_time}]")
-            
-            # 添加段落内容
-            paragraph_text = ''.join(segment['content'] for segment in paragraph)
-            # 确保段落文本有合适的标点符号
-            paragraph_text = self._add_punctuation(paragraph_text)
-            paragraph_lines.append(paragraph_text)
-            
-            # 合并段落内容
-            article_parts.append('\n'.join(paragraph_lines))
-        
+        for chapter, cues in sections:
+            # 章节标题行：## 开始时间 标题
+            if chapter:
+                article_parts.append(
+                    f"## {self._seconds_to_readable_time(chapter['from'])} "
+                    f"{chapter['title']}"
+                )
+
+            # 2. 合并相邻的字幕片段
+            merged_segments = self._merge_subtitle_segments(cues)
+
+            # 3. 将片段分组成段落
+            paragraphs = self._group_segments_into_paragraphs(merged_segments)
+
+            # 4. 格式化文章
+            for paragraph in paragraphs:
+                paragraph_lines = []
+
+                # 添加时间戳（如果需要）
+                if include_timestamp:
+                    start_time = self._seconds_to_readable_time(paragraph[0]['from'])
+                    end_time = self._seconds_to_readable_time(paragraph[-1]['to'])
+                    paragraph_lines.append(f"[{start_time} - {end_time}]")
+
+                # 添加段落内容
+                paragraph_text = ''.join(segment['content'] for segment in paragraph)
+                # 确保段落文本有合适的标点符号
+                paragraph_text = self._add_punctuation(paragraph_text)
+                paragraph_lines.append(paragraph_text)
+
+                # 合并段落内容
+                article_parts.append('\n'.join(paragraph_lines))
+
         # 用两个换行符分隔段落
         return '\n\n'.join(article_parts)
 
@@ -377,20 +828,22 @@ class BilibiliSubtitleService:
         """
         # 获取视频信息
         video_info = self.get_video_info(url)
-        
+
         # 获取字幕列表
         subtitle_list = self.get_subtitle_list(video_info['aid'], video_info['cid'])
         if not subtitle_list:
             raise Exception("该视频没有可用的字幕")
-            
+
         # 使用第一个可用的字幕
         selected_subtitle = subtitle_list[0]
-        
+
         # 获取字幕内容
-        subtitle_content = self.get_subtitle_content(selected_subtitle['subtitle_url'])
-        
+        subtitle_content = self.normalize_subtitle(
+            self.get_subtitle_content(selected_subtitle['subtitle_url'])
+        )
+
         # 生成两种格式
         srt_format = self.format_subtitle(subtitle_content, "srt")
         article_format = self.format_as_article(subtitle_content)
-        
-        return srt_format, article_format
\ No newline at end of file
+
+        return srt_format, article_format
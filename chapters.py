@@ -0,0 +1,242 @@
+"""
+章节切分
+按TextTiling的思路切分长视频：把字幕合并为固定字数的文本块，比较每个边界两侧若干文本块的词汇余弦相似度，
+相似度明显下降（深度得分高）且字幕间隔较长的位置作为章节边界
+窗口滑动时只更新移入、移出的文本块的词语，整个过程与字幕条数成线性关系，可以在保存每个视频时直接运行
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CHAPTER_CONFIG
+from keywords import extract_terms
+
+# 标题末尾去掉的标点
+_TRAILING_PUNCTUATION = re.compile(r"[\s，,、。！？!?；;：:…~]+$")
+
+
+def _blocks(
+    cues: List[Dict[str, Any]], block_chars: int
+) -> Tuple[List[int], List[Counter], List[Counter]]:
+    """把连续的字幕合并为约block_chars字的文本块
+
+    Returns:
+        (每个文本块的第一条字幕下标, 每个文本块的词语, 每条字幕的词语)
+    """
+    starts: List[int] = []
+    block_terms: List[Counter] = []
+    cue_terms: List[Counter] = []
+    chars = block_chars
+    for i, cue in enumerate(cues):
+        if chars >= block_chars:
+            starts.append(i)
+            block_terms.append(Counter())
+            chars = 0
+        terms = extract_terms(cue["content"])
+        cue_terms.append(terms)
+        block_terms[-1].update(terms)
+        chars += len(cue["content"])
+    return starts, block_terms, cue_terms
+
+
+class _Window:
+    """滑动窗口内的词频，增量维护与另一个窗口的点积和自身的平方和"""
+
+    def __init__(self) -> None:
+        self.counts: Counter = Counter()
+        self.norm = 0
+
+    def update(self, terms: Counter, sign: int, other: "_Window") -> int:
+        """加入（sign=1）或移除（sign=-1）一个文本块，返回点积的变化量"""
+        delta_dot = 0
+        for term, count in terms.items():
+            delta = sign * count
+            old = self.counts[term]
+            self.norm += (old + delta) ** 2 - old**2
+            delta_dot += delta * other.counts[term]
+            if old + delta:
+                self.counts[term] = old + delta
+            else:
+                del self.counts[term]
+        return delta_dot
+
+
+def _cohesion(block_terms: List[Counter], window: int) -> List[float]:
+    """每个文本块边界两侧窗口的词汇余弦相似度，第i项对应第i个文本块之前的边界（第0项无意义）"""
+    left, right = _Window(), _Window()
+    dot = 0
+    for terms in block_terms[:window]:
+        dot += right.update(terms, 1, left)
+
+    scores = [0.0]
+    for gap in range(1, len(block_terms)):
+        # 第gap-1块从右侧窗口移到左侧窗口，窗口整体右移一块
+        dot += right.update(block_terms[gap - 1], -1, left)
+        dot += left.update(block_terms[gap - 1], 1, right)
+        if gap - 1 - window >= 0:
+            dot += left.update(block_terms[gap - 1 - window], -1, right)
+        if gap - 1 + window < len(block_terms):
+            dot += right.update(block_terms[gap - 1 + window], 1, left)
+        scores.append(
+            dot / math.sqrt(left.norm * right.norm) if left.norm and right.norm else 0.0
+        )
+    return scores
+
+
+def _depths(scores: List[float]) -> List[float]:
+    """深度得分：边界两侧沿相似度上升方向能到达的最高点与边界处相似度之差的和"""
+    count = len(scores)
+    left_peak, right_peak = scores[:], scores[:]
+    for i in range(2, count):
+        if scores[i - 1] > scores[i]:
+            left_peak[i] = left_peak[i - 1]
+    for i in range(count - 2, 0, -1):
+        if scores[i + 1] > scores[i]:
+            right_peak[i] = right_peak[i + 1]
+    return [0.0] + [
+        left_peak[i] + right_peak[i] - 2 * scores[i] for i in range(1, count)
+    ]
+
+
+def _title(
+    cues: List[Dict[str, Any]],
+    cue_terms: List[Counter],
+    start: int,
+    end: int,
+    weights: Dict[str, float],
+    title_chars: int,
+) -> str:
+    """章节中包含最多关键词的一条字幕作为标题"""
+    best, best_score = start, -1.0
+    for i in range(start, end):
+        score = sum(weights.get(term, 0.0) for term in cue_terms[i])
+        if score > best_score:
+            best, best_score = i, score
+    title = _TRAILING_PUNCTUATION.sub(
+        "", cues[best]["content"].replace("\n", " ").strip()
+    )
+    return title if len(title) <= title_chars else title[:title_chars] + "…"
+
+
+def detect_chapters(
+    cues: List[Dict[str, Any]],
+    block_chars: Optional[int] = None,
+    window: Optional[int] = None,
+    min_seconds: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """把字幕切分为章节
+
+    Args:
+        cues: 按时间排序的字幕条目（B站字幕JSON的body或 parse_srt 的结果）
+        block_chars: 文本块字数
+        window: 边界两侧比较的文本块数
+        min_seconds: 每个章节最短时长（秒）
+
+    Returns:
+        List[Dict]: 章节，包含 index、from、to、title、keywords，以及字幕下标范围 start_cue、end_cue；
+        无法切分出两个以上章节时返回空列表
+    """
+    block_chars = block_chars or CHAPTER_CONFIG["block_chars"]
+    window = window or CHAPTER_CONFIG["window"]
+    min_seconds = CHAPTER_CONFIG["min_seconds"] if min_seconds is None else min_seconds
+    if not cues or cues[-1]["to"] - cues[0]["from"] < 2 * min_seconds:
+        return []
+
+    starts, block_terms, cue_terms = _blocks(cues, block_chars)
+    if len(starts) < 2 * window:
+        return []
+
+    depths = _depths(_cohesion(block_terms, window))
+
+    # 字幕间隔较长的边界更可能是章节边界
+    gap_seconds, gap_weight = (
+        CHAPTER_CONFIG["gap_seconds"],
+        CHAPTER_CONFIG["gap_weight"],
+    )
+    scores = [0.0] + [
+        depths[gap]
+        + gap_weight
+        * min(
+            max(cues[starts[gap]]["from"] - cues[starts[gap] - 1]["to"], 0.0)
+            / gap_seconds,
+            1.0,
+        )
+        for gap in range(1, len(starts))
+    ]
+
+    # 候选边界为得分的局部最大值，阈值为候选得分的平均值减去半个标准差
+    candidates = [
+        gap
+        for gap in range(1, len(starts))
+        if scores[gap] > 0
+        and scores[gap] >= scores[gap - 1]
+        and (gap + 1 == len(starts) or scores[gap] >= scores[gap + 1])
+    ]
+    if not candidates:
+        return []
+    mean = sum(scores[gap] for gap in candidates) / len(candidates)
+    std = math.sqrt(
+        sum((scores[gap] - mean) ** 2 for gap in candidates) / len(candidates)
+    )
+    threshold = mean - std / 2
+
+    # 从前往后选择边界，与上一个边界间隔太短时保留得分较高的一个
+    begin, end = cues[0]["from"], cues[-1]["to"]
+    boundaries: List[int] = []
+    for gap in candidates:
+        at = cues[starts[gap]]["from"]
+        if (
+            scores[gap] < threshold
+            or at - begin < min_seconds
+            or end - at < min_seconds
+        ):
+            continue
+        if boundaries and at - cues[starts[boundaries[-1]]]["from"] < min_seconds:
+            if scores[gap] > scores[boundaries[-1]]:
+                boundaries[-1] = gap
+            continue
+        boundaries.append(gap)
+    if not boundaries:
+        return []
+
+    ranges = []
+    block_edges = [0] + boundaries + [len(starts)]
+    for first, last in zip(block_edges, block_edges[1:]):
+        terms: Counter = Counter()
+        for block in range(first, last):
+            terms.update(block_terms[block])
+        end_cue = starts[last] if last < len(starts) else len(cues)
+        ranges.append((starts[first], end_cue, terms))
+
+    # 章节关键词：在本章出现多、在其他章节出现少的词
+    df: Counter = Counter()
+    for _, _, terms in ranges:
+        df.update(terms.keys())
+    chapters = []
+    for index, (start_cue, end_cue, terms) in enumerate(ranges, 1):
+        weights = {
+            term: count * math.log(1 + len(ranges) / df[term])
+            for term, count in terms.items()
+        }
+        top = sorted(weights, key=lambda term: (-weights[term], term))[:10]
+        chapters.append(
+            {
+                "index": index,
+                "from": cues[start_cue]["from"],
+                "to": cues[end_cue - 1]["to"],
+                "title": _title(
+                    cues,
+                    cue_terms,
+                    start_cue,
+                    end_cue,
+                    {term: weights[term] for term in top},
+                    CHAPTER_CONFIG["title_chars"],
+                ),
+                "keywords": top[:3],
+                "start_cue": start_cue,
+                "end_cue": end_cue,
+            }
+        )
+    return chapters
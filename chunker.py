@@ -0,0 +1,266 @@
+"""
+知识库分块导出
+把字幕切分为固定长度、相互重叠、按句子对齐的文本块，每块带有开始/结束时间和视频信息
+批量导出整个视频库（或上次导出之后有变化的视频）为JSONL，逐个视频处理，内存占用不随视频库增长
+"""
+
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from config import CHUNK_CONFIG
+
+# 句子结束符，切分后保留在句尾
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;])")
+# 超长句子的次级切分点
+_CLAUSE_END = re.compile(r"(?<=[，,、：:])")
+
+
+def _split_with_times(
+    segment: Dict[str, Any], pattern: re.Pattern
+) -> List[Dict[str, Any]]:
+    """按标点切分一段字幕，时间按字数在段内线性插值"""
+    text = segment["content"]
+    parts = [part for part in pattern.split(text) if part.strip()]
+    if len(parts) <= 1:
+        return [segment]
+
+    duration = segment["to"] - segment["from"]
+    total = len(text)
+    units, offset = [], 0
+    for part in parts:
+        start = segment["from"] + duration * offset / total
+        offset += len(part)
+        # 合并段落时句号后可能被补上逗号，切分后去掉句首的逗号
+        content = part.strip().lstrip("，,、")
+        if not content:
+            continue
+        units.append(
+            {
+                "from": round(start, 3),
+                "to": round(segment["from"] + duration * offset / total, 3),
+                "content": content,
+            }
+        )
+    return units
+
+
+def sentence_units(
+    segments: List[Dict[str, Any]], max_chars: int
+) -> List[Dict[str, Any]]:
+    """把合并后的字幕段落切分为句子
+
+    _merge_subtitle_segments 的结果可能包含多个句子，按句末标点切开；
+    仍然超过max_chars的句子再按逗号切分，最后按长度硬切
+    """
+    units = []
+    for segment in segments:
+        for sentence in _split_with_times(segment, _SENTENCE_END):
+            if len(sentence["content"]) <= max_chars:
+                units.append(sentence)
+                continue
+            for clause in _split_with_times(sentence, _CLAUSE_END):
+                text = clause["content"]
+                if len(text) <= max_chars:
+                    units.append(clause)
+                    continue
+                duration = clause["to"] - clause["from"]
+                for start in range(0, len(text), max_chars):
+                    end = min(len(text), start + max_chars)
+                    units.append(
+                        {
+                            "from": round(
+                                clause["from"] + duration * start / len(text), 3
+                            ),
+                            "to": round(clause["from"] + duration * end / len(text), 3),
+                            "content": text[start:end],
+                        }
+                    )
+    return units
+
+
+def chunk_segments(
+    segments: List[Dict[str, Any]],
+    max_chars: Optional[int] = None,
+    overlap_chars: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """把字幕段落切分为相互重叠的文本块
+
+    Args:
+        segments: _merge_subtitle_segments 返回的段落
+        max_chars: 每块最多字数
+        overlap_chars: 相邻两块之间最多重叠的字数，重叠部分由完整句子组成
+
+    Returns:
+        List[Dict]: 文本块，包含 index、start、end、text
+    """
+    max_chars = max_chars or CHUNK_CONFIG["max_chars"]
+    overlap_chars = (
+        CHUNK_CONFIG["overlap_chars"] if overlap_chars is None else overlap_chars
+    )
+    units = sentence_units(segments, max_chars)
+
+    chunks: List[Dict[str, Any]] = []
+    start = 0
+    while start < len(units):
+        end, size = start, 0
+        while end < len(units) and (
+            end == start or size + len(units[end]["content"]) <= max_chars
+        ):
+            size += len(units[end]["content"])
+            end += 1
+        chunks.append(
+            {
+                "index": len(chunks),
+                "start": units[start]["from"],
+                "end": units[end - 1]["to"],
+                "text": "".join(unit["content"] for unit in units[start:end]),
+            }
+        )
+        if end >= len(units):
+            break
+
+        # 下一块从末尾若干完整句子开始，重叠字数不超过overlap_chars
+        next_start, overlap = end, 0
+        while (
+            next_start - 1 > start
+            and overlap + len(units[next_start - 1]["content"]) <= overlap_chars
+        ):
+            next_start -= 1
+            overlap += len(units[next_start]["content"])
+        start = next_start
+    return chunks
+
+
+def _video_url(bvid: Optional[str], start: float) -> Optional[str]:
+    if not bvid:
+        return None
+    return f"https://www.bilibili.com/video/{bvid}?t={int(start)}"
+
+
+def iter_store_videos(
+    since: Optional[float] = None,
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """逐个读取字幕存储中的视频，返回 (视频信息, 规范化后的字幕JSON)
+
+    优先使用保存时已规范化的内容，规范化规则变化或旧记录没有保存时重新规范化
+    """
+    from normalize import normalize_subtitle
+    from transcript_store import get_store
+
+    store = get_store()
+    if store is None:
+        raise Exception("字幕存储未启用，请使用 --source docs")
+    for record in store.iter_entries(since):
+        meta = {
+            "bvid": record["bvid"],
+            "cid": record["cid"],
+            "aid": record["aid"],
+            "lang": record["lang"],
+            "title": record["title"],
+            "author": record["author"],
+            "updated_at": record["updated_at"],
+        }
+        kind = "normalized" if record.get("normalized_hash") else "raw"
+        yield meta, normalize_subtitle(json.loads(store.get_content(record, kind)))
+
+
+def iter_docs_videos(
+    docs_dir: str = "docs", since: Optional[float] = None
+) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """逐个读取docs目录中的字幕文件，返回 (视频信息, 字幕JSON)，视频信息只有标题和链接"""
+    from transcript_cache import parse_srt
+
+    for item in sorted(os.listdir(docs_dir)) if os.path.isdir(docs_dir) else []:
+        srt_path = os.path.join(docs_dir, item, "srt.srt")
+        if not os.path.isfile(srt_path):
+            continue
+        updated_at = os.stat(srt_path).st_mtime
+        if since is not None and updated_at <= since:
+            continue
+        with open(srt_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        match = re.search(r"^# Video URL: (\S+)", content, re.MULTILINE)
+        bvid = match.group(1).rstrip("/").rsplit("/", 1)[-1] if match else None
+        meta = {
+            "bvid": bvid,
+            "title": item,
+            "updated_at": updated_at,
+        }
+        yield meta, {"body": parse_srt(content)}
+
+
+def export_chunks(
+    output: TextIO,
+    source: str = "store",
+    since: Optional[float] = None,
+    max_chars: Optional[int] = None,
+    overlap_chars: Optional[int] = None,
+    docs_dir: str = "docs",
+) -> Dict[str, Any]:
+    """把视频库导出为JSONL，每行一个文本块
+
+    Args:
+        output: 输出流
+        source: 'store'（字幕存储，包含完整的视频信息）或 'docs'（docs目录）
+        since: 只导出该时间之后有变化的视频
+        max_chars / overlap_chars: 分块参数
+
+    Returns:
+        Dict: videos、chunks数量和导出内容中最新的更新时间（用作下次导出的检查点）
+    """
+    from bilibili_subtitle_service import BilibiliSubtitleService
+
+    service = BilibiliSubtitleService()
+    videos = (
+        iter_store_videos(since)
+        if source == "store"
+        else iter_docs_videos(docs_dir, since)
+    )
+
+    summary = {"videos": 0, "chunks": 0, "latest": since}
+    for meta, subtitle_data in videos:
+        chunks = service.format_as_chunks(subtitle_data, max_chars, overlap_chars)
+        key = ":".join(
+            str(meta[field])
+            for field in ("bvid", "cid", "lang")
+            if meta.get(field) is not None
+        )
+        for chunk in chunks:
+            record = dict(meta)
+            record.update(
+                {
+                    "id": f"{key or meta['title']}:{chunk['index']}",
+                    "chunk_index": chunk["index"],
+                    "chunk_count": len(chunks),
+                    "start": chunk["start"],
+                    "end": chunk["end"],
+                    "url": _video_url(meta.get("bvid"), chunk["start"]),
+                    "text": chunk["text"],
+                }
+            )
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        summary["videos"] += 1
+        summary["chunks"] += len(chunks)
+        if summary["latest"] is None or meta["updated_at"] > summary["latest"]:
+            summary["latest"] = meta["updated_at"]
+    output.flush()
+    return summary
+
+
+def load_checkpoint(path: str) -> Optional[float]:
+    """读取检查点，不存在时返回None"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("updated_at")
+
+
+def save_checkpoint(path: str, updated_at: Optional[float]) -> None:
+    """原子地写入检查点"""
+    from background_writer import atomic_write_bytes
+
+    payload = {"updated_at": updated_at, "exported_at": time.time()}
+    atomic_write_bytes(path, json.dumps(payload).encode("utf-8"))
@@ -4,7 +4,7 @@
 """
 
 import os
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from pathlib import Path
 
 # 尝试加载.env文件
@@ -24,6 +24,19 @@ def load_env_file():
 # 加载.env文件
 load_env_file()
 
+
+def parse_cookie_string(cookie_string: str) -> Optional[Dict[str, str]]:
+    """解析 "key1=value1; key2=value2" 格式的Cookie字符串"""
+    cookies = {}
+    for item in cookie_string.split(';'):
+        item = item.strip()
+        if '=' in item:
+            key, value = item.split('=', 1)
+            cookies[key.strip()] = value.strip()
+
+    return cookies if cookies else None
+
+
 # Cookie配置
 def get_bilibili_cookies() -> Optional[Dict[str, str]]:
     """
@@ -32,13 +45,13 @@ def get_bilibili_cookies() -> Optional[Dict[str, str]]:
     """
     # 从环境变量获取Cookie字符串
     cookie_string = os.getenv('BILIBILI_COOKIES', '')
-    
+
     # 如果没有Cookie字符串，尝试单独获取各个Cookie值
     if not cookie_string:
         sessdata = os.getenv('BILIBILI_SESSDATA', '')
         bili_jct = os.getenv('BILIBILI_BILI_JCT', '')
         buvid3 = os.getenv('BILIBILI_BUVID3', '')
-        
+
         if sessdata and bili_jct:
             cookies = {
                 'SESSDATA': sessdata,
@@ -48,27 +61,333 @@ def get_bilibili_cookies() -> Optional[Dict[str, str]]:
                 cookies['buvid3'] = buvid3
             return cookies
         return None
-    
+
     # 解析Cookie字符串
-    cookies = {}
-    for item in cookie_string.split(';'):
-        item = item.strip()
-        if '=' in item:
-            key, value = item.split('=', 1)
-            cookies[key.strip()] = value.strip()
-    
-    return cookies if cookies else None
+    return parse_cookie_string(cookie_string)
+
+
+def get_bilibili_cookie_pool() -> List[Dict[str, str]]:
+    """
+    获取账号池中所有账号的Cookie
+    BILIBILI_COOKIES（或单独配置的SESSDATA等）为第一个账号，
+    BILIBILI_COOKIES_1、BILIBILI_COOKIES_2…… 依次为其他账号
+    """
+    pool = []
+    first = get_bilibili_cookies()
+    if first:
+        pool.append(first)
+
+    index = 1
+    while True:
+        cookie_string = os.getenv(f'BILIBILI_COOKIES_{index}')
+        if cookie_string is None:
+            break
+        cookies = parse_cookie_string(cookie_string)
+        if cookies:
+            pool.append(cookies)
+        index += 1
+
+    return pool
+
 
 # API相关配置
 API_CONFIG = {
     # 请求超时时间（秒）
     'timeout': int(os.getenv('API_TIMEOUT', '30')),
-    
     # 请求重试次数
     'max_retries': int(os.getenv('API_MAX_RETRIES', '3')),
-    
     # 请求间隔（秒）
     'request_interval': float(os.getenv('API_REQUEST_INTERVAL', '1')),
+    # 视频元数据（aid、cid、标题、作者）缓存时间（秒），0表示不缓存
+    'metadata_cache_ttl': int(os.getenv('METADATA_CACHE_TTL', str(7 * 24 * 3600))),
+    # WBI签名密钥的刷新周期（秒），签名失败时也会立即刷新
+    'wbi_key_ttl': int(os.getenv('WBI_KEY_TTL', str(6 * 3600))),
+}
+
+# 跨进程限速配置 - 同一台机器上所有进程共用，api.bilibili.com 和字幕CDN分别限速
+RATE_LIMIT_CONFIG = {
+    # 是否启用跨进程限速
+    'enabled': os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    # api.bilibili.com 每秒请求数和突发请求数
+    'api_rate': float(os.getenv('RATE_LIMIT_API_RATE', '3')),
+    'api_burst': float(os.getenv('RATE_LIMIT_API_BURST', '6')),
+    # 字幕CDN每秒请求数和突发请求数
+    'cdn_rate': float(os.getenv('RATE_LIMIT_CDN_RATE', '10')),
+    'cdn_burst': float(os.getenv('RATE_LIMIT_CDN_BURST', '20')),
+}
+
+# 任务队列配置 - 多个工作进程（可以在不同机器上）从同一个队列领取视频链接
+QUEUE_CONFIG = {
+    # 队列数据库路径，多台机器共享时指向共享文件系统
+    'path': os.getenv('QUEUE_PATH', 'state/queue.sqlite3'),
+    # SQLite日志模式，网络文件系统上不支持WAL，需要设置为DELETE
+    'journal_mode': os.getenv('QUEUE_JOURNAL_MODE', 'WAL'),
+    # 租约时长（秒），工作进程处理期间定期续约，崩溃后超过该时间任务被重新领取
+    'visibility_timeout': int(os.getenv('QUEUE_VISIBILITY_TIMEOUT', '300')),
+    # 每个任务的最大尝试次数
+    'max_attempts': int(os.getenv('QUEUE_MAX_ATTEMPTS', '5')),
+    # 失败后首次重试的延迟（秒），之后每次翻倍
+    'retry_backoff': float(os.getenv('QUEUE_RETRY_BACKOFF', '30')),
+    # 队列为空时的轮询间隔（秒）
+    'poll_interval': float(os.getenv('QUEUE_POLL_INTERVAL', '2')),
+}
+
+# 知识库分块配置
+CHUNK_CONFIG = {
+    # 每块最多字数
+    'max_chars': int(os.getenv('CHUNK_MAX_CHARS', '800')),
+    # 相邻两块最多重叠的字数
+    'overlap_chars': int(os.getenv('CHUNK_OVERLAP_CHARS', '150')),
+}
+
+# 近似重复检测配置 - 保存字幕时计算MinHash签名，用LSH查找字幕几乎相同的视频
+DEDUPE_CONFIG = {
+    # 是否启用近似重复检测
+    'enabled': os.getenv('DEDUPE_ENABLED', 'true').lower() == 'true',
+    # 签名索引路径
+    'path': os.getenv('DEDUPE_PATH', 'state/dedupe.sqlite3'),
+    # MinHash签名长度和LSH分段数，每段 num_perm/bands 个值
+    'num_perm': int(os.getenv('DEDUPE_NUM_PERM', '128')),
+    'bands': int(os.getenv('DEDUPE_BANDS', '16')),
+    # 字符n-gram长度
+    'shingle_size': int(os.getenv('DEDUPE_SHINGLE_SIZE', '5')),
+    # 估算的Jaccard相似度达到该值时视为近似重复
+    'threshold': float(os.getenv('DEDUPE_THRESHOLD', '0.8')),
+}
+
+# 关键词配置 - 保存字幕时增量更新词频和文档频率，预先计算每个视频的关键词，用于查找相关视频
+KEYWORDS_CONFIG = {
+    # 是否启用关键词索引
+    'enabled': os.getenv('KEYWORDS_ENABLED', 'true').lower() == 'true',
+    # 索引路径
+    'path': os.getenv('KEYWORDS_PATH', 'state/keywords.sqlite3'),
+    # 切词方式：auto（安装了jieba时使用jieba，否则使用二元组）、jieba、ngram
+    'segmenter': os.getenv('KEYWORDS_SEGMENTER', 'auto'),
+    # 每个视频保存的关键词数，也是查找相关视频时使用的向量维数
+    'top_k': int(os.getenv('KEYWORDS_TOP_K', '20')),
+    # 视频数增长超过该比例后，重新计算之前视频的关键词（每次保存时最多处理refresh_batch个）
+    'stale_ratio': float(os.getenv('KEYWORDS_STALE_RATIO', '0.2')),
+    'refresh_batch': int(os.getenv('KEYWORDS_REFRESH_BATCH', '20')),
+}
+
+# 视频库统计配置 - 保存和删除视频时增量更新汇总数据，查询时不需要遍历docs目录
+LIBRARY_STATS_CONFIG = {
+    # 是否启用视频库统计
+    'enabled': os.getenv('LIBRARY_STATS_ENABLED', 'true').lower() == 'true',
+    # 统计数据库路径
+    'path': os.getenv('LIBRARY_STATS_PATH', 'state/library_stats.sqlite3'),
+    # 返回最近多少天的入库数量
+    'days': int(os.getenv('LIBRARY_STATS_DAYS', '30')),
+    # 返回视频数最多的多少个作者
+    'top_authors': int(os.getenv('LIBRARY_STATS_TOP_AUTHORS', '20')),
+}
+
+# 视频库索引配置 - 保存视频时记录视频和文件修改时间，Web服务按变化序号增量读取视频列表
+LIBRARY_INDEX_CONFIG = {
+    # 索引数据库路径
+    'path': os.getenv('LIBRARY_INDEX_PATH', 'state/library_index.sqlite3'),
+}
+
+# 章节配置 - 按词汇连贯性和字幕间隔把长视频切分为章节，写入文章并提供章节目录
+CHAPTER_CONFIG = {
+    # 是否在生成文章时切分章节
+    'enabled': os.getenv('CHAPTER_ENABLED', 'true').lower() == 'true',
+    # 把连续的字幕合并为约多少字的文本块，章节边界只出现在文本块之间
+    'block_chars': int(os.getenv('CHAPTER_BLOCK_CHARS', '200')),
+    # 比较边界两侧各多少个文本块的词汇
+    'window': int(os.getenv('CHAPTER_WINDOW', '3')),
+    # 每个章节最短时长（秒），短于两倍该时长的视频不切分章节
+    'min_seconds': float(os.getenv('CHAPTER_MIN_SECONDS', '120')),
+    # 字幕间隔达到该秒数时，边界得分增加 gap_weight（间隔越长越可能是章节边界）
+    'gap_seconds': float(os.getenv('CHAPTER_GAP_SECONDS', '5')),
+    'gap_weight': float(os.getenv('CHAPTER_GAP_WEIGHT', '0.3')),
+    # 章节标题最多字数
+    'title_chars': int(os.getenv('CHAPTER_TITLE_CHARS', '24')),
+}
+
+# 文本规范化配置 - 获取字幕后、格式化之前统一字幕文本，结果与原始字幕一起保存在字幕存储中
+NORMALIZE_CONFIG = {
+    # 是否启用文本规范化
+    'enabled': os.getenv('NORMALIZE_ENABLED', 'true').lower() == 'true',
+    # 全角字母、数字和空格转为半角
+    'halfwidth': os.getenv('NORMALIZE_HALFWIDTH', 'true').lower() == 'true',
+    # 中文后的半角标点转为全角，连续重复的标点只保留一个，...转为省略号
+    'punctuation': os.getenv('NORMALIZE_PUNCTUATION', 'true').lower() == 'true',
+    # 常用繁体字转为简体字
+    'simplified': os.getenv('NORMALIZE_SIMPLIFIED', 'true').lower() == 'true',
+    # 连续重复的语气词只保留一个，多个用逗号分隔
+    'fillers': [
+        word for word in os.getenv('NORMALIZE_FILLERS', '嗯,呃,啊').split(',') if word
+    ],
+}
+
+# 静态站点导出配置 - 把视频库导出为静态HTML/JSON页面，搜索索引按词分片，浏览器按需加载
+SITE_CONFIG = {
+    # 默认输出目录
+    'output': os.getenv('SITE_OUTPUT', 'site'),
+    # 搜索索引分片数，修改后下次导出时重建全部分片
+    'shards': int(os.getenv('SITE_SEARCH_SHARDS', '64')),
+}
+
+# 弹幕配置 - 没有字幕的视频可以用弹幕生成带时间的评论
+DANMAKU_CONFIG = {
+    # 同时下载的弹幕分段数（每段6分钟），请求仍受跨进程限速约束
+    'workers': int(os.getenv('DANMAKU_WORKERS', '4')),
+    # 不知道视频时长时最多下载的分段数
+    'max_segments': int(os.getenv('DANMAKU_MAX_SEGMENTS', '120')),
+    # 生成字幕时把弹幕按该时长（秒）分组，每组合并为一条
+    'bucket_seconds': float(os.getenv('DANMAKU_BUCKET_SECONDS', '10')),
+    # 每组保留出现次数最多的弹幕条数
+    'top_per_bucket': int(os.getenv('DANMAKU_TOP_PER_BUCKET', '5')),
+}
+
+# 视频库变化推送配置 - 网页通过Server-Sent Events接收视频的新增、更新和删除
+LIBRARY_EVENTS_CONFIG = {
+    # 检查视频库版本的间隔（秒），只读取共享状态中的版本号和docs目录的mtime
+    'poll_interval': float(os.getenv('LIBRARY_EVENTS_POLL_INTERVAL', '1')),
+    # 没有变化时发送心跳的间隔（秒），用于保持连接并及时发现已断开的客户端
+    'heartbeat': float(os.getenv('LIBRARY_EVENTS_HEARTBEAT', '15')),
+    # 每个连接的最长时间（秒），到期后浏览器自动重连，避免长期占用工作线程
+    'max_age': float(os.getenv('LIBRARY_EVENTS_MAX_AGE', '300')),
+    # 每个工作进程同时保持的推送连接数，超过时网页改为在操作后重新加载列表
+    'max_streams': int(os.getenv('LIBRARY_EVENTS_MAX_STREAMS', '4')),
+}
+
+# 预取配置 - 网页中输入链接后立即获取视频信息和字幕列表，并在后台预先下载字幕
+PREFETCH_CONFIG = {
+    # 是否在预览时后台预取字幕内容
+    'enabled': os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true',
+    # 预取的字幕列表和字幕内容的保留时间（秒），字幕地址带有时效，不宜过长
+    'ttl': int(os.getenv('PREFETCH_TTL', '600')),
+    # 每个进程中预取字幕的线程数
+    'workers': int(os.getenv('PREFETCH_WORKERS', '2')),
+    # 点击获取字幕时，等待同一进程中正在进行的预取完成的最长时间（秒）
+    'wait_timeout': float(os.getenv('PREFETCH_WAIT_TIMEOUT', '10')),
+}
+
+# 常驻进程配置 - 命令行检测到常驻进程时把请求转交给它处理，省去每次启动的导入和连接开销
+DAEMON_CONFIG = {
+    # 命令行是否自动转交给正在运行的常驻进程
+    'enabled': os.getenv('DAEMON_ENABLED', 'true').lower() == 'true',
+    # Unix socket路径
+    'socket': os.getenv('DAEMON_SOCKET', 'state/daemon.sock'),
+    # 后台运行时的日志文件
+    'log': os.getenv('DAEMON_LOG', 'state/daemon.log'),
+    # 连接常驻进程的超时时间（秒），超时则在当前进程中处理
+    'connect_timeout': float(os.getenv('DAEMON_CONNECT_TIMEOUT', '0.5')),
+    # 退出时等待正在处理的请求完成的最长时间（秒）
+    'graceful_timeout': float(os.getenv('DAEMON_GRACEFUL_TIMEOUT', '300')),
+}
+
+# 性能指标配置
+METRICS_CONFIG = {
+    # 是否记录性能指标
+    'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+    # 各进程把指标写入共享状态的间隔（秒），/metrics 合并所有进程的数据
+    'publish_interval': float(os.getenv('METRICS_PUBLISH_INTERVAL', '5')),
+    # 进程的指标在共享状态中保留的时间（秒），空闲超过该时间的进程不再计入
+    'snapshot_ttl': int(os.getenv('METRICS_SNAPSHOT_TTL', str(24 * 3600))),
+}
+
+# 性能追踪配置 - 默认关闭，开启后每处理一个视频写出一份追踪结果
+TRACE_CONFIG = {
+    # 是否记录各阶段的追踪区间
+    'enabled': os.getenv('TRACE_ENABLED', 'false').lower() == 'true',
+    # 追踪结果保存目录
+    'dir': os.getenv('TRACE_DIR', 'traces'),
+    # 是否同时使用cProfile进行函数级性能分析（会明显变慢）
+    'profile': os.getenv('TRACE_PROFILE', 'false').lower() == 'true',
+}
+
+# 否定结果缓存配置 - 缓存"视频不存在"、"没有字幕"的结果，避免反复请求
+NEGATIVE_CACHE_CONFIG = {
+    # 已登录但视频没有字幕时的缓存时间（秒），UP主或AI可能稍后补充字幕
+    'no_subtitle_ttl': int(os.getenv('NO_SUBTITLE_CACHE_TTL', str(6 * 3600))),
+    # 视频不存在、已删除或不可见时的缓存时间（秒）
+    'not_found_ttl': int(os.getenv('NOT_FOUND_CACHE_TTL', str(24 * 3600))),
+}
+
+# Cookie账号池配置
+POOL_CONFIG = {
+    # 每个账号每秒允许的请求数，默认与请求间隔一致
+    'rate': float(
+        os.getenv('COOKIE_RATE', str(1 / max(API_CONFIG['request_interval'], 0.001)))
+    ),
+    # 每个账号允许的突发请求数
+    'burst': float(os.getenv('COOKIE_BURST', '3')),
+    # 登录状态检查结果的缓存时间（秒）
+    'login_check_ttl': int(os.getenv('COOKIE_LOGIN_CHECK_TTL', '1800')),
+    # 账号被移出后多久重新尝试（秒）
+    'evict_cooldown': int(os.getenv('COOKIE_EVICT_COOLDOWN', '3600')),
+    # 连续失败多少次后移出账号
+    'max_failures': int(os.getenv('COOKIE_MAX_FAILURES', '5')),
+}
+
+# HTTP缓存与压缩配置
+HTTP_CONFIG = {
+    # 保存文件时是否生成gzip/brotli预压缩副本
+    'precompress': os.getenv('HTTP_PRECOMPRESS', 'true').lower() == 'true',
+    # 压缩级别
+    'gzip_level': int(os.getenv('HTTP_GZIP_LEVEL', '6')),
+    'brotli_quality': int(os.getenv('HTTP_BROTLI_QUALITY', '9')),
+    # 小于该字节数的JSON响应不压缩
+    'min_compress_size': int(os.getenv('HTTP_MIN_COMPRESS_SIZE', '1024')),
+    # 客户端缓存策略，默认每次使用前都需要校验
+    'cache_control': os.getenv('HTTP_CACHE_CONTROL', 'no-cache'),
+    # 列表接口单页最大条数
+    'max_page_size': int(os.getenv('HTTP_MAX_PAGE_SIZE', '500')),
+}
+
+# 内存缓存配置
+CACHE_CONFIG = {
+    # 字幕内容缓存的最大字节数（默认64MB）
+    'transcript_cache_bytes': int(
+        os.getenv('TRANSCRIPT_CACHE_MAX_BYTES', str(64 * 1024 * 1024))
+    ),
+}
+
+# 字幕存储配置
+STORE_CONFIG = {
+    # 是否同时保存到按视频ID索引的压缩存储中
+    'enabled': os.getenv('TRANSCRIPT_STORE_ENABLED', 'true').lower() == 'true',
+    # 存储目录
+    'root': os.getenv('TRANSCRIPT_STORE_DIR', 'store'),
+    # 压缩方式: auto（优先zstd）、zstd 或 gzip
+    'compression': os.getenv('TRANSCRIPT_STORE_COMPRESSION', 'auto'),
+    # 压缩级别
+    'level': int(os.getenv('TRANSCRIPT_STORE_LEVEL', '9')),
+}
+
+# 后台写入配置
+WRITER_CONFIG = {
+    # 是否在后台线程中写入文件，关闭后在调用线程中同步写入（同样保证原子性）
+    'enabled': os.getenv('ASYNC_WRITES', 'true').lower() == 'true',
+    # 每批最多写入的文件数
+    'batch_size': int(os.getenv('WRITER_BATCH_SIZE', '64')),
+    # 凑批的最长等待时间（秒）
+    'flush_interval': float(os.getenv('WRITER_FLUSH_INTERVAL', '0.05')),
+    # Web请求等待本次保存的文件写完的最长时间（秒）
+    'barrier_timeout': float(os.getenv('WRITER_BARRIER_TIMEOUT', '30')),
+}
+
+# 跨进程共享状态配置
+STATE_CONFIG = {
+    # 共享状态数据库路径，多个进程使用同一文件共享缓存等数据
+    'path': os.getenv('SHARED_STATE_PATH', os.path.join('state', 'shared.sqlite3')),
+}
+
+# 生产环境Web服务配置
+SERVER_CONFIG = {
+    'host': os.getenv('WEB_HOST', '0.0.0.0'),
+    'port': int(os.getenv('WEB_PORT', '8080')),
+    # 工作进程数
+    'workers': int(os.getenv('WEB_WORKERS', str(min(4, os.cpu_count() or 1)))),
+    # 每个工作进程的线程数
+    'threads': int(os.getenv('WEB_THREADS', '8')),
+    # 是否在fork工作进程前预加载应用和配置
+    'preload': os.getenv('WEB_PRELOAD', 'true').lower() == 'true',
+    # 退出时等待进行中请求完成的最长时间（秒）
+    'graceful_timeout': float(os.getenv('WEB_GRACEFUL_TIMEOUT', '30')),
 }
 
 # User-Agent配置
@@ -81,4 +400,7 @@ SUPPORTED_FORMATS = ['txt', 'srt', 'json']
 DEFAULT_FORMAT = os.getenv('DEFAULT_FORMAT', 'txt')
 
 # Cookie配置
-BILIBILI_COOKIES = get_bilibili_cookies()
\ No newline at end of file
+BILIBILI_COOKIES = get_bilibili_cookies()
+
+# 账号池中的所有Cookie
+BILIBILI_COOKIE_POOL = get_bilibili_cookie_pool()
@@ -0,0 +1,216 @@
+"""
+Cookie账号池
+多个登录账号轮流使用，每个账号有独立的令牌桶限速、健康状态和登录有效性检查
+请求总是分配给当前负载最低的健康账号，返回-101（未登录）的账号会被自动移出
+"""
+
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from config import BILIBILI_COOKIE_POOL, POOL_CONFIG
+from shared_state import get_shared_state
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数，capacity为最大突发量"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """尝试取出令牌，不足时返回False"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        """返回还需等待多少秒才有足够的令牌"""
+        self._refill()
+        if self.tokens >= tokens:
+            return 0.0
+        return (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class PooledAccount:
+    """账号池中的一个账号"""
+
+    def __init__(self, cookies: Dict[str, str]):
+        self.cookies = cookies
+        # 账号标识只使用Cookie的哈希，避免在日志和接口中暴露Cookie
+        self.account_id = hashlib.sha1(
+            cookies.get("SESSDATA", repr(sorted(cookies.items()))).encode("utf-8")
+        ).hexdigest()[:10]
+        self.bucket = TokenBucket(POOL_CONFIG["rate"], POOL_CONFIG["burst"])
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.login_checked_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "account_id": self.account_id,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+
+class CookiePool:
+    """登录账号池"""
+
+    def __init__(self, cookie_sets: List[Dict[str, str]]):
+        self.accounts = [PooledAccount(cookies) for cookies in cookie_sets]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def _evicted_key(self, account: PooledAccount) -> str:
+        return f"cookie:{account.account_id}:evicted"
+
+    def is_healthy(self, account: PooledAccount) -> bool:
+        """账号是否可用，移出状态保存在共享状态中，所有进程一致"""
+        return get_shared_state().get(self._evicted_key(account)) is None
+
+    def evict(self, account: PooledAccount, reason: str) -> None:
+        """将账号移出账号池，冷却时间过后重新检查登录状态"""
+        account.last_error = reason
+        account.login_checked_at = 0.0
+        get_shared_state().set(
+            self._evicted_key(account), reason, ttl=POOL_CONFIG["evict_cooldown"]
+        )
+
+    def acquire(
+        self, check_login: Optional[Callable[[Dict[str, str]], bool]] = None
+    ) -> PooledAccount:
+        """取出一个负载最低且有剩余额度的健康账号，额度不足时等待
+
+        Args:
+            check_login: 检查Cookie是否仍处于登录状态的函数，结果按配置的时间缓存
+
+        Returns:
+            PooledAccount: 分配到的账号，使用完后需要调用release
+        """
+        while True:
+            with self._lock:
+                healthy = [
+                    account for account in self.accounts if self.is_healthy(account)
+                ]
+                if not healthy:
+                    raise Exception(
+                        "没有可用的登录账号: 所有Cookie均已失效，请更新Cookie配置"
+                    )
+
+                # 优先选择进行中请求最少、剩余令牌最多的账号
+                healthy.sort(
+                    key=lambda account: (account.in_flight, -account.bucket.tokens)
+                )
+                chosen = next(
+                    (account for account in healthy if account.bucket.try_acquire()),
+                    None,
+                )
+                if chosen is not None:
+                    chosen.in_flight += 1
+                    chosen.requests += 1
+                wait = (
+                    min(account.bucket.wait_time() for account in healthy)
+                    if chosen is None
+                    else 0.0
+                )
+
+            if chosen is None:
+                time.sleep(wait)
+                continue
+
+            if check_login is not None and not self._login_valid(chosen, check_login):
+                self.release(chosen)
+                self.evict(chosen, "登录状态已失效")
+                continue
+            return chosen
+
+    def _login_valid(
+        self, account: PooledAccount, check_login: Callable[[Dict[str, str]], bool]
+    ) -> bool:
+        """检查登录状态，结果在共享状态中缓存，避免每次请求都检查"""
+        state = get_shared_state()
+        cache_key = f"cookie:{account.account_id}:login"
+        cached = state.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            valid = check_login(account.cookies)
+        except Exception as e:
+            # 网络错误时不判定为失效，下次再检查
+            account.last_error = str(e)
+            return True
+        state.set(cache_key, valid, ttl=POOL_CONFIG["login_check_ttl"])
+        return valid
+
+    def release(
+        self,
+        account: PooledAccount,
+        code: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """归还账号并记录结果
+
+        Args:
+            account: acquire返回的账号
+            code: B站接口返回码，-101表示未登录，账号会被移出
+            error: 请求失败时的错误信息
+        """
+        with self._lock:
+            account.in_flight = max(0, account.in_flight - 1)
+            if code == -101:
+                account.failures += 1
+                self.evict(account, "账号未登录 (-101)")
+            elif error is not None:
+                account.failures += 1
+                account.consecutive_failures += 1
+                account.last_error = error
+                if account.consecutive_failures >= POOL_CONFIG["max_failures"]:
+                    account.consecutive_failures = 0
+                    self.evict(account, f"连续失败: {error}")
+            elif code is not None:
+                account.consecutive_failures = 0
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """返回每个账号的状态"""
+        with self._lock:
+            return [
+                dict(account.stats(), healthy=self.is_healthy(account))
+                for account in self.accounts
+            ]
+
+
+_default_pool: Optional[CookiePool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_cookie_pool() -> CookiePool:
+    """返回由配置文件中的Cookie组成的默认账号池，同一进程内共享限速额度"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = CookiePool(BILIBILI_COOKIE_POOL)
+    return _default_pool
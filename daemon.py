@@ -0,0 +1,256 @@
+"""
+常驻进程
+在本地Unix socket上监听命令行的请求，常驻期间保持BilibiliSubtitleService、HTTP连接、
+内存缓存和账号池处于就绪状态，命令行不再需要每次重新导入模块、建立连接和读取WBI密钥
+协议为逐行JSON：客户端发送 {"argv": [...], "cwd": "..."}，常驻进程把输出逐条返回
+{"stream": "stdout"|"stderr", "data": "..."}，最后返回 {"exit": 退出码}
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, TextIO
+
+from config import DAEMON_CONFIG
+from daemon_client import request, should_forward
+
+
+class _ThreadLocalStream:
+    """按线程分发输出：处理请求的线程写入对应的客户端，其他线程写入原来的输出"""
+
+    def __init__(self, default: TextIO):
+        self._default = default
+        self._local = threading.local()
+
+    def redirect(self, target: Optional[Any]) -> None:
+        self._local.target = target
+
+    def _target(self) -> Any:
+        return getattr(self._local, "target", None) or self._default
+
+    def write(self, data: str) -> int:
+        return self._target().write(data)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._default, name)
+
+
+class _ClientStream:
+    """把写入的内容作为一条消息发送给客户端；客户端断开后丢弃输出，处理继续进行"""
+
+    def __init__(self, conn: socket.socket, name: str, lock: threading.Lock):
+        self.conn = conn
+        self.name = name
+        self.lock = lock
+
+    def write(self, data: str) -> int:
+        if data:
+            _send(self.conn, {"stream": self.name, "data": data}, self.lock)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def _send(
+    conn: socket.socket, message: Dict[str, Any], lock: Optional[threading.Lock] = None
+) -> None:
+    payload = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    try:
+        if lock is None:
+            conn.sendall(payload)
+        else:
+            with lock:
+                conn.sendall(payload)
+    except OSError:
+        pass
+
+
+class SubtitleDaemon:
+    """在Unix socket上处理命令行请求的常驻进程"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DAEMON_CONFIG["socket"]
+        self.cwd = os.getcwd()
+        self.started_at = time.time()
+        self.requests = 0
+        self.active = 0
+        self._services: List[Any] = []
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        # 正在处理请求的线程，退出前等待它们完成
+        self._threads: Set[threading.Thread] = set()
+        self._stdout: Optional[_ThreadLocalStream] = None
+        self._stderr: Optional[_ThreadLocalStream] = None
+
+    def _acquire_service(self) -> Any:
+        """取出一个空闲的服务实例，每个实例只被一个请求使用，HTTP连接在请求之间复用"""
+        from bilibili_subtitle_service import BilibiliSubtitleService
+
+        with self._lock:
+            if self._services:
+                return self._services.pop()
+        return BilibiliSubtitleService()
+
+    def _release_service(self, service: Any) -> None:
+        with self._lock:
+            self._services.append(service)
+
+    def _bind(self) -> socket.socket:
+        """监听socket，清理上次异常退出时残留的socket文件"""
+        if os.path.exists(self.path):
+            if request({"command": "ping"}, self.path) is not None:
+                raise Exception(f"常驻进程已在运行: {self.path}")
+            os.unlink(self.path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        # 只允许当前用户连接
+        os.chmod(self.path, 0o600)
+        sock.listen(16)
+        # 定期检查是否需要退出
+        sock.settimeout(1.0)
+        return sock
+
+    def serve_forever(self) -> None:
+        """启动并处理请求，直到收到shutdown消息或调用stop()"""
+        if not hasattr(socket, "AF_UNIX"):
+            raise Exception("当前系统不支持Unix socket，无法启动常驻进程")
+        self._sock = self._bind()
+        stdout, stderr = sys.stdout, sys.stderr
+        self._stdout, self._stderr = _ThreadLocalStream(stdout), _ThreadLocalStream(
+            stderr
+        )
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+
+        # 预先创建服务实例并导入处理流程用到的模块
+        import main  # noqa: F401
+
+        self._release_service(self._acquire_service())
+        print(f"🚀 常驻进程已启动 (pid {os.getpid()})，监听 {self.path}")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except socket.timeout:
+                    continue
+                thread = threading.Thread(
+                    target=self._handle_tracked,
+                    args=(conn,),
+                    name="daemon-client",
+                    daemon=True,
+                )
+                with self._lock:
+                    self._threads.add(thread)
+                thread.start()
+        finally:
+            self._sock.close()
+            self._wait_for_requests(DAEMON_CONFIG["graceful_timeout"])
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            sys.stdout, sys.stderr = stdout, stderr
+            print("👋 常驻进程已退出")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def _wait_for_requests(self, timeout: float) -> None:
+        """等待正在处理的请求完成，最多等待timeout秒"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            unfinished = sum(thread.is_alive() for thread in self._threads)
+        if unfinished:
+            print(
+                f"⚠️  {unfinished} 个请求在 {timeout:g} 秒内未完成，不再等待",
+                file=sys.stderr,
+            )
+
+    def _handle_tracked(self, conn: socket.socket) -> None:
+        try:
+            self._handle(conn)
+        finally:
+            with self._lock:
+                self._threads.discard(threading.current_thread())
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "cwd": self.cwd,
+            "socket": self.path,
+            "uptime": round(time.time() - self.started_at, 1),
+            "requests": self.requests,
+            "active": self.active,
+            "services": len(self._services),
+        }
+
+    def _handle(self, conn: socket.socket) -> None:
+        with conn:
+            try:
+                with conn.makefile("r", encoding="utf-8") as reader:
+                    message = json.loads(reader.readline() or "{}")
+            except (OSError, ValueError):
+                return
+
+            command = message.get("command")
+            if command == "ping":
+                _send(conn, self.status())
+                return
+            if command == "shutdown":
+                _send(conn, {"stopping": True, "pid": os.getpid()})
+                self.stop()
+                return
+
+            argv = message.get("argv")
+            if not isinstance(argv, list) or not should_forward(argv):
+                _send(conn, {"fallback": "不支持的请求"})
+                return
+            # 输出文件保存在相对路径下，工作目录不同时由客户端自己处理
+            if message.get("cwd") != self.cwd:
+                _send(conn, {"fallback": f"工作目录不同: {self.cwd}"})
+                return
+
+            _send(conn, {"exit": self._run(conn, argv)})
+
+    def _run(self, conn: socket.socket, argv: List[str]) -> int:
+        """在当前线程中执行命令行处理流程，输出发送给客户端"""
+        import main
+        from background_writer import writer
+
+        lock = threading.Lock()
+        self._stdout.redirect(_ClientStream(conn, "stdout", lock))
+        self._stderr.redirect(_ClientStream(conn, "stderr", lock))
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+        try:
+            try:
+                args = main.build_parser().parse_args(argv)
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else 2
+            service = self._acquire_service()
+            service.refresh = args.refresh
+            try:
+                return main.run_urls(args, service, report_metrics=False)
+            finally:
+                self._release_service(service)
+                # 返回前确保文件已经写入磁盘
+                writer.flush()
+        except Exception as e:
+            print(f"❌ 常驻进程处理失败: {e}", file=sys.stderr)
+            return 1
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._stdout.redirect(None)
+            self._stderr.redirect(None)
@@ -0,0 +1,113 @@
+"""
+常驻进程客户端
+命令行启动时先检查常驻进程是否在运行，是则把参数转交给它处理并原样输出结果，
+否则返回None，由命令行在当前进程中处理
+只依赖标准库和配置文件，不导入requests、flask等耗时的模块
+"""
+
+import json
+import os
+import re
+import socket
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import DAEMON_CONFIG
+
+# 这些参数需要修改进程级的状态，不转交给常驻进程
+# --metrics/--metrics-json 需要本次运行的指标，常驻进程中的指标是所有请求的累计值
+LOCAL_ONLY_OPTIONS = {
+    "-h",
+    "--help",
+    "--trace",
+    "--profile",
+    "--metrics",
+    "--metrics-json",
+}
+
+# 子命令名称的格式，子命令总是在当前进程中执行
+_COMMAND_PATTERN = re.compile(r"^[a-z][a-z-]*$")
+
+
+def _connect(path: Optional[str] = None) -> Optional[socket.socket]:
+    """连接常驻进程，未运行时返回None"""
+    path = path or DAEMON_CONFIG["socket"]
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(DAEMON_CONFIG["connect_timeout"])
+    try:
+        sock.connect(path)
+    except OSError:
+        # 常驻进程已退出但socket文件残留
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def _messages(sock: socket.socket) -> Iterator[Dict[str, Any]]:
+    """逐行读取常驻进程返回的JSON消息"""
+    with sock.makefile("r", encoding="utf-8") as reader:
+        for line in reader:
+            if line.strip():
+                yield json.loads(line)
+
+
+def request(
+    message: Dict[str, Any], path: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """发送一条控制消息（ping、shutdown）并返回回复，常驻进程未运行时返回None"""
+    sock = _connect(path)
+    if sock is None:
+        return None
+    with sock:
+        sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+        return next(_messages(sock), None)
+
+
+def should_forward(argv: List[str]) -> bool:
+    """判断命令行参数能否转交给常驻进程：只转交处理视频链接的调用"""
+    if not DAEMON_CONFIG["enabled"] or not argv:
+        return False
+    if _COMMAND_PATTERN.match(argv[0]):
+        return False
+    return not any(arg.split("=", 1)[0] in LOCAL_ONLY_OPTIONS for arg in argv)
+
+
+def forward_to_daemon(argv: List[str]) -> Optional[int]:
+    """把命令行参数转交给常驻进程处理
+
+    Returns:
+        Optional[int]: 退出码；常驻进程未运行或拒绝处理时返回None，由调用方在当前进程中处理
+    """
+    if not should_forward(argv):
+        return None
+    sock = _connect()
+    if sock is None:
+        return None
+
+    streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+    with sock:
+        try:
+            sock.sendall(
+                (
+                    json.dumps({"argv": argv, "cwd": os.getcwd()}, ensure_ascii=False)
+                    + "\n"
+                ).encode("utf-8")
+            )
+            for message in _messages(sock):
+                if "fallback" in message:
+                    return None
+                if "exit" in message:
+                    return message["exit"]
+                stream = streams.get(message.get("stream"), sys.stdout)
+                stream.write(message.get("data", ""))
+                stream.flush()
+        except KeyboardInterrupt:
+            return 130
+        except (OSError, ValueError) as e:
+            print(f"❌ 与常驻进程的连接中断: {e}", file=sys.stderr)
+            return 1
+    print("❌ 常驻进程未返回结果", file=sys.stderr)
+    return 1
@@ -0,0 +1,200 @@
+"""
+弹幕
+B站弹幕按6分钟一段以protobuf格式提供（DmSegMobileReply），这里逐条解析分段，
+只保留出现时间和内容，保存为紧凑的数组；10万条以上的弹幕也不会为每条弹幕创建字典
+按时间分组后可以统计弹幕密度、找出弹幕高峰，或合并为字幕格式交给现有的格式化和存储流程
+"""
+
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import DANMAKU_CONFIG
+
+# 每个弹幕分段的时长（秒）
+SEGMENT_SECONDS = 360
+
+# 高级弹幕、代码弹幕、BAS弹幕的内容不是普通文本，不保留
+_TEXT_MODES = {0, 1, 2, 3, 4, 5, 6}
+
+# 每条弹幕在字幕中显示的时长（秒）
+_DISPLAY_SECONDS = 4.0
+
+
+def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _skip(data: bytes, pos: int, wire_type: int) -> int:
+    """跳过不需要的字段"""
+    if wire_type == 0:
+        return _varint(data, pos)[1]
+    if wire_type == 1:
+        return pos + 8
+    if wire_type == 2:
+        length, pos = _varint(data, pos)
+        return pos + length
+    if wire_type == 5:
+        return pos + 4
+    raise Exception(f"无法解析弹幕数据: 未知的字段类型 {wire_type}")
+
+
+def _parse_elem(data: bytes, pos: int, end: int) -> Tuple[int, int, str]:
+    """解析一条弹幕（DanmakuElem），只读取 progress(2)、mode(3)、content(7)"""
+    progress = mode = 0
+    content = ""
+    while pos < end:
+        tag, pos = _varint(data, pos)
+        field, wire_type = tag >> 3, tag & 7
+        if wire_type == 0:
+            value, pos = _varint(data, pos)
+            if field == 2:
+                progress = value
+            elif field == 3:
+                mode = value
+        elif wire_type == 2 and field == 7:
+            length, pos = _varint(data, pos)
+            content = data[pos : pos + length].decode("utf-8", "replace")
+            pos += length
+        else:
+            pos = _skip(data, pos, wire_type)
+    return progress, mode, content
+
+
+def iter_segment(data: bytes) -> Iterator[Tuple[int, str]]:
+    """逐条解析一个弹幕分段，返回 (出现时间毫秒, 内容)，跳过非文本弹幕"""
+    pos, end = 0, len(data)
+    try:
+        while pos < end:
+            tag, pos = _varint(data, pos)
+            # 分段中只有 repeated DanmakuElem elems = 1
+            if tag != 0x0A:
+                pos = _skip(data, pos, tag & 7)
+                continue
+            length, pos = _varint(data, pos)
+            progress, mode, content = _parse_elem(data, pos, pos + length)
+            pos += length
+            content = content.strip()
+            if content and mode in _TEXT_MODES:
+                yield progress, content
+    except IndexError:
+        raise Exception("无法解析弹幕数据: 分段不完整")
+
+
+class DanmakuTrack:
+    """按时间排序的弹幕，出现时间（毫秒）保存在数组中，内容保存在列表中"""
+
+    def __init__(self) -> None:
+        self.times = array("I")
+        self.texts: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def add_segment(self, items: Iterable[Tuple[int, str]]) -> int:
+        """添加一个分段的弹幕，返回条数
+
+        分段按时间先后添加，分段内的弹幕按出现时间排序后追加，整体保持有序
+        """
+        segment = sorted(items, key=lambda item: item[0])
+        for progress, content in segment:
+            self.times.append(progress)
+            self.texts.append(content)
+        return len(segment)
+
+    def iter_cues(self) -> Iterator[Dict[str, Any]]:
+        """逐条返回字幕条目格式的弹幕，不一次性创建全部字典"""
+        for progress, content in zip(self.times, self.texts):
+            start = progress / 1000
+            yield {"from": start, "to": start + _DISPLAY_SECONDS, "content": content}
+
+    def _bucket_ranges(self, bucket_seconds: float) -> Iterator[Tuple[int, int, int]]:
+        """按时间分组，返回 (组序号, 开始下标, 结束下标)，只返回有弹幕的组"""
+        bucket_ms = bucket_seconds * 1000
+        start = 0
+        while start < len(self.times):
+            bucket = int(self.times[start] // bucket_ms)
+            limit = (bucket + 1) * bucket_ms
+            end = start
+            while end < len(self.times) and self.times[end] < limit:
+                end += 1
+            yield bucket, start, end
+            start = end
+
+    def density(self, bucket_seconds: Optional[float] = None) -> List[int]:
+        """每个时间段内的弹幕数，第i项对应 [i*bucket_seconds, (i+1)*bucket_seconds)"""
+        bucket_seconds = bucket_seconds or DANMAKU_CONFIG["bucket_seconds"]
+        counts: List[int] = []
+        for bucket, start, end in self._bucket_ranges(bucket_seconds):
+            counts.extend([0] * (bucket + 1 - len(counts)))
+            counts[bucket] = end - start
+        return counts
+
+    def _top_comments(self, start: int, end: int, limit: int) -> List[Tuple[str, int]]:
+        return Counter(self.texts[start:end]).most_common(limit)
+
+    def peaks(
+        self, bucket_seconds: Optional[float] = None, limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """弹幕最密集的时间段，相邻的时间段只取其中弹幕最多的一个
+
+        Returns:
+            List[Dict]: 按弹幕数降序，包含 from、to、count 和出现最多的弹幕 comments
+        """
+        bucket_seconds = bucket_seconds or DANMAKU_CONFIG["bucket_seconds"]
+        ranges = {
+            bucket: (start, end)
+            for bucket, start, end in self._bucket_ranges(bucket_seconds)
+        }
+        chosen: List[int] = []
+        for bucket in sorted(ranges, key=lambda b: (-(ranges[b][1] - ranges[b][0]), b)):
+            if len(chosen) >= limit:
+                break
+            if any(abs(bucket - other) <= 1 for other in chosen):
+                continue
+            chosen.append(bucket)
+        return [
+            {
+                "from": bucket * bucket_seconds,
+                "to": (bucket + 1) * bucket_seconds,
+                "count": ranges[bucket][1] - ranges[bucket][0],
+                "comments": [
+                    text for text, _ in self._top_comments(*ranges[bucket], 3)
+                ],
+            }
+            for bucket in chosen
+        ]
+
+    def to_subtitle_data(
+        self,
+        bucket_seconds: Optional[float] = None,
+        top_per_bucket: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """合并为字幕JSON格式（body为字幕条目），可直接交给 format_subtitle 等方法和字幕存储
+
+        每个时间段合并为一条，内容为出现次数最多的若干条弹幕，条目数与视频时长成正比而不是与弹幕数成正比
+        """
+        bucket_seconds = bucket_seconds or DANMAKU_CONFIG["bucket_seconds"]
+        top_per_bucket = top_per_bucket or DANMAKU_CONFIG["top_per_bucket"]
+        body = []
+        for bucket, start, end in self._bucket_ranges(bucket_seconds):
+            comments = [
+                f"{text} ×{count}" if count > 1 else text
+                for text, count in self._top_comments(start, end, top_per_bucket)
+            ]
+            body.append(
+                {
+                    "from": bucket * bucket_seconds,
+                    "to": (bucket + 1) * bucket_seconds,
+                    "content": " / ".join(comments),
+                    "count": end - start,
+                }
+            )
+        return {"type": "danmaku", "danmaku_count": len(self), "body": body}
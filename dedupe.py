@@ -0,0 +1,317 @@
+"""
+近似重复字幕检测
+保存字幕时根据字幕文本计算MinHash签名，并按LSH分段写入索引
+新视频只需与落在相同分段桶中的候选视频比较，不需要和整个视频库逐一比较
+用于发现重新上传、剪辑、搬运等字幕几乎相同的视频
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from config import DEDUPE_CONFIG
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    doc TEXT PRIMARY KEY,
+    signature BLOB NOT NULL,
+    shingles INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket TEXT NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, doc)
+);
+CREATE INDEX IF NOT EXISTS bands_doc ON bands (doc);
+CREATE TABLE IF NOT EXISTS duplicates (
+    doc TEXT NOT NULL,
+    other TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    PRIMARY KEY (doc, other)
+);
+"""
+
+# 64位哈希的最大值，空桶使用该值
+MAX_HASH = (1 << 64) - 1
+
+# 计算签名前去掉的字符：空白和常见中英文标点
+_IGNORED_CHARS = re.compile(r'[\s　-〿＀-／：-＠.,!?;:\'"()\[\]{}\-…—~·]+')
+
+
+def shingles(text: str, size: Optional[int] = None) -> Set[int]:
+    """把文本切分为字符n-gram并哈希为64位整数
+
+    中文字幕没有天然的词边界，使用字符n-gram比按词切分更稳定
+    """
+    size = size or DEDUPE_CONFIG["shingle_size"]
+    normalized = _IGNORED_CHARS.sub("", text.lower())
+    if len(normalized) < size:
+        grams = {normalized} if normalized else set()
+    else:
+        grams = {normalized[i : i + size] for i in range(len(normalized) - size + 1)}
+    return {
+        int.from_bytes(
+            hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for gram in grams
+    }
+
+
+def minhash(hashes: Iterable[int], num_perm: Optional[int] = None) -> List[int]:
+    """计算MinHash签名
+
+    使用单次哈希分桶（one permutation hashing）：每个n-gram只哈希一次，按哈希值分到num_perm个桶中，
+    每个桶保留最小值。空桶从右侧最近的非空桶借值（循环），保证签名可以直接比较。
+    计算量与n-gram数量成正比，与签名长度无关
+    """
+    num_perm = num_perm or DEDUPE_CONFIG["num_perm"]
+    bins = [MAX_HASH] * num_perm
+    for value in hashes:
+        index = value % num_perm
+        rest = value // num_perm
+        if rest < bins[index]:
+            bins[index] = rest
+    if all(value == MAX_HASH for value in bins):
+        return bins
+    # 空桶填充
+    for i in range(num_perm):
+        if bins[i] == MAX_HASH:
+            offset = 1
+            while bins[(i + offset) % num_perm] == MAX_HASH:
+                offset += 1
+            # 加上偏移量，避免不同空桶借到同一个值后产生虚假的相同
+            bins[i] = bins[(i + offset) % num_perm] + offset * (MAX_HASH // num_perm)
+    return bins
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """根据两个签名估算Jaccard相似度"""
+    if not first or len(first) != len(second):
+        return 0.0
+    return sum(1 for a, b in zip(first, second) if a == b) / len(first)
+
+
+def cue_text(srt_content: str) -> str:
+    """从SRT内容中提取字幕文本"""
+    from transcript_cache import parse_srt
+
+    return " ".join(cue["content"] for cue in parse_srt(srt_content))
+
+
+def _pack(signature: List[int]) -> bytes:
+    return struct.pack(
+        f">{len(signature)}Q", *(value & MAX_HASH for value in signature)
+    )
+
+
+def _unpack(data: bytes) -> List[int]:
+    return list(struct.unpack(f">{len(data) // 8}Q", data))
+
+
+class DedupeIndex:
+    """保存MinHash签名和LSH分段桶的索引"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DEDUPE_CONFIG["path"]
+        self.num_perm = DEDUPE_CONFIG["num_perm"]
+        self.bands = DEDUPE_CONFIG["bands"]
+        if self.num_perm % self.bands:
+            raise Exception("签名长度必须能被LSH分段数整除")
+        self.rows = self.num_perm // self.bands
+        self.threshold = DEDUPE_CONFIG["threshold"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _band_buckets(self, signature: List[int]) -> List[str]:
+        """把签名分成若干段，每段的哈希作为该段的桶"""
+        return [
+            hashlib.blake2b(
+                _pack(signature[band * self.rows : (band + 1) * self.rows]),
+                digest_size=8,
+            ).hexdigest()
+            for band in range(self.bands)
+        ]
+
+    def add(self, doc: str, text: str) -> List[Dict[str, Any]]:
+        """添加或更新一个视频的签名，返回与之近似重复的视频
+
+        Args:
+            doc: 视频标识（docs目录下的文件夹名）
+            text: 字幕文本
+
+        Returns:
+            List[Dict]: 近似重复的视频，包含 doc 和 similarity，按相似度降序
+        """
+        hashes = shingles(text)
+        if not hashes:
+            self.remove(doc)
+            return []
+        signature = minhash(hashes, self.num_perm)
+        buckets = self._band_buckets(signature)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, doc)
+            # 只与落在相同桶中的视频比较
+            candidates: Set[str] = set()
+            for band, bucket in enumerate(buckets):
+                candidates.update(
+                    row[0]
+                    for row in conn.execute(
+                        "SELECT doc FROM bands WHERE band = ? AND bucket = ?",
+                        (band, bucket),
+                    )
+                )
+
+            matches = []
+            for other in candidates:
+                row = conn.execute(
+                    "SELECT signature FROM signatures WHERE doc = ?", (other,)
+                ).fetchone()
+                if row is None:
+                    continue
+                similarity = estimate_similarity(signature, _unpack(row[0]))
+                if similarity >= self.threshold:
+                    matches.append({"doc": other, "similarity": round(similarity, 4)})
+
+            conn.execute(
+                "INSERT INTO signatures (doc, signature, shingles, updated_at) VALUES "
+                "(?, ?, ?, ?)",
+                (doc, _pack(signature), len(hashes), time.time()),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO bands (band, bucket, doc) VALUES (?, ?, ?)",
+                [(band, bucket, doc) for band, bucket in enumerate(buckets)],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO duplicates (doc, other, similarity) VALUES "
+                "(?, ?, ?)",
+                [(doc, match["doc"], match["similarity"]) for match in matches]
+                + [(match["doc"], doc, match["similarity"]) for match in matches],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return sorted(matches, key=lambda match: -match["similarity"])
+
+    def _remove(self, conn: sqlite3.Connection, doc: str) -> None:
+        conn.execute("DELETE FROM signatures WHERE doc = ?", (doc,))
+        conn.execute("DELETE FROM bands WHERE doc = ?", (doc,))
+        conn.execute("DELETE FROM duplicates WHERE doc = ? OR other = ?", (doc, doc))
+
+    def remove(self, doc: str) -> None:
+        """删除视频的签名，视频被删除时调用"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._remove(conn, doc)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def duplicates_of(self, doc: str) -> List[Dict[str, Any]]:
+        """返回与指定视频近似重复的视频"""
+        return [
+            {"doc": other, "similarity": similarity}
+            for other, similarity in self._connect().execute(
+                "SELECT other, similarity FROM duplicates WHERE doc = ? ORDER BY "
+                "similarity DESC",
+                (doc,),
+            )
+        ]
+
+    def duplicates_map(self) -> Dict[str, List[Dict[str, Any]]]:
+        """返回所有存在近似重复的视频"""
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        for doc, other, similarity in self._connect().execute(
+            "SELECT doc, other, similarity FROM duplicates ORDER BY doc, similarity "
+            "DESC"
+        ):
+            result.setdefault(doc, []).append({"doc": other, "similarity": similarity})
+        return result
+
+    def groups(self) -> List[List[str]]:
+        """把近似重复关系合并为分组（连通分量），每组至少两个视频"""
+        parent: Dict[str, str] = {}
+
+        def find(doc: str) -> str:
+            parent.setdefault(doc, doc)
+            while parent[doc] != doc:
+                parent[doc] = parent[parent[doc]]
+                doc = parent[doc]
+            return doc
+
+        for doc, others in self.duplicates_map().items():
+            for other in others:
+                parent[find(doc)] = find(other["doc"])
+
+        grouped: Dict[str, List[str]] = {}
+        for doc in parent:
+            grouped.setdefault(find(doc), []).append(doc)
+        return sorted(
+            (sorted(group) for group in grouped.values() if len(group) > 1),
+            key=lambda g: g[0],
+        )
+
+    def docs(self) -> List[str]:
+        return [
+            row[0]
+            for row in self._connect().execute(
+                "SELECT doc FROM signatures ORDER BY doc"
+            )
+        ]
+
+
+_dedupe_index: Optional[DedupeIndex] = None
+_dedupe_index_lock = threading.Lock()
+
+
+def get_dedupe_index() -> Optional[DedupeIndex]:
+    """返回默认的近似重复索引，未启用时返回None"""
+    global _dedupe_index
+    if not DEDUPE_CONFIG["enabled"]:
+        return None
+    with _dedupe_index_lock:
+        if _dedupe_index is None:
+            _dedupe_index = DedupeIndex()
+    return _dedupe_index
+
+
+def index_srt_file(file_path: str, content: str) -> None:
+    """字幕文件写入后更新近似重复索引，用作后台写入的回调
+
+    只处理 docs/<视频标题>/srt.srt，文章文件与字幕内容相同，不重复计算
+    """
+    if os.path.basename(file_path) != "srt.srt":
+        return
+    index = get_dedupe_index()
+    if index is None:
+        return
+    doc = os.path.basename(os.path.dirname(file_path))
+    matches = index.add(doc, cue_text(content))
+    if matches:
+        names = "、".join(
+            f"{match['doc']} ({match['similarity']:.0%})" for match in matches[:3]
+        )
+        print(f"⚠️  发现近似重复的视频: {doc} ≈ {names}")
@@ -58,11 +58,11 @@ def main():
     parser.add_argument('--lang', dest='language', help='指定字幕语言代码(例如: zh-CN)')
     parser.add_argument('--with-timestamp', action='store_true', help='在文章格式中包含时间戳')
     args = parser.parse_args()
-    
+
     try:
         from bilibili_subtitle_service import BilibiliSubtitleService
         service = BilibiliSubtitleService()
-        
+
         # 获取视频信息
         print(f"🔍 正在获取视频信息: {args.url}")
         video_info = service.get_video_info(args.url)
@@ -70,24 +70,24 @@ def main():
         print(f"👤 视频作者: {video_info['author']}")
         print(f"🆔 视频ID: {video_info['aid']}")
         print()
-        
+
         # 获取字幕列表
         print("📋 正在获取字幕列表...")
         subtitle_list = service.get_subtitle_list(video_info['aid'], video_info['cid'])
-        
+
         if not subtitle_list:
             print("❌ 该视频没有可用的字幕")
             return
-        
+
         print("✅ 可用的字幕语言:")
         for i, subtitle in enumerate(subtitle_list, 1):
             print(f"  {i}. {subtitle['lan']}: {subtitle['lan_doc']}")
         print()
-        
+
         # 如果只是列出语言
         if args.list_languages:
             return
-        
+
         # 选择字幕语言
         selected_subtitle = None
         if args.language:
@@ -103,37 +103,39 @@ def main():
                 return
         else:
             selected_subtitle = subtitle_list[0]
-        
+
         print(f"📥 正在获取字幕内容: {selected_subtitle['lan_doc']}")
-        
+
         # 获取字幕内容
-        subtitle_content = service.get_subtitle_content(selected_subtitle['subtitle_url'])
-        
+        subtitle_content = service.normalize_subtitle(
+            service.get_subtitle_content(selected_subtitle['subtitle_url'])
+        )
+
         print("🔄 正在处理字幕格式...")
-        
+
         # 始终获取并保存SRT格式和文章格式
         srt_content = service.format_subtitle(subtitle_content, "srt")
         article_content = service.format_as_article(subtitle_content, args.with_timestamp)
-        
+
         print("💾 正在保存文件...")
-        
+
         # 保存文件
         srt_path = save_content(video_info['title'], 'srt', srt_content)
         article_path = save_content(video_info['title'], 'article', article_content)
-        
+
         print("\n✅ 文件已成功保存:")
         print(f"📝 SRT字幕文件: {srt_path}")
         print(f"📖 文章格式文件: {article_path}")
-        
+
         # 显示统计信息
         srt_lines = len(srt_content.split('\n\n'))
         article_chars = len(article_content)
         print(f"\n📊 处理统计:")
         print(f"   字幕条数: {srt_lines}")
         print(f"   文章字数: {article_chars}")
-        
+
         print("\n🎉 处理完成！")
-        
+
     except Exception as e:
         print(f"❌ 错误: {e}", file=sys.stderr)
         if "获取字幕列表失败" in str(e) and not BILIBILI_COOKIES:
@@ -144,4 +146,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
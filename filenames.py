@@ -0,0 +1,16 @@
+"""
+文件名处理
+保存、导出和统计视频时用同样的规则把视频标题转换为 docs/ 下的目录名
+"""
+
+import re
+
+
+def sanitize_filename(filename: str) -> str:
+    """清理文件名，移除不合法字符"""
+    # 替换Windows和Unix系统都不支持的文件名字符
+    filename = re.sub(r'[<>:"/\\|?*]', "_", filename)
+    # 移除前后的空格和点
+    filename = filename.strip(". ")
+    # 如果文件名为空，返回默认名称
+    return filename or "untitled"
@@ -0,0 +1,201 @@
+"""
+HTTP缓存与压缩工具
+为Web接口提供ETag/Last-Modified校验、304响应以及gzip/brotli压缩
+文本文件在保存时预先生成压缩副本（sidecar），请求时直接发送，避免重复压缩
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from flask import Response, request, send_file
+
+from config import HTTP_CONFIG
+
+try:
+    import brotli  # 可选依赖，未安装时只提供gzip
+except ImportError:
+    brotli = None
+
+
+# 预压缩副本的扩展名，按优先级排列
+SIDECAR_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    """按指定编码压缩数据"""
+    if encoding == "br":
+        return brotli.compress(data, quality=HTTP_CONFIG["brotli_quality"])
+    # mtime=0 保证相同内容压缩结果一致
+    return gzip.compress(data, compresslevel=HTTP_CONFIG["gzip_level"], mtime=0)
+
+
+def available_encodings() -> List[str]:
+    """返回当前环境支持的压缩编码"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def is_sidecar(filename: str) -> bool:
+    """判断文件是否为预压缩副本"""
+    return filename.endswith(tuple(SIDECAR_SUFFIXES.values()))
+
+
+def write_precompressed_sidecars(file_path: str, content: str) -> None:
+    """为已保存的文本文件生成预压缩副本
+
+    副本的mtime与原文件保持一致，用于判断副本是否过期。
+
+    Args:
+        file_path: 原文件路径
+        content: 原文件内容
+    """
+    if not HTTP_CONFIG["precompress"]:
+        return
+
+    data = content.encode("utf-8")
+    stat = os.stat(file_path)
+    for encoding in available_encodings():
+        sidecar_path = file_path + SIDECAR_SUFFIXES[encoding]
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_compress(data, encoding))
+            os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_path, sidecar_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def _accepted_encodings() -> List[str]:
+    """解析Accept-Encoding，按服务端优先级返回客户端可接受的编码"""
+    header = request.headers.get("Accept-Encoding", "")
+    accepted = {}
+    for part in header.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    return [
+        encoding
+        for encoding in available_encodings()
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0
+    ]
+
+
+def _fresh_sidecar(file_path: str, encoding: str, mtime_ns: int) -> Optional[str]:
+    """返回与原文件同步的预压缩副本路径，不存在或已过期时返回None"""
+    sidecar_path = file_path + SIDECAR_SUFFIXES[encoding]
+    try:
+        if os.stat(sidecar_path).st_mtime_ns == mtime_ns:
+            return sidecar_path
+    except OSError:
+        pass
+    return None
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """根据文件大小和修改时间生成ETag（不含引号）"""
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def not_modified(etag: str, last_modified: Optional[float] = None) -> bool:
+    """检查条件请求头，判断客户端缓存是否仍然有效
+
+    If-None-Match存在时优先于If-Modified-Since。
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def _set_cache_headers(response: Response) -> Response:
+    response.headers["Cache-Control"] = HTTP_CONFIG["cache_control"]
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def send_text_file(file_path: str, mimetype: str = "text/plain") -> Response:
+    """发送文本文件，优先使用预压缩副本
+
+    支持ETag/Last-Modified条件请求和Range请求。
+    """
+    stat = os.stat(file_path)
+    base_etag = file_etag(stat)
+
+    chosen_path, chosen_encoding = file_path, None
+    for encoding in _accepted_encodings():
+        sidecar_path = _fresh_sidecar(file_path, encoding, stat.st_mtime_ns)
+        if sidecar_path:
+            chosen_path, chosen_encoding = sidecar_path, encoding
+            break
+
+    # 不同编码的表示需要不同的强ETag
+    etag = f"{base_etag}-{chosen_encoding}" if chosen_encoding else base_etag
+    # 相对路径会被Flask按应用根目录解析，这里统一转换为绝对路径
+    response = send_file(
+        os.path.abspath(chosen_path),
+        mimetype=f"{mimetype}; charset=utf-8",
+        conditional=True,
+        etag=etag,
+        last_modified=stat.st_mtime,
+        max_age=None,
+    )
+    if chosen_encoding:
+        response.headers["Content-Encoding"] = chosen_encoding
+    return _set_cache_headers(response)
+
+
+def json_response(
+    payload: Dict[str, Any],
+    etag: Optional[str] = None,
+    last_modified: Optional[float] = None,
+) -> Response:
+    """生成带缓存校验和压缩的JSON响应
+
+    Args:
+        payload: 响应数据
+        etag: 指定ETag，不指定时使用响应体的哈希
+        last_modified: 最后修改时间戳
+
+    Returns:
+        Response: 304响应或JSON响应
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if etag is None:
+        etag = hashlib.sha1(body).hexdigest()
+
+    encoding = None
+    if len(body) >= HTTP_CONFIG["min_compress_size"]:
+        encodings = _accepted_encodings()
+        if encodings:
+            encoding = encodings[0]
+            etag = f"{etag}-{encoding}"
+
+    if not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype="application/json")
+        if encoding:
+            response.set_data(_compress(body, encoding))
+            response.headers["Content-Encoding"] = encoding
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return _set_cache_headers(response)
@@ -0,0 +1,398 @@
+"""
+关键词索引
+从字幕文本中提取词语（安装了jieba时使用jieba切词，否则使用中文二元组和英文单词），
+词频和文档频率保存在SQLite中，保存或删除视频时增量更新，不需要重新扫描整个视频库
+每个视频预先计算TF-IDF最高的若干关键词，同时作为稀疏向量用于查找相关视频
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import KEYWORDS_CONFIG
+from dedupe import cue_text
+
+try:
+    import jieba  # 可选依赖，未安装时使用二元组
+except ImportError:
+    jieba = None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS doc_terms (
+    doc TEXT PRIMARY KEY,
+    terms TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    computed_docs INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS df (
+    term TEXT PRIMARY KEY,
+    df INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keywords (
+    doc TEXT NOT NULL,
+    term TEXT NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (doc, term)
+);
+CREATE INDEX IF NOT EXISTS keywords_term ON keywords (term);
+CREATE INDEX IF NOT EXISTS doc_terms_computed ON doc_terms (computed_docs);
+"""
+
+_CJK_RUN = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[a-z][a-z0-9+#]+")
+
+# 包含这些字的二元组大多是虚词组合，不作为关键词
+_STOP_CHARS = set(
+    "的了着过吗呢吧啊呀嘛哦嗯哈是在和与及就都也还又很把被让给对从向我你他她它们这那哪么什个一不有没要会能说到去来上下里"
+)
+
+_STOP_WORDS = {
+    "the",
+    "and",
+    "you",
+    "that",
+    "this",
+    "with",
+    "for",
+    "are",
+    "was",
+    "is",
+    "it",
+    "of",
+    "to",
+    "in",
+    "on",
+    "be",
+    "we",
+    "they",
+    "so",
+    "but",
+    "not",
+    "have",
+    "has",
+    "do",
+    "can",
+    "will",
+    "just",
+    "我们",
+    "你们",
+    "他们",
+    "这个",
+    "那个",
+    "就是",
+    "什么",
+    "一个",
+    "没有",
+    "可以",
+    "因为",
+    "所以",
+    "但是",
+    "然后",
+    "如果",
+    "还是",
+    "已经",
+    "自己",
+    "这样",
+    "那么",
+    "这些",
+    "现在",
+    "时候",
+    "知道",
+    "其实",
+    "不是",
+    "大家",
+    "一下",
+    "觉得",
+    "应该",
+    "一些",
+    "的话",
+    "而且",
+    "或者",
+    "怎么",
+    "这里",
+}
+
+
+def _use_jieba(segmenter: Optional[str] = None) -> bool:
+    segmenter = segmenter or KEYWORDS_CONFIG["segmenter"]
+    if segmenter == "jieba" and jieba is None:
+        raise Exception("KEYWORDS_SEGMENTER=jieba 需要安装jieba")
+    return jieba is not None and segmenter in ("auto", "jieba")
+
+
+def extract_terms(text: str, segmenter: Optional[str] = None) -> Counter:
+    """提取文本中的词语及出现次数
+
+    Args:
+        text: 文本
+        segmenter: 切词方式，不指定时使用配置；浏览器中无法使用jieba，静态站点的搜索索引固定使用ngram
+    """
+    terms: Counter = Counter()
+    lowered = text.lower()
+    terms.update(word for word in _WORD.findall(lowered) if word not in _STOP_WORDS)
+
+    use_jieba = _use_jieba(segmenter)
+    for run in _CJK_RUN.findall(lowered):
+        if use_jieba:
+            terms.update(
+                word
+                for word in jieba.cut(run)
+                if len(word) >= 2
+                and word not in _STOP_WORDS
+                and not set(word) <= _STOP_CHARS
+            )
+        else:
+            terms.update(
+                gram
+                for gram in (run[i : i + 2] for i in range(len(run) - 1))
+                if gram not in _STOP_WORDS
+                and not (gram[0] in _STOP_CHARS or gram[1] in _STOP_CHARS)
+            )
+    return terms
+
+
+def _tfidf(
+    terms: Dict[str, int], df: Dict[str, int], total_docs: int, top_k: int
+) -> List[Tuple[str, float]]:
+    """计算TF-IDF最高的top_k个词，权重经过L2归一化，可直接用点积计算余弦相似度"""
+    scored = []
+    for term, tf in terms.items():
+        idf = math.log((1 + total_docs) / (1 + df.get(term, 0))) + 1
+        scored.append((term, (1 + math.log(tf)) * idf))
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    top = scored[:top_k]
+    norm = math.sqrt(sum(weight * weight for _, weight in top)) or 1.0
+    return [(term, weight / norm) for term, weight in top]
+
+
+class KeywordIndex:
+    """增量维护的词频、文档频率和每个视频的关键词"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or KEYWORDS_CONFIG["path"]
+        self.top_k = KEYWORDS_CONFIG["top_k"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func: Any) -> Any:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _remove(self, conn: sqlite3.Connection, doc: str) -> None:
+        """删除视频并减少其词语的文档频率"""
+        row = conn.execute(
+            "SELECT terms FROM doc_terms WHERE doc = ?", (doc,)
+        ).fetchone()
+        if row is None:
+            return
+        params = [(term,) for term in json.loads(row[0])]
+        conn.executemany("UPDATE df SET df = df - 1 WHERE term = ?", params)
+        # 只检查刚减少的词，按主键查找，不扫描整个df表
+        conn.executemany("DELETE FROM df WHERE term = ? AND df <= 0", params)
+        conn.execute("DELETE FROM doc_terms WHERE doc = ?", (doc,))
+        conn.execute("DELETE FROM keywords WHERE doc = ?", (doc,))
+
+    def _compute(
+        self, conn: sqlite3.Connection, doc: str, terms: Dict[str, int], total_docs: int
+    ) -> None:
+        """按当前的文档频率重新计算一个视频的关键词"""
+        df: Dict[str, int] = {}
+        term_list = list(terms)
+        # SQLite单条语句的参数数量有限，分批查询
+        for start in range(0, len(term_list), 500):
+            batch = term_list[start : start + 500]
+            df.update(
+                conn.execute(
+                    "SELECT term, df FROM df WHERE term IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+            )
+        conn.execute("DELETE FROM keywords WHERE doc = ?", (doc,))
+        conn.executemany(
+            "INSERT INTO keywords (doc, term, weight) VALUES (?, ?, ?)",
+            [
+                (doc, term, weight)
+                for term, weight in _tfidf(terms, df, total_docs, self.top_k)
+            ],
+        )
+        conn.execute(
+            "UPDATE doc_terms SET computed_docs = ? WHERE doc = ?", (total_docs, doc)
+        )
+
+    def _refresh_stale(self, conn: sqlite3.Connection, total_docs: int) -> int:
+        """视频数增长较多后，之前计算的关键词的IDF已经过时，每次保存时顺带重新计算一小批"""
+        threshold = total_docs / (1 + KEYWORDS_CONFIG["stale_ratio"])
+        rows = conn.execute(
+            "SELECT doc, terms FROM doc_terms WHERE computed_docs < ? ORDER BY "
+            "computed_docs LIMIT ?",
+            (threshold, KEYWORDS_CONFIG["refresh_batch"]),
+        ).fetchall()
+        for doc, terms in rows:
+            self._compute(conn, doc, json.loads(terms), total_docs)
+        return len(rows)
+
+    def add(self, doc: str, text: str) -> List[Tuple[str, float]]:
+        """添加或更新一个视频，返回其关键词
+
+        Args:
+            doc: 视频标识（docs目录下的文件夹名）
+            text: 字幕文本
+        """
+        terms = extract_terms(text)
+
+        def update(conn: sqlite3.Connection) -> None:
+            self._remove(conn, doc)
+            if not terms:
+                return
+            conn.execute(
+                "INSERT INTO doc_terms (doc, terms, length, updated_at) VALUES (?, ?, "
+                "?, ?)",
+                (
+                    doc,
+                    json.dumps(dict(terms), ensure_ascii=False),
+                    sum(terms.values()),
+                    time.time(),
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO df (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE "
+                "SET df = df + 1",
+                [(term,) for term in terms],
+            )
+            total_docs = conn.execute("SELECT COUNT(*) FROM doc_terms").fetchone()[0]
+            self._compute(conn, doc, terms, total_docs)
+            self._refresh_stale(conn, total_docs)
+
+        self._transaction(update)
+        return self.keywords_of(doc)
+
+    def remove(self, doc: str) -> None:
+        """删除视频，视频被删除时调用"""
+        self._transaction(lambda conn: self._remove(conn, doc))
+
+    def refresh_all(self) -> int:
+        """按当前的文档频率重新计算所有视频的关键词，返回视频数"""
+
+        def refresh(conn: sqlite3.Connection) -> int:
+            total_docs = conn.execute("SELECT COUNT(*) FROM doc_terms").fetchone()[0]
+            rows = conn.execute("SELECT doc, terms FROM doc_terms").fetchall()
+            for doc, terms in rows:
+                self._compute(conn, doc, json.loads(terms), total_docs)
+            return len(rows)
+
+        return self._transaction(refresh)
+
+    def keywords_of(
+        self, doc: str, limit: Optional[int] = None
+    ) -> List[Tuple[str, float]]:
+        """视频的关键词及权重，按权重降序"""
+        rows = self._connect().execute(
+            "SELECT term, weight FROM keywords WHERE doc = ? ORDER BY weight DESC, "
+            "term LIMIT ?",
+            (doc, limit or self.top_k),
+        )
+        return [(term, weight) for term, weight in rows]
+
+    def keywords_map(self, limit: int = 5) -> Dict[str, List[str]]:
+        """所有视频权重最高的limit个关键词"""
+        result: Dict[str, List[str]] = {}
+        for doc, term, _ in self._connect().execute(
+            "SELECT doc, term, weight FROM keywords ORDER BY doc, weight DESC, term"
+        ):
+            terms = result.setdefault(doc, [])
+            if len(terms) < limit:
+                terms.append(term)
+        return result
+
+    def related(self, doc: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """与视频关键词向量余弦相似度最高的其他视频
+
+        只比较至少有一个相同关键词的视频，通过关键词的索引直接找到
+
+        Returns:
+            List[Dict]: 包含 doc、score 和相同的关键词 shared，按相似度降序
+        """
+        vector = dict(self.keywords_of(doc))
+        if not vector:
+            return []
+        terms = list(vector)
+        scores: Dict[str, float] = {}
+        shared: Dict[str, List[Tuple[float, str]]] = {}
+        for other, term, weight in self._connect().execute(
+            "SELECT doc, term, weight FROM keywords WHERE term IN "
+            f"({','.join('?' * len(terms))}) AND doc != ?",
+            terms + [doc],
+        ):
+            contribution = vector[term] * weight
+            scores[other] = scores.get(other, 0.0) + contribution
+            shared.setdefault(other, []).append((contribution, term))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [
+            {
+                "doc": other,
+                "score": round(score, 4),
+                "shared": [term for _, term in sorted(shared[other], reverse=True)[:5]],
+            }
+            for other, score in ranked
+        ]
+
+    def docs(self) -> List[str]:
+        return [
+            row[0]
+            for row in self._connect().execute("SELECT doc FROM doc_terms ORDER BY doc")
+        ]
+
+
+_keyword_index: Optional[KeywordIndex] = None
+_keyword_index_lock = threading.Lock()
+
+
+def get_keyword_index() -> Optional[KeywordIndex]:
+    """返回默认的关键词索引，未启用时返回None"""
+    global _keyword_index
+    if not KEYWORDS_CONFIG["enabled"]:
+        return None
+    with _keyword_index_lock:
+        if _keyword_index is None:
+            _keyword_index = KeywordIndex()
+    return _keyword_index
+
+
+def index_keywords_file(file_path: str, content: str) -> None:
+    """字幕文件写入后更新关键词索引，用作后台写入的回调
+
+    只处理 docs/<视频标题>/srt.srt
+    """
+    if os.path.basename(file_path) != "srt.srt":
+        return
+    index = get_keyword_index()
+    if index is None:
+        return
+    index.add(os.path.basename(os.path.dirname(file_path)), cue_text(content))
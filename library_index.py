@@ -0,0 +1,285 @@
+"""
+视频库索引
+保存视频时记录每个docs目录对应的视频（存储键、分P和字幕语言）、视频链接和文件修改时间，
+删除视频时写入删除标记。每次变化分配一个递增的序号，Web服务按序号只读取上次之后变化的视频，
+不需要遍历docs目录或读取文件内容
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LIBRARY_INDEX_CONFIG
+from shared_state import bump_library_generation
+from transcript_store import TranscriptStore
+from video_id import av_to_bv
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    doc TEXT PRIMARY KEY,
+    video_url TEXT,
+    store_key TEXT,
+    cid INTEGER,
+    lang TEXT,
+    has_article INTEGER NOT NULL DEFAULT 0,
+    has_subtitle INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0,
+    seq INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS videos_seq ON videos (seq);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# docs/<视频标题>/ 中的文件: (文件名, 列名)
+_FILES = (("article.txt", "has_article"), ("srt.srt", "has_subtitle"))
+
+# 旧版本保存的文件第一行中的视频链接
+_URL_HEADER = "# Video URL:"
+_VIDEO_ID = re.compile(r"(BV[0-9A-Za-z]{10})|av(\d+)", re.IGNORECASE)
+
+
+def video_url(store_key: str) -> str:
+    """视频的链接"""
+    return f"https://www.bilibili.com/video/{store_key}"
+
+
+class LibraryIndex:
+    """docs目录中视频的索引，按变化序号增量读取"""
+
+    def __init__(self, path: Optional[str] = None, docs_dir: str = "docs"):
+        self.path = path or LIBRARY_INDEX_CONFIG["path"]
+        self.docs_dir = docs_dir
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func: Any) -> Any:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection) -> int:
+        conn.execute(
+            "INSERT INTO meta (name, value) VALUES ('seq', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+        return conn.execute("SELECT value FROM meta WHERE name = 'seq'").fetchone()[0]
+
+    def _stat_files(self, doc: str) -> Dict[str, Any]:
+        """视频目录中包含哪些文件及最后修改时间，只读取文件属性"""
+        files: Dict[str, Any] = {"updated_at": 0.0}
+        for name, column in _FILES:
+            try:
+                mtime = os.stat(os.path.join(self.docs_dir, doc, name)).st_mtime
+            except OSError:
+                files[column] = 0
+                continue
+            files[column] = 1
+            files["updated_at"] = max(files["updated_at"], mtime)
+        return files
+
+    def _read_store_key(self, doc: str) -> Optional[str]:
+        """从旧版本保存的文件第一行读取视频的存储键，只读一行"""
+        for name, _ in _FILES:
+            try:
+                with open(
+                    os.path.join(self.docs_dir, doc, name), "r", encoding="utf-8"
+                ) as f:
+                    first_line = f.readline()
+            except (OSError, UnicodeError):
+                continue
+            match = (
+                _VIDEO_ID.search(first_line)
+                if first_line.startswith(_URL_HEADER)
+                else None
+            )
+            if match is None:
+                continue
+            if match.group(1):
+                return "BV" + match.group(1)[2:]
+            try:
+                return av_to_bv(int(match.group(2)))
+            except ValueError:
+                continue
+        return None
+
+    def _write(self, conn: sqlite3.Connection, row: Dict[str, Any]) -> None:
+        row["seq"] = self._next_seq(conn)
+        conn.execute(
+            f"INSERT OR REPLACE INTO videos ({', '.join(row)}) VALUES "
+            f"({', '.join('?' for _ in row)})",
+            tuple(row.values()),
+        )
+
+    def record(
+        self,
+        doc: str,
+        store_key: str,
+        cid: Optional[int] = None,
+        lang: Optional[str] = None,
+    ) -> None:
+        """保存视频的文件写入后调用，记录视频和文件的修改时间
+
+        Args:
+            doc: docs中的目录名
+            store_key: 视频在字幕存储中的键（BV号）
+            cid: 分P的cid
+            lang: 字幕语言
+        """
+        files = self._stat_files(doc)
+        row = dict(
+            files,
+            doc=doc,
+            video_url=video_url(store_key),
+            store_key=store_key,
+            cid=cid,
+            lang=lang,
+            deleted=0 if files["has_article"] or files["has_subtitle"] else 1,
+        )
+        self._transaction(lambda conn: self._write(conn, row))
+
+    def remove(self, doc: str) -> bool:
+        """删除视频时调用，写入删除标记供增量读取，返回是否存在"""
+
+        def update(conn: sqlite3.Connection) -> bool:
+            old = conn.execute(
+                "SELECT * FROM videos WHERE doc = ? AND deleted = 0", (doc,)
+            ).fetchone()
+            if old is None:
+                return False
+            self._write(conn, dict(old, deleted=1))
+            return True
+
+        return self._transaction(update)
+
+    def get(self, doc: str) -> Optional[Dict[str, Any]]:
+        """返回视频的记录，不存在或已删除时返回None"""
+        row = (
+            self._connect()
+            .execute("SELECT * FROM videos WHERE doc = ? AND deleted = 0", (doc,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def changes_since(self, seq: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """返回最新的序号和序号seq之后变化的视频（包括删除标记），按序号排序"""
+        conn = self._connect()
+        latest = conn.execute("SELECT value FROM meta WHERE name = 'seq'").fetchone()
+        rows = conn.execute(
+            "SELECT * FROM videos WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        changes = [dict(row) for row in rows]
+        # 读取两条语句之间可能有新的变化，以读到的最大序号为准
+        return (
+            max([latest[0] if latest else 0] + [row["seq"] for row in changes]),
+            changes,
+        )
+
+    def reconcile(self) -> int:
+        """与docs目录对比并修正索引，返回修正的视频数
+
+        补录不是通过保存流程写入的目录（升级前保存的视频、export-docs导出或手动复制的目录），
+        为已不存在的目录写入删除标记。只读取文件属性，新目录读取文件第一行中的视频链接。
+        """
+        try:
+            names = os.listdir(self.docs_dir)
+        except FileNotFoundError:
+            names = []
+        present = {}
+        for name in names:
+            files = self._stat_files(name)
+            if files["has_article"] or files["has_subtitle"]:
+                present[name] = files
+
+        def update(conn: sqlite3.Connection) -> int:
+            known = {
+                row["doc"]: dict(row)
+                for row in conn.execute("SELECT * FROM videos WHERE deleted = 0")
+            }
+            changed = 0
+            for doc, files in present.items():
+                old = known.get(doc)
+                if old is not None and all(
+                    old[column] == value for column, value in files.items()
+                ):
+                    continue
+                if old is None:
+                    store_key = self._read_store_key(doc)
+                    old = {
+                        "doc": doc,
+                        "video_url": video_url(store_key) if store_key else None,
+                        "store_key": store_key,
+                        "cid": None,
+                        "lang": None,
+                        "deleted": 0,
+                    }
+                self._write(conn, dict(old, **files))
+                changed += 1
+            for doc in known.keys() - present.keys():
+                self._write(conn, dict(known[doc], deleted=1))
+                changed += 1
+            return changed
+
+        return self._transaction(update)
+
+
+_library_index: Optional[LibraryIndex] = None
+_library_index_lock = threading.Lock()
+
+
+def get_library_index() -> LibraryIndex:
+    """返回默认的视频库索引"""
+    global _library_index
+    with _library_index_lock:
+        if _library_index is None:
+            _library_index = LibraryIndex()
+    return _library_index
+
+
+def record_saved_video(
+    doc: str, video_info: Dict[str, Any], subtitle: Dict[str, Any]
+) -> None:
+    """视频的字幕和文章写入后记录到索引，并通知各进程视频库已变化
+
+    在两个文件之后提交给后台写入线程，每个视频只递增一次视频库版本号
+    """
+    # 语言与字幕存储的记录一致，删除时据此只删除这一条记录
+    get_library_index().record(
+        doc,
+        TranscriptStore.video_key(video_info),
+        video_info.get("cid"),
+        subtitle.get("lan", ""),
+    )
+    bump_library_generation()
+
+
+def reconcile_library() -> int:
+    """与docs目录对比并修正索引，有变化时通知各进程，返回修正的视频数"""
+    changed = get_library_index().reconcile()
+    if changed:
+        bump_library_generation()
+    return changed
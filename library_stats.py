@@ -0,0 +1,307 @@
+"""
+视频库统计
+保存和删除视频时增量更新视频数、字幕时长、字数、语言、作者和每天入库数量等汇总数据，
+每次更新只修改受影响的几行，查询时直接读取汇总表，耗时与视频库大小无关
+汇总数据可以随时从docs目录和字幕存储重建
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import LIBRARY_STATS_CONFIG
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    doc TEXT PRIMARY KEY,
+    author TEXT,
+    language TEXT,
+    seconds REAL NOT NULL DEFAULT 0,
+    chars INTEGER NOT NULL DEFAULT 0,
+    cues INTEGER NOT NULL DEFAULT 0,
+    day TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS authors (
+    author TEXT PRIMARY KEY,
+    videos INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS authors_videos ON authors (videos);
+CREATE TABLE IF NOT EXISTS languages (
+    language TEXT PRIMARY KEY,
+    videos INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS daily (
+    day TEXT PRIMARY KEY,
+    videos INTEGER NOT NULL
+);
+"""
+
+# 每个视频计入总数的字段
+_TOTAL_FIELDS = ("seconds", "chars", "cues")
+
+# 按值计数的维度表：(表名, 列名)
+_DIMENSIONS = (("authors", "author"), ("languages", "language"), ("daily", "day"))
+
+
+def _day(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+def transcript_stats(srt_content: str) -> Dict[str, Any]:
+    """统计SRT字幕的时长（最后一条字幕的结束时间）、字数和条数"""
+    from transcript_cache import parse_srt
+
+    cues = parse_srt(srt_content)
+    return {
+        "seconds": max((cue["to"] for cue in cues), default=0.0),
+        "chars": sum(len(cue["content"]) for cue in cues),
+        "cues": len(cues),
+    }
+
+
+class LibraryStats:
+    """增量维护的视频库汇总数据"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or LIBRARY_STATS_CONFIG["path"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func: Any) -> Any:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def _add_total(conn: sqlite3.Connection, name: str, delta: float) -> None:
+        if delta:
+            conn.execute(
+                "INSERT INTO totals (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, delta),
+            )
+
+    def _apply(self, conn: sqlite3.Connection, row: Dict[str, Any], sign: int) -> None:
+        """把一个视频计入（sign=1）或移出（sign=-1）汇总数据"""
+        self._add_total(conn, "videos", sign)
+        for field in _TOTAL_FIELDS:
+            self._add_total(conn, field, sign * row[field])
+        for table, column in _DIMENSIONS:
+            value = row[column]
+            if value is None:
+                continue
+            conn.execute(
+                f"INSERT INTO {table} ({column}, videos) VALUES (?, ?) "
+                f"ON CONFLICT({column}) DO UPDATE SET videos = videos + "
+                "excluded.videos",
+                (value, sign),
+            )
+            count = conn.execute(
+                f"SELECT videos FROM {table} WHERE {column} = ?", (value,)
+            ).fetchone()[0]
+            if count <= 0:
+                conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (value,))
+            # 维度中不同值的个数，出现或消失时更新
+            if (sign > 0 and count == 1) or (sign < 0 and count <= 0):
+                self._add_total(conn, table, sign)
+
+    def record(
+        self,
+        doc: str,
+        *,
+        author: Optional[str] = None,
+        language: Optional[str] = None,
+        seconds: Optional[float] = None,
+        chars: Optional[int] = None,
+        cues: Optional[int] = None,
+        created_at: Optional[float] = None,
+    ) -> None:
+        """添加或更新一个视频，未指定的字段保持原值
+
+        字幕文件写入后更新时长和字数，处理完成后更新作者和语言，两者可以按任意顺序到达
+        """
+
+        def update(conn: sqlite3.Connection) -> None:
+            now = time.time()
+            old = conn.execute("SELECT * FROM videos WHERE doc = ?", (doc,)).fetchone()
+            row = (
+                dict(old)
+                if old
+                else {
+                    "doc": doc,
+                    "author": None,
+                    "language": None,
+                    "seconds": 0.0,
+                    "chars": 0,
+                    "cues": 0,
+                    "created_at": created_at or now,
+                }
+            )
+            for field, value in (
+                ("author", author),
+                ("language", language),
+                ("seconds", seconds),
+                ("chars", chars),
+                ("cues", cues),
+                ("created_at", created_at),
+            ):
+                if value is not None:
+                    row[field] = value
+            row["day"] = _day(row["created_at"])
+            row["updated_at"] = now
+            if old:
+                self._apply(conn, dict(old), -1)
+            conn.execute(
+                f"INSERT OR REPLACE INTO videos ({', '.join(row)}) VALUES "
+                f"({', '.join('?' for _ in row)})",
+                tuple(row.values()),
+            )
+            self._apply(conn, row, 1)
+
+        self._transaction(update)
+
+    def remove(self, doc: str) -> bool:
+        """删除视频，视频被删除时调用，返回是否存在"""
+
+        def update(conn: sqlite3.Connection) -> bool:
+            old = conn.execute("SELECT * FROM videos WHERE doc = ?", (doc,)).fetchone()
+            if old is None:
+                return False
+            self._apply(conn, dict(old), -1)
+            conn.execute("DELETE FROM videos WHERE doc = ?", (doc,))
+            return True
+
+        return self._transaction(update)
+
+    def clear(self) -> None:
+        """清空全部数据，重建前调用"""
+
+        def update(conn: sqlite3.Connection) -> None:
+            for table in ("videos", "totals", "authors", "languages", "daily"):
+                conn.execute(f"DELETE FROM {table}")
+
+        self._transaction(update)
+
+    def summary(
+        self, days: Optional[int] = None, top_authors: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """汇总数据，只读取汇总表和按索引排序的前若干行
+
+        Args:
+            days: 返回最近多少天每天的入库数量
+            top_authors: 返回视频数最多的多少个作者
+        """
+        days = days or LIBRARY_STATS_CONFIG["days"]
+        top_authors = top_authors or LIBRARY_STATS_CONFIG["top_authors"]
+        conn = self._connect()
+        totals = {
+            row["name"]: row["value"]
+            for row in conn.execute("SELECT name, value FROM totals")
+        }
+
+        today = time.time()
+        start = _day(today - (days - 1) * 86400)
+        recent = {
+            row["day"]: row["videos"]
+            for row in conn.execute(
+                "SELECT day, videos FROM daily WHERE day >= ?", (start,)
+            )
+        }
+        ingestion = [
+            {"date": day, "videos": recent.get(day, 0)}
+            for day in (
+                _day(today - offset * 86400) for offset in range(days - 1, -1, -1)
+            )
+        ]
+
+        return {
+            "videos": int(totals.get("videos", 0)),
+            "hours": round(totals.get("seconds", 0) / 3600, 2),
+            "characters": int(totals.get("chars", 0)),
+            "cues": int(totals.get("cues", 0)),
+            "author_count": int(totals.get("authors", 0)),
+            "languages": [
+                {"language": row["language"], "videos": row["videos"]}
+                for row in conn.execute(
+                    "SELECT language, videos FROM languages ORDER BY videos DESC, "
+                    "language"
+                )
+            ],
+            "authors": [
+                {"author": row["author"], "videos": row["videos"]}
+                for row in conn.execute(
+                    "SELECT author, videos FROM authors ORDER BY videos DESC LIMIT ?",
+                    (top_authors,),
+                )
+            ],
+            "ingestion": ingestion,
+            "ingestion_per_day": round(
+                sum(item["videos"] for item in ingestion) / days, 2
+            ),
+        }
+
+
+_library_stats: Optional[LibraryStats] = None
+_library_stats_lock = threading.Lock()
+
+
+def get_library_stats() -> Optional[LibraryStats]:
+    """返回默认的视频库统计，未启用时返回None"""
+    global _library_stats
+    if not LIBRARY_STATS_CONFIG["enabled"]:
+        return None
+    with _library_stats_lock:
+        if _library_stats is None:
+            _library_stats = LibraryStats()
+    return _library_stats
+
+
+def record_srt_file(file_path: str, content: str) -> None:
+    """字幕文件写入后更新时长和字数，用作后台写入的回调
+
+    只处理 docs/<视频标题>/srt.srt
+    """
+    if os.path.basename(file_path) != "srt.srt":
+        return
+    stats = get_library_stats()
+    if stats is None:
+        return
+    stats.record(
+        os.path.basename(os.path.dirname(file_path)), **transcript_stats(content)
+    )
+
+
+def record_video_metadata(
+    doc: str, video_info: Dict[str, Any], subtitle: Dict[str, Any]
+) -> None:
+    """处理完成后记录视频的作者和字幕语言"""
+    stats = get_library_stats()
+    if stats is None:
+        return
+    stats.record(doc, author=video_info.get("author"), language=subtitle.get("lan"))
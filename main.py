@@ -4,26 +4,54 @@ Bilibili字幕获取服务
 基于bilibili-subtitle浏览器扩展项目的API调用方式实现的Python后端服务
 """
 
-import argparse
 import sys
-import os
-import re
-from typing import Optional
 
-from bilibili_subtitle_service import BilibiliSubtitleService
-from config import BILIBILI_COOKIES, DEFAULT_FORMAT
+from daemon_client import forward_to_daemon, request as daemon_request
+
+# 常驻进程在运行时直接把参数转交给它处理，不再导入下面耗时的模块
+if __name__ == "__main__":
+    _exit_code = forward_to_daemon(sys.argv[1:])
+    if _exit_code is not None:
+        sys.exit(_exit_code)
 
+import argparse
+import json
+import os
+import signal
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 
-def sanitize_filename(filename: str) -> str:
-    """清理文件名，移除不合法字符"""
-    # 替换Windows和Unix系统都不支持的文件名字符
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    # 移除前后的空格和点
-    filename = filename.strip('. ')
-    # 如果文件名为空，返回默认名称
-    return filename or 'untitled'
+from bilibili_subtitle_service import BilibiliSubtitleService
+from config import (
+    BILIBILI_COOKIE_POOL,
+    DAEMON_CONFIG,
+    POOL_CONFIG,
+    QUEUE_CONFIG,
+    RATE_LIMIT_CONFIG,
+    SITE_CONFIG,
+)
+from background_writer import writer
+from chunker import export_chunks, load_checkpoint, save_checkpoint
+from dedupe import DedupeIndex, cue_text, index_srt_file
+from filenames import sanitize_filename
+from keywords import KeywordIndex, index_keywords_file
+from library_index import reconcile_library, record_saved_video
+from library_stats import (
+    LibraryStats,
+    record_srt_file,
+    record_video_metadata,
+    transcript_stats,
+)
+from metrics import metrics, summary_rows
+from tracing import tracer
+from http_cache import write_precompressed_sidecars
+from site_export import export_site
+from transcript_store import TranscriptStore, get_store
+from work_queue import FAILED, PENDING, WorkQueue, new_worker_id
 
 
+@tracer.traced()
+@metrics.timed('stage_seconds', stage='save_content')
 def save_content(video_title: str, content_type: str, content: str) -> str:
     """保存内容到指定目录
     
@@ -37,25 +65,828 @@ def save_content(video_title: str, content_type: str, content: str) -> str:
     """
     # 清理视频标题作为目录名
     safe_title = sanitize_filename(video_title)
-    
-    # 创建保存目录
+
+    # 保存目录由后台写入线程创建
     save_dir = os.path.join('docs', safe_title)
-    os.makedirs(save_dir, exist_ok=True)
-    
+
     # 确定文件名
     extension = 'txt' if content_type == 'article' else content_type
     filename = f"{content_type}.{extension}"
     file_path = os.path.join(save_dir, filename)
-    
+
+    # 交给后台线程写入临时文件后原子重命名
+    return writer.submit(file_path, content, callback=_after_write)
+
+
+def _after_write(file_path: str, content: str) -> None:
+    """文件写入完成后生成预压缩副本供Web服务直接发送，并更新索引和统计"""
+    write_precompressed_sidecars(file_path, content)
+    index_srt_file(file_path, content)
+    index_keywords_file(file_path, content)
+    record_srt_file(file_path, content)
+
+
+def run_export_docs(argv: List[str]) -> None:
+    """将字幕存储中的内容导出为 docs/<视频标题>/ 目录结构"""
+    parser = argparse.ArgumentParser(
+        prog="main.py export-docs", description="从字幕存储导出docs目录"
+    )
+    parser.add_argument("--docs-dir", default="docs", help="导出目录，默认为docs")
+    parser.add_argument("--bvid", default=None, help="只导出指定BV号的视频")
+    args = parser.parse_args(argv)
+
+    store = TranscriptStore()
+    exported = store.export_docs(args.docs_dir, args.bvid)
+    print(f"✅ 已导出 {len(exported)} 个视频到 {args.docs_dir}")
+    if os.path.abspath(args.docs_dir) == os.path.abspath('docs'):
+        # 导出的目录没有经过保存流程，补录到视频库索引
+        reconcile_library()
+
+    stats = store.stats()
+    print(
+        f"📊 存储统计: {stats['entries']} 条记录, {stats['blobs']} 份内容, "
+        f"原始 {stats['size']} 字节, 压缩后 {stats['stored_size']} 字节 ({stats['codec']})"
+    )
+
+
+def process_url(
+    service: BilibiliSubtitleService, url: str, args: argparse.Namespace
+) -> None:
+    """获取并保存一个视频的字幕，失败时抛出异常"""
+    # 获取视频信息和字幕列表
+    print(f"🔍 正在获取视频信息: {url}")
+    video_info = service.get_video_info(url)
+    print(f"📺 视频标题: {video_info['title']}")
+    print(f"👤 视频作者: {video_info['author']}")
+    print(f"🆔 视频ID: {video_info['aid']}")
+    print()
+
+    # 获取字幕列表
+    print("📋 正在获取字幕列表...")
+    subtitle_list = service.get_subtitle_list(video_info['aid'], video_info['cid'])
+
+    use_danmaku = not subtitle_list and getattr(args, 'danmaku', False)
+    if not subtitle_list and not use_danmaku:
+        raise Exception("该视频没有可用的字幕")
+
+    if subtitle_list:
+        print("✅ 可用的字幕语言:")
+        for i, subtitle in enumerate(subtitle_list, 1):
+            print(f"  {i}. {subtitle['lan']}: {subtitle['lan_doc']}")
+        print()
+
+    # 如果只是列出语言
+    if args.list_languages:
+        if use_danmaku:
+            print("⚠️  该视频没有字幕，处理时将使用弹幕")
+        return
+
+    store = get_store()
+
+    # 选择字幕语言
+    selected_subtitle: Optional[dict] = None
+    previous: Optional[dict] = None
+    if use_danmaku:
+        selected_subtitle, subtitle_content, validators = fetch_danmaku_subtitle(
+            service, video_info
+        )
+    elif args.language:
+        for subtitle in subtitle_list:
+            if subtitle['lan'] == args.language:
+                selected_subtitle = subtitle
+                break
+        if not selected_subtitle:
+            print("可用的字幕语言:")
+            for subtitle in subtitle_list:
+                print(f"  - {subtitle['lan']}: {subtitle['lan_doc']}")
+            raise Exception(f"未找到指定语言的字幕: {args.language}")
+    else:
+        selected_subtitle = subtitle_list[0]
+
+    if not use_danmaku:
+        print(f"📥 正在获取字幕内容: {selected_subtitle['lan_doc']}")
+
+        # 获取字幕内容，已保存且未变化的字幕不重新下载
+        previous = (
+            store.previous_subtitle(video_info, selected_subtitle) if store else None
+        )
+        subtitle_content, validators = service.get_subtitle_content_if_changed(
+            selected_subtitle, previous
+        )
+        if not validators['changed']:
+            print("♻️  字幕未变化，使用已保存的内容")
+
+    print("🔄 正在处理字幕格式...")
+
+    # 规范化字幕文本，字幕未变化时使用已保存的结果
+    normalized = service.normalize_subtitle(subtitle_content, previous)
+
+    # 始终获取并保存SRT格式和文章格式
+    srt_content = service.format_subtitle(normalized, "srt")
+    article_content = service.format_as_article(normalized, args.with_timestamp)
+
+    print("💾 正在保存文件...")
+
     # 保存文件
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    return file_path
+    srt_path = save_content(video_info['title'], 'srt', srt_content)
+    article_path = save_content(video_info['title'], 'article', article_content)
+    writer.submit_call(
+        record_video_metadata,
+        sanitize_filename(video_info['title']),
+        video_info,
+        selected_subtitle,
+    )
+    writer.submit_call(
+        record_saved_video,
+        sanitize_filename(video_info['title']),
+        video_info,
+        selected_subtitle,
+    )
 
+    if store:
+        writer.submit_call(
+            store.put,
+            video_info,
+            selected_subtitle,
+            subtitle_content,
+            srt_content,
+            article_content,
+            validators,
+            normalized,
+        )
 
-def main() -> None:
-    """主函数"""
+    # 等待后台写入完成后再报告结果
+    writer.flush()
+
+    print("\n✅ 文件已成功保存:")
+    print(f"📝 SRT字幕文件: {srt_path}")
+    print(f"📖 文章格式文件: {article_path}")
+
+    # 显示统计信息
+    srt_lines = len(srt_content.split('\n\n'))
+    article_chars = len(article_content)
+    print("\n📊 处理统计:")
+    print(f"   字幕条数: {srt_lines}")
+    print(f"   文章字数: {article_chars}")
+
+
+def _format_clock(seconds: float) -> str:
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
+
+
+def fetch_danmaku_subtitle(
+    service: BilibiliSubtitleService, video_info: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """没有字幕时获取弹幕，按时间分组合并为字幕格式
+
+    Returns:
+        Tuple: (字幕信息, 字幕JSON, 校验信息)，与获取普通字幕的结果格式相同
+    """
+    print("💬 该视频没有字幕，正在获取弹幕...")
+    track = service.get_video_danmaku(video_info)
+    if not len(track):
+        raise Exception("该视频没有可用的字幕，也没有弹幕")
+
+    print(f"✅ 共 {len(track)} 条弹幕，弹幕最密集的时间段:")
+    for peak in track.peaks():
+        print(
+            f"   🔥 {_format_clock(peak['from'])}-{_format_clock(peak['to'])} "
+            f"{peak['count']} 条: {' / '.join(peak['comments'])}"
+        )
+    print()
+
+    subtitle = {'lan': 'danmaku', 'lan_doc': '弹幕'}
+    return subtitle, track.to_subtitle_data(), {'changed': True}
+
+
+def print_metrics_summary() -> None:
+    """输出各阶段耗时和请求、缓存统计的汇总表"""
+    snapshot = metrics.snapshot()
+    print("\n⏱️  各阶段耗时:")
+    print(f"   {'stage':<42}{'count':>7}{'avg(ms)':>10}{'p95(ms)':>10}{'total(s)':>10}")
+    for row in sorted(summary_rows(snapshot), key=lambda row: -row['total']):
+        label = ','.join(str(value) for value in row['labels'].values())
+        name = f"{row['name']}[{label}]" if label else row['name']
+        p95 = '>10s' if row['p95'] == float('inf') else f"{row['p95'] * 1000:.0f}"
+        print(
+            f"   {name:<42}{row['count']:>7}{row['avg'] * 1000:>10.1f}"
+            f"{p95:>10}{row['total']:>10.2f}"
+        )
+
+    counters = [(name, labels, value) for name, labels, value in snapshot['counters']]
+    if counters:
+        print("\n🔢 计数:")
+        for name, labels, value in sorted(
+            counters, key=lambda item: (item[0], sorted(item[1].items()))
+        ):
+            label = ','.join(f"{key}={value}" for key, value in sorted(labels.items()))
+            print(
+                f"   {name}{{{label}}}: {value:g}" if label else f"   {name}: {value:g}"
+            )
+
+
+def run_enqueue(argv: List[str]) -> None:
+    """把视频链接加入任务队列，由worker进程处理"""
+    parser = argparse.ArgumentParser(
+        prog="main.py enqueue", description="将视频链接加入任务队列"
+    )
+    parser.add_argument("urls", nargs="*", metavar="url", help="Bilibili视频链接")
+    parser.add_argument(
+        "--file", "-f", default=None, help="从文件读取链接，每行一个，#开头的行忽略"
+    )
+    parser.add_argument("--language", "-l", default=None, help="指定字幕语言")
+    parser.add_argument(
+        "--with-timestamp", action="store_true", help="在文章格式中包含时间戳"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="忽略\"视频不存在\"、\"没有字幕\"的缓存结果",
+    )
+    parser.add_argument("--danmaku", action="store_true", help="视频没有字幕时改用弹幕")
+    parser.add_argument(
+        "--allow-duplicates", action="store_true", help="允许重复添加队列中已有的链接"
+    )
+    args = parser.parse_args(argv)
+
+    urls = list(args.urls)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            urls.extend(
+                line.strip() for line in f if line.strip() and not line.startswith('#')
+            )
+    if not urls:
+        parser.error("请提供视频链接或使用 --file 指定链接文件")
+
+    options = {
+        'language': args.language,
+        'with_timestamp': args.with_timestamp,
+        'refresh': args.refresh,
+        'danmaku': args.danmaku,
+    }
+    queue = WorkQueue()
+    ids = queue.enqueue(urls, options, unique=not args.allow_duplicates)
+    print(
+        f"✅ 已加入 {len(ids)} 个任务，跳过 {len(urls) - len(ids)} 个已在队列中的链接"
+    )
+    stats = queue.stats()
+    print(
+        f"📋 队列状态: 等待 {stats['pending']}, 处理中 {stats['leased']}, "
+        f"完成 {stats['done']}, 失败 {stats['failed']}, 工作进程 {stats['workers']}"
+    )
+
+
+def run_queue_status(argv: List[str]) -> None:
+    """查看任务队列状态，重试失败任务或清理已完成任务"""
+    parser = argparse.ArgumentParser(
+        prog="main.py queue", description="查看和管理任务队列"
+    )
+    parser.add_argument("--failed", action="store_true", help="列出失败的任务")
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="把失败的任务重新放回队列"
+    )
+    parser.add_argument("--purge-done", action="store_true", help="删除已完成的任务")
+    args = parser.parse_args(argv)
+
+    queue = WorkQueue()
+    if args.retry_failed:
+        print(f"🔁 已重新排队 {queue.retry_failed()} 个失败任务")
+    if args.purge_done:
+        print(f"🗑️  已删除 {queue.purge_done()} 个已完成任务")
+
+    stats = queue.stats()
+    print(
+        f"📋 队列状态: 等待 {stats['pending']}, 处理中 {stats['leased']}, "
+        f"完成 {stats['done']}, 失败 {stats['failed']}, 工作进程 {stats['workers']}"
+    )
+
+    if args.failed:
+        for job in queue.list_jobs(FAILED, limit=50):
+            print(
+                f"   ❌ #{job['id']} {job['url']} (尝试 {job['attempts']} 次): "
+                f"{job['last_error']}"
+            )
+
+
+def run_export_chunks(argv: List[str]) -> None:
+    """把视频库切分为带时间范围的文本块并导出为JSONL"""
+    parser = argparse.ArgumentParser(
+        prog="main.py export-chunks", description="导出知识库文本块（JSONL）"
+    )
+    parser.add_argument("--output", "-o", default="-", help="输出文件，默认为标准输出")
+    parser.add_argument(
+        "--source",
+        choices=("store", "docs"),
+        default="store",
+        help="数据来源：字幕存储（包含完整视频信息）或docs目录",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="检查点文件：只导出上次导出之后有变化的视频，完成后更新检查点",
+    )
+    parser.add_argument("--max-chars", type=int, default=None, help="每块最多字数")
+    parser.add_argument(
+        "--overlap-chars", type=int, default=None, help="相邻两块最多重叠的字数"
+    )
+    args = parser.parse_args(argv)
+
+    since = load_checkpoint(args.checkpoint) if args.checkpoint else None
+    if args.output == '-':
+        summary = export_chunks(
+            sys.stdout, args.source, since, args.max_chars, args.overlap_chars
+        )
+    else:
+        # 先写临时文件，导出中途失败不会留下不完整的文件
+        tmp_path = args.output + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            summary = export_chunks(
+                f, args.source, since, args.max_chars, args.overlap_chars
+            )
+        os.replace(tmp_path, args.output)
+
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, summary['latest'])
+    # 输出到标准输出时统计信息写到标准错误，避免混入JSONL
+    print(
+        f"✅ 已导出 {summary['videos']} 个视频, {summary['chunks']} 个文本块",
+        file=sys.stderr if args.output == '-' else sys.stdout,
+    )
+
+
+def run_dedupe(argv: List[str]) -> None:
+    """输出字幕近似重复的视频分组"""
+    parser = argparse.ArgumentParser(
+        prog="main.py dedupe", description="查找字幕近似重复的视频"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="重新扫描docs目录中的所有字幕并重建索引"
+    )
+    parser.add_argument(
+        "--docs-dir", default="docs", help="重建索引时扫描的目录，默认为docs"
+    )
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args(argv)
+
+    index = DedupeIndex()
+    if args.rebuild:
+        existing = set(index.docs())
+        found = set()
+        for item in (
+            sorted(os.listdir(args.docs_dir)) if os.path.isdir(args.docs_dir) else []
+        ):
+            srt_path = os.path.join(args.docs_dir, item, 'srt.srt')
+            if os.path.isfile(srt_path):
+                with open(srt_path, 'r', encoding='utf-8') as f:
+                    index.add(item, cue_text(f.read()))
+                found.add(item)
+        for doc in existing - found:
+            index.remove(doc)
+        print(f"✅ 已重建索引: {len(found)} 个视频")
+
+    duplicates = index.duplicates_map()
+    groups = index.groups()
+    if args.json:
+        print(
+            json.dumps(
+                {'groups': groups, 'duplicates': duplicates},
+                ensure_ascii=False,
+                indent=2,
+            )
+        )
+        return
+
+    if not groups:
+        print("✅ 没有发现字幕近似重复的视频")
+        return
+
+    print(f"🔁 发现 {len(groups)} 组字幕近似重复的视频:")
+    for i, group in enumerate(groups, 1):
+        print(f"\n  {i}. 共 {len(group)} 个视频")
+        for doc in group:
+            best = max(
+                (match['similarity'] for match in duplicates.get(doc, [])), default=0
+            )
+            print(f"     - {doc} (最高相似度 {best:.0%})")
+
+
+def run_keywords(argv: List[str]) -> None:
+    """输出视频的关键词和相关视频"""
+    parser = argparse.ArgumentParser(
+        prog="main.py keywords", description="查看视频的关键词和字幕内容相关的视频"
+    )
+    parser.add_argument(
+        "title",
+        nargs="?",
+        help="视频标题（docs目录下的文件夹名），不指定时列出所有视频的关键词",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="重新扫描docs目录中的所有字幕并重建索引"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="按当前的文档频率重新计算所有视频的关键词",
+    )
+    parser.add_argument(
+        "--docs-dir", default="docs", help="重建索引时扫描的目录，默认为docs"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=10, help="输出的相关视频数，默认为10"
+    )
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args(argv)
+
+    index = KeywordIndex()
+    if args.rebuild:
+        existing = set(index.docs())
+        found = set()
+        for item in (
+            sorted(os.listdir(args.docs_dir)) if os.path.isdir(args.docs_dir) else []
+        ):
+            srt_path = os.path.join(args.docs_dir, item, 'srt.srt')
+            if os.path.isfile(srt_path):
+                with open(srt_path, 'r', encoding='utf-8') as f:
+                    index.add(item, cue_text(f.read()))
+                found.add(item)
+        for doc in existing - found:
+            index.remove(doc)
+        # 逐个添加时前面的视频使用的文档频率不完整，全部添加后统一重新计算
+        index.refresh_all()
+        print(f"✅ 已重建索引: {len(found)} 个视频")
+    elif args.refresh:
+        print(f"✅ 已重新计算 {index.refresh_all()} 个视频的关键词")
+
+    if not args.title:
+        keywords = index.keywords_map()
+        if args.json:
+            print(json.dumps(keywords, ensure_ascii=False, indent=2))
+            return
+        if not keywords:
+            print("📭 关键词索引为空，可以使用 --rebuild 从docs目录重建")
+            return
+        for doc, terms in keywords.items():
+            print(f"🏷️  {doc}: {' / '.join(terms)}")
+        return
+
+    doc = sanitize_filename(args.title)
+    keywords = index.keywords_of(doc)
+    related = index.related(doc, args.limit)
+    if args.json:
+        print(
+            json.dumps(
+                {'keywords': keywords, 'related': related}, ensure_ascii=False, indent=2
+            )
+        )
+        return
+    if not keywords:
+        print(f"❌ 关键词索引中没有该视频: {doc}")
+        sys.exit(1)
+
+    print(f"🏷️  {doc} 的关键词:")
+    print("   " + ' / '.join(f"{term} ({weight:.2f})" for term, weight in keywords))
+    if not related:
+        print("\n📭 没有找到相关视频")
+        return
+    print("\n🔗 相关视频:")
+    for i, item in enumerate(related, 1):
+        print(
+            f"  {i}. {item['doc']} (相似度 {item['score']:.0%}，"
+            f"共同关键词: {'、'.join(item['shared'])})"
+        )
+
+
+def run_stats(argv: List[str]) -> None:
+    """输出视频库的汇总统计"""
+    parser = argparse.ArgumentParser(
+        prog="main.py stats",
+        description="查看视频库的视频数、字幕时长、字数、语言、作者和入库数量",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="重新扫描docs目录和字幕存储并重建统计"
+    )
+    parser.add_argument(
+        "--docs-dir", default="docs", help="重建统计时扫描的目录，默认为docs"
+    )
+    parser.add_argument("--days", type=int, help="输出最近多少天的入库数量")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出")
+    args = parser.parse_args(argv)
+
+    stats = LibraryStats()
+    if args.rebuild:
+        # 作者和语言只保存在字幕存储中，同一标题有多条记录时使用最近更新的一条
+        metadata = {}
+        store = get_store()
+        for entry in store.iter_entries() if store else []:
+            metadata[sanitize_filename(entry['title'] or '')] = entry
+
+        stats.clear()
+        count = 0
+        for item in (
+            sorted(os.listdir(args.docs_dir)) if os.path.isdir(args.docs_dir) else []
+        ):
+            srt_path = os.path.join(args.docs_dir, item, 'srt.srt')
+            if not os.path.isfile(srt_path):
+                continue
+            with open(srt_path, 'r', encoding='utf-8') as f:
+                fields = transcript_stats(f.read())
+            entry = metadata.get(item, {})
+            stats.record(
+                item,
+                author=entry.get('author'),
+                language=entry.get('lang'),
+                created_at=os.stat(srt_path).st_mtime,
+                **fields,
+            )
+            count += 1
+        print(f"✅ 已重建统计: {count} 个视频")
+
+    summary = stats.summary(args.days)
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    print("📊 视频库统计:")
+    print(f"   视频数: {summary['videos']}")
+    print(f"   字幕时长: {summary['hours']} 小时")
+    print(f"   字幕字数: {summary['characters']}")
+    print(f"   字幕条数: {summary['cues']}")
+    print(f"   作者数: {summary['author_count']}")
+    if summary['languages']:
+        print("\n🌐 字幕语言:")
+        for item in summary['languages']:
+            print(f"   {item['language']}: {item['videos']}")
+    if summary['authors']:
+        print("\n👤 视频最多的作者:")
+        for item in summary['authors']:
+            print(f"   {item['author']}: {item['videos']}")
+    print(
+        f"\n📈 最近 {len(summary['ingestion'])} 天平均每天入库 {summary['ingestion_per_day']} 个视频"
+    )
+    for item in summary['ingestion']:
+        if item['videos']:
+            print(f"   {item['date']}: {item['videos']}")
+
+
+def run_export_site(argv: List[str]) -> None:
+    """把视频库导出为静态站点"""
+    parser = argparse.ArgumentParser(
+        prog="main.py export-site",
+        description="把视频库导出为静态HTML页面和分片的搜索索引，可以用任意静态文件服务器访问",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=SITE_CONFIG['output'],
+        help=f"输出目录，默认为{SITE_CONFIG['output']}",
+    )
+    parser.add_argument(
+        "--source",
+        choices=["docs", "store"],
+        default="docs",
+        help="读取docs目录或字幕存储（包含作者信息），默认为docs",
+    )
+    parser.add_argument(
+        "--docs-dir", default="docs", help="source为docs时读取的目录，默认为docs"
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="重新渲染全部页面并重建搜索索引"
+    )
+    args = parser.parse_args(argv)
+
+    summary = export_site(args.output, args.source, args.docs_dir, args.full)
+    print(
+        f"✅ 已导出到 {args.output}: 渲染 {summary['rendered']} 个页面, "
+        f"未变化 {summary['unchanged']} 个, 删除 {summary['removed']} 个"
+    )
+    print(f"🔎 重写搜索索引分片 {summary['shards']} 个")
+    print(f"🌐 预览: python -m http.server -d {args.output}")
+
+
+class _LeaseKeeper(threading.Thread):
+    """处理任务期间定期续约并登记心跳"""
+
+    def __init__(self, queue: WorkQueue, job_id: int, worker_id: str):
+        super().__init__(name='lease-keeper', daemon=True)
+        self.queue = queue
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        interval = max(1.0, self.queue.visibility_timeout / 3)
+        while not self._stopped.wait(interval):
+            try:
+                # 只更新心跳时间，完成和失败数由主循环登记
+                self.queue.heartbeat(self.worker_id)
+                if not self.queue.extend(self.job_id, self.worker_id):
+                    print(
+                        f"⚠️  任务 #{self.job_id} 的租约已失效，可能已被其他工作进程接手",
+                        file=sys.stderr,
+                    )
+                    return
+            except Exception as e:
+                print(f"⚠️  续约失败: {e}", file=sys.stderr)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def _share_rate_limit(service: BilibiliSubtitleService, queue: WorkQueue) -> None:
+    """按活跃的工作进程数平分每个账号的请求速率，使所有进程合计不超过配置的速率
+
+    启用跨进程限速时所有进程的请求已经共用一组令牌桶，不再平分，否则会重复限速
+    """
+    if RATE_LIMIT_CONFIG['enabled']:
+        return
+    workers = max(1, queue.active_workers())
+    for account in service.cookie_pool.accounts:
+        account.bucket.rate = POOL_CONFIG['rate'] / workers
+
+
+def run_worker(argv: List[str]) -> None:
+    """从任务队列领取视频链接并处理，可以在多台机器上同时运行多个"""
+    parser = argparse.ArgumentParser(
+        prog="main.py worker", description="从任务队列领取并处理视频"
+    )
+    parser.add_argument(
+        "--max-jobs", type=int, default=0, help="处理指定数量的任务后退出，0表示不限制"
+    )
+    parser.add_argument(
+        "--drain", action="store_true", help="队列中没有可处理的任务时退出"
+    )
+    args = parser.parse_args(argv)
+
+    queue = WorkQueue()
+    worker_id = new_worker_id()
+    service = BilibiliSubtitleService()
+    stopping = threading.Event()
+
+    def handle_stop(signum: int, frame: Any) -> None:
+        # 处理完当前任务再退出，未完成的任务租约过期后会被其他进程接手
+        print("\n🛑 收到停止信号，处理完当前任务后退出")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    print(f"👷 工作进程 {worker_id} 已启动，队列: {queue.path}")
+    done = failed = 0
+    try:
+        while not stopping.is_set() and not (
+            args.max_jobs and done + failed >= args.max_jobs
+        ):
+            queue.heartbeat(worker_id, done, failed)
+            _share_rate_limit(service, queue)
+            job = queue.claim(worker_id)
+            if job is None:
+                if args.drain:
+                    break
+                stopping.wait(QUEUE_CONFIG['poll_interval'])
+                continue
+
+            print(
+                f"\n===== 任务 #{job['id']} (第 {job['attempts']} 次) {job['url']} ====="
+            )
+            options = job['options']
+            service.refresh = bool(options.get('refresh'))
+            job_args = argparse.Namespace(
+                language=options.get('language'),
+                list_languages=False,
+                with_timestamp=bool(options.get('with_timestamp')),
+                danmaku=bool(options.get('danmaku')),
+            )
+            keeper = _LeaseKeeper(queue, job['id'], worker_id)
+            keeper.start()
+            try:
+                with (
+                    tracer.job(job['url'].rstrip('/').rsplit('/', 1)[-1]),
+                    metrics.timer('stage_seconds', stage='process_video'),
+                ):
+                    process_url(service, job['url'], job_args)
+            except Exception as e:
+                keeper.stop()
+                failed += 1
+                status = queue.nack(job['id'], worker_id, str(e))
+                retry_hint = {
+                    PENDING: "，稍后重试",
+                    FAILED: "，已达到最大尝试次数",
+                }.get(status, "")
+                print(f"❌ 任务 #{job['id']} 失败: {e}{retry_hint}", file=sys.stderr)
+            else:
+                keeper.stop()
+                done += 1
+                if queue.ack(job['id'], worker_id):
+                    print(f"🎉 任务 #{job['id']} 完成")
+                else:
+                    print(
+                        f"⚠️  任务 #{job['id']} 已完成，但租约已被其他工作进程接手",
+                        file=sys.stderr,
+                    )
+    finally:
+        queue.unregister(worker_id)
+
+    print(f"\n📦 工作进程退出: 完成 {done} 个, 失败 {failed} 个")
+    if done + failed:
+        print_metrics_summary()
+
+
+def _detach(log_path: str) -> bool:
+    """两次fork后在后台运行，输出写入日志文件；返回True表示当前为原进程"""
+    if os.fork() > 0:
+        return True
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    null_fd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(null_fd, 0)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    return False
+
+
+def run_daemon(argv: List[str]) -> None:
+    """启动、停止常驻进程或查看其状态"""
+    parser = argparse.ArgumentParser(
+        prog="main.py daemon",
+        description="常驻进程：保持服务就绪，命令行检测到后自动把视频链接转交给它处理",
+    )
+    parser.add_argument(
+        "action",
+        nargs="?",
+        choices=["start", "stop", "status"],
+        default="start",
+        help="start: 启动（默认在前台运行），stop: 停止，status: 查看状态",
+    )
+    parser.add_argument(
+        "--detach",
+        "-d",
+        action="store_true",
+        help=f"在后台运行，输出写入 {DAEMON_CONFIG['log']}",
+    )
+    args = parser.parse_args(argv)
+
+    if args.action == "status":
+        status = daemon_request({'command': 'ping'})
+        if status is None:
+            print(f"⚪ 常驻进程未运行 ({DAEMON_CONFIG['socket']})")
+            sys.exit(1)
+        print(
+            f"🟢 常驻进程运行中: pid {status['pid']}, 已运行 {status['uptime']:.0f}s, "
+            f"已处理 {status['requests']} 个请求, 正在处理 {status['active']} 个"
+        )
+        print(f"   工作目录: {status['cwd']}")
+        print(f"   socket: {status['socket']}")
+        return
+
+    if args.action == "stop":
+        reply = daemon_request({'command': 'shutdown'})
+        if reply is None:
+            print("⚪ 常驻进程未运行")
+            return
+        print(f"🛑 已通知常驻进程退出 (pid {reply['pid']})，正在处理的请求完成后退出")
+        return
+
+    from daemon import SubtitleDaemon
+
+    if daemon_request({'command': 'ping'}) is not None:
+        print(f"⚠️  常驻进程已在运行 ({DAEMON_CONFIG['socket']})")
+        return
+    if args.detach:
+        if _detach(DAEMON_CONFIG['log']):
+            print(f"🚀 常驻进程已在后台启动，日志: {DAEMON_CONFIG['log']}")
+            return
+
+    server = SubtitleDaemon()
+
+    def handle_stop(signum: int, frame: Any) -> None:
+        server.stop()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    server.serve_forever()
+
+
+# 子命令，第一个参数为子命令名称时使用，否则按视频链接处理
+COMMANDS = {
+    'export-docs': run_export_docs,
+    'export-chunks': run_export_chunks,
+    'dedupe': run_dedupe,
+    'keywords': run_keywords,
+    'stats': run_stats,
+    'export-site': run_export_site,
+    'enqueue': run_enqueue,
+    'queue': run_queue_status,
+    'worker': run_worker,
+    'daemon': run_daemon,
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """处理视频链接的命令行参数，常驻进程使用同一个解析器"""
     parser = argparse.ArgumentParser(
         description="获取Bilibili视频字幕",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -64,6 +895,10 @@ def main() -> None:
   python main.py "https://www.bilibili.com/video/BV1bK411W7t8"
   python main.py "https://www.bilibili.com/video/av12345"
   python main.py --list-languages "https://www.bilibili.com/video/BV1bK411W7t8"
+  python main.py URL1 URL2 URL3 --metrics-json metrics.json
+  python main.py export-docs --docs-dir docs
+  python main.py export-site -o site
+  python main.py daemon start --detach
   
 配置Cookie:
   1. 复制 .env.example 为 .env
@@ -71,125 +906,153 @@ def main() -> None:
   3. 或者设置环境变量 BILIBILI_COOKIES
 
 注意: 由于B站的政策变化，现在获取字幕需要登录状态，请在配置文件中提供有效的Cookie。
-        """
+        """,
     )
-    
+
     parser.add_argument(
-        "url",
-        help="Bilibili视频链接"
+        "urls",
+        nargs="+",
+        metavar="url",
+        help="Bilibili视频链接，可以指定多个进行批量处理",
     )
-    
+
     parser.add_argument(
         "--language", "-l",
         help="指定字幕语言 (例如: zh-CN, en, ja)，不指定则使用第一个可用字幕",
         default=None
     )
-    
+
     parser.add_argument(
         "--list-languages",
         action="store_true",
         help="仅列出可用的字幕语言，不下载字幕内容"
     )
-    
+
     parser.add_argument(
         "--with-timestamp",
         action="store_true",
         help="在文章格式中包含时间戳"
     )
-    
-    args = parser.parse_args()
-    
-    try:
-        # 检查Cookie配置
-        if not BILIBILI_COOKIES:
-            print("⚠️  警告: 未配置Cookie，可能无法获取字幕内容")
-            print("   请在 .env 文件中配置Cookie或设置环境变量")
-            print("   参考 .env.example 文件了解配置方法")
-            print()
-        
-        service = BilibiliSubtitleService()
-        
-        # 获取视频信息和字幕列表
-        print(f"🔍 正在获取视频信息: {args.url}")
-        video_info = service.get_video_info(args.url)
-        print(f"📺 视频标题: {video_info['title']}")
-        print(f"👤 视频作者: {video_info['author']}")
-        print(f"🆔 视频ID: {video_info['aid']}")
+
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="忽略\"视频不存在\"、\"没有字幕\"的缓存结果，重新请求",
+    )
+
+    parser.add_argument(
+        "--danmaku",
+        action="store_true",
+        help="视频没有字幕时改用弹幕，按时间分组合并后保存，并输出弹幕最密集的时间段",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="处理结束后输出各阶段耗时汇总表（批量处理时默认输出）",
+    )
+
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        default=None,
+        help="处理结束后将性能指标以JSON格式写入指定文件",
+    )
+
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="记录各阶段的追踪区间，每个视频写出Chrome Trace和火焰图文件（目录由TRACE_DIR指定）",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="在追踪的同时使用cProfile进行函数级性能分析",
+    )
+
+    return parser
+
+
+def run_urls(
+    args: argparse.Namespace,
+    service: Optional[BilibiliSubtitleService] = None,
+    report_metrics: bool = True,
+) -> int:
+    """处理命令行指定的视频链接，返回退出码
+
+    Args:
+        args: build_parser() 解析的参数
+        service: 常驻进程传入已就绪的服务实例，不指定时新建
+        report_metrics: 是否输出性能指标；常驻进程中的指标包含其他请求，不输出
+    """
+    if args.trace or args.profile:
+        tracer.configure(enabled=True, profile=args.profile)
+
+    # 检查Cookie配置
+    if not BILIBILI_COOKIE_POOL:
+        print("⚠️  警告: 未配置Cookie，可能无法获取字幕内容")
+        print("   请在 .env 文件中配置Cookie或设置环境变量")
+        print("   参考 .env.example 文件了解配置方法")
         print()
-        
-        # 获取字幕列表
-        print("📋 正在获取字幕列表...")
-        subtitle_list = service.get_subtitle_list(video_info['aid'], video_info['cid'])
-        
-        if not subtitle_list:
-            print("❌ 该视频没有可用的字幕", file=sys.stderr)
-            if not BILIBILI_COOKIES:
-                print("   这可能是因为未配置有效的Cookie导致的", file=sys.stderr)
+
+    service = service or BilibiliSubtitleService(refresh=args.refresh)
+    batch = len(args.urls) > 1
+    failed = []
+
+    for index, url in enumerate(args.urls, 1):
+        if batch:
+            print(f"\n===== [{index}/{len(args.urls)}] {url} =====")
+        try:
+            with (
+                tracer.job(url.rstrip('/').rsplit('/', 1)[-1]),
+                metrics.timer('stage_seconds', stage='process_video'),
+            ):
+                process_url(service, url, args)
+            if not args.list_languages:
+                print("\n🎉 处理完成！")
+        except Exception as e:
+            failed.append(url)
+            print(f"❌ 错误: {e}", file=sys.stderr)
+            if (
+                "获取字幕列表失败" in str(e) or "没有可用的字幕" in str(e)
+            ) and not BILIBILI_COOKIE_POOL:
+                print("   提示: 这可能是因为未配置有效的Cookie导致的", file=sys.stderr)
                 print("   请在 .env 文件中配置Cookie", file=sys.stderr)
-            sys.exit(1)
-        
-        print("✅ 可用的字幕语言:")
-        for i, subtitle in enumerate(subtitle_list, 1):
-            print(f"  {i}. {subtitle['lan']}: {subtitle['lan_doc']}")
-        print()
-        
-        # 如果只是列出语言
-        if args.list_languages:
-            return
-        
-        # 选择字幕语言
-        selected_subtitle: Optional[dict] = None
-        if args.language:
-            for subtitle in subtitle_list:
-                if subtitle['lan'] == args.language:
-                    selected_subtitle = subtitle
-                    break
-            if not selected_subtitle:
-                print(f"❌ 未找到指定语言的字幕: {args.language}", file=sys.stderr)
-                print("可用的字幕语言:")
-                for subtitle in subtitle_list:
-                    print(f"  - {subtitle['lan']}: {subtitle['lan_doc']}")
-                sys.exit(1)
-        else:
-            selected_subtitle = subtitle_list[0]
-        
-        print(f"📥 正在获取字幕内容: {selected_subtitle['lan_doc']}")
-        
-        # 获取字幕内容
-        subtitle_content = service.get_subtitle_content(selected_subtitle['subtitle_url'])
-        
-        print("🔄 正在处理字幕格式...")
-        
-        # 始终获取并保存SRT格式和文章格式
-        srt_content = service.format_subtitle(subtitle_content, "srt")
-        article_content = service.format_as_article(subtitle_content, args.with_timestamp)
-        
-        print("💾 正在保存文件...")
-        
-        # 保存文件
-        srt_path = save_content(video_info['title'], 'srt', srt_content)
-        article_path = save_content(video_info['title'], 'article', article_content)
-        
-        print("\n✅ 文件已成功保存:")
-        print(f"📝 SRT字幕文件: {srt_path}")
-        print(f"📖 文章格式文件: {article_path}")
-        
-        # 显示统计信息
-        srt_lines = len(srt_content.split('\n\n'))
-        article_chars = len(article_content)
-        print(f"\n📊 处理统计:")
-        print(f"   字幕条数: {srt_lines}")
-        print(f"   文章字数: {article_chars}")
-        
-        print("\n🎉 处理完成！")
-            
-    except Exception as e:
-        print(f"❌ 错误: {e}", file=sys.stderr)
-        if "获取字幕列表失败" in str(e) and not BILIBILI_COOKIES:
-            print("   提示: 这可能是因为未配置有效的Cookie导致的", file=sys.stderr)
-            print("   请在 .env 文件中配置Cookie", file=sys.stderr)
-        sys.exit(1)
+        if tracer.enabled and tracer.last_trace():
+            print(f"🧭 追踪结果: {tracer.last_trace()}.trace.json")
+
+    if batch:
+        print(
+            f"\n📦 批量处理完成: 成功 {len(args.urls) - len(failed)} 个, 失败 {len(failed)} 个"
+        )
+        for url in failed:
+            print(f"   ❌ {url}")
+
+    if not report_metrics:
+        return 1 if failed else 0
+
+    if batch or args.metrics:
+        print_metrics_summary()
+
+    if args.metrics_json:
+        with open(args.metrics_json, 'w', encoding='utf-8') as f:
+            json.dump(metrics.snapshot(), f, ensure_ascii=False, indent=2)
+        print(f"\n📈 性能指标已保存到: {args.metrics_json}")
+
+    return 1 if failed else 0
+
+
+def main() -> None:
+    """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    exit_code = run_urls(build_parser().parse_args())
+    if exit_code:
+        sys.exit(exit_code)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,290 @@
+"""
+性能指标
+记录各阶段耗时直方图和请求、错误、缓存命中、字节数等计数器
+Web服务通过 /metrics 以Prometheus文本格式输出，命令行批量处理结束后输出汇总表
+多进程部署时各进程定期把自己的指标写入共享状态，输出时合并所有进程的数据
+"""
+
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_CONFIG
+
+# 耗时直方图的桶上限（秒），与Prometheus客户端的默认值一致
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 指标说明，输出Prometheus格式时使用
+METRIC_HELP = {
+    "bilibili_request_seconds": ("histogram", "B站接口和字幕CDN的请求耗时"),
+    "bilibili_requests_total": ("counter", "B站接口和字幕CDN的请求次数"),
+    "bilibili_errors_total": (
+        "counter",
+        "请求失败次数，code为B站返回码、HTTP状态码或network",
+    ),
+    "bilibili_response_bytes_total": ("counter", "响应内容字节数"),
+    "cache_requests_total": ("counter", "各类缓存的命中（hit）和未命中（miss）次数"),
+    "stage_seconds": ("histogram", "格式化、保存等处理阶段的耗时"),
+    "rate_limit_wait_seconds": ("histogram", "等待跨进程限速令牌的时间"),
+    "writer_batch_seconds": ("histogram", "后台写入线程每批写入（含fsync）的耗时"),
+    "writer_bytes_total": ("counter", "后台写入线程写入磁盘的字节数"),
+}
+
+# 共享状态中保存各进程指标的键前缀
+SNAPSHOT_KEY_PREFIX = "metrics:"
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _label_key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """按固定桶统计的直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound),
+            len(self.buckets),
+        )
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """进程内的指标集合，线程安全"""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = METRICS_CONFIG["enabled"] if enabled is None else enabled
+        self._counters: Dict[LabelKey, float] = {}
+        self._histograms: Dict[LabelKey, Histogram] = {}
+        self._lock = threading.Lock()
+        self._published_at = 0.0
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        """增加计数器"""
+        if not self.enabled:
+            return
+        key = _label_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        self._maybe_publish()
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """向直方图中记录一个值"""
+        if not self.enabled:
+            return
+        key = _label_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+        self._maybe_publish()
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """记录代码块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels: Any) -> Callable:
+        """记录函数耗时的装饰器"""
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def snapshot(self) -> Dict[str, List[Any]]:
+        """导出当前进程的指标，格式可以JSON序列化"""
+        with self._lock:
+            return {
+                "counters": [
+                    [name, dict(labels), value]
+                    for (name, labels), value in self._counters.items()
+                ],
+                "histograms": [
+                    [
+                        name,
+                        dict(labels),
+                        list(h.buckets),
+                        list(h.counts),
+                        h.sum,
+                        h.count,
+                    ]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def _maybe_publish(self) -> None:
+        """按配置的间隔把本进程的指标写入共享状态"""
+        interval = METRICS_CONFIG["publish_interval"]
+        if interval <= 0 or time.monotonic() - self._published_at < interval:
+            return
+        self.publish()
+
+    def publish(self) -> None:
+        """把本进程的指标写入共享状态，供其他进程合并输出"""
+        self._published_at = time.monotonic()
+        try:
+            from shared_state import get_shared_state
+
+            get_shared_state().set(
+                f"{SNAPSHOT_KEY_PREFIX}{os.getpid()}",
+                self.snapshot(),
+                ttl=METRICS_CONFIG["snapshot_ttl"],
+            )
+        except Exception:
+            # 指标写入失败不能影响正常请求
+            pass
+
+    def collect(self) -> Dict[str, List[Any]]:
+        """合并所有进程的指标"""
+        self.publish()
+        from shared_state import get_shared_state
+
+        snapshots = [
+            value for _, value in get_shared_state().items(SNAPSHOT_KEY_PREFIX)
+        ]
+        return merge_snapshots(snapshots)
+
+
+def merge_snapshots(snapshots: List[Dict[str, List[Any]]]) -> Dict[str, List[Any]]:
+    """合并多个进程的指标快照"""
+    counters: Dict[LabelKey, float] = {}
+    histograms: Dict[LabelKey, List[Any]] = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("counters", []):
+            key = _label_key(name, labels)
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total, count in snapshot.get(
+            "histograms", []
+        ):
+            key = _label_key(name, labels)
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(buckets), list(counts), total, count]
+            else:
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+    return {
+        "counters": [
+            [name, dict(labels), value]
+            for (name, labels), value in sorted(counters.items())
+        ],
+        "histograms": [
+            [name, dict(labels), *values]
+            for (name, labels), values in sorted(histograms.items())
+        ],
+    }
+
+
+def _format_labels(
+    labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None
+) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        key
+        + '="'
+        + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        + '"'
+        for key, value in items
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus(snapshot: Dict[str, List[Any]]) -> str:
+    """把指标快照输出为Prometheus文本格式"""
+    lines: List[str] = []
+    described = set()
+
+    def describe(name: str, default_type: str) -> None:
+        if name in described:
+            return
+        described.add(name)
+        metric_type, help_text = METRIC_HELP.get(name, (default_type, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    for name, labels, value in snapshot["counters"]:
+        describe(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    for name, labels, buckets, counts, total, count in snapshot["histograms"]:
+        describe(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + [float("inf")], counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(
+                f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}"
+            )
+        lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def estimate_quantile(
+    buckets: List[float], counts: List[int], quantile: float
+) -> float:
+    """根据直方图估算分位数，返回所在桶的上限"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    target = quantile * total
+    cumulative = 0
+    for bound, bucket_count in zip(list(buckets) + [float("inf")], counts):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+    return float("inf")
+
+
+def summary_rows(snapshot: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """汇总耗时直方图，每个指标和标签组合一行"""
+    rows = []
+    for name, labels, buckets, counts, total, count in snapshot["histograms"]:
+        rows.append(
+            {
+                "name": name,
+                "labels": labels,
+                "count": count,
+                "avg": total / count if count else 0.0,
+                "p95": estimate_quantile(buckets, counts, 0.95),
+                "total": total,
+            }
+        )
+    return rows
+
+
+# 默认的进程内指标
+metrics = Metrics()
@@ -0,0 +1,130 @@
+"""
+字幕文本规范化
+获取字幕后、格式化之前统一字幕文本：全角字母数字转半角、繁体转简体、中文后的半角标点转全角、
+去掉多余的空白、合并重复的标点和语气词
+字符替换使用导入时构建好的str.translate表，其余规则合并为一个正则表达式，
+整条字幕的所有条目拼接后一次处理完成，不逐条调用
+"""
+
+import hashlib
+import json
+import re
+from typing import Any, Dict, List
+
+from config import NORMALIZE_CONFIG
+
+# 规则变化时修改，使已保存的规范化结果失效
+_RULES_VERSION = "1"
+
+# 拼接字幕条目时使用的分隔符，不会被任何规则匹配或删除
+_SEPARATOR = "\x00"
+
+# 常用繁体字与简体字，每两个字为一组
+_TRADITIONAL_PAIRS = (
+    "這这個个們们來来說说為为會会時时對对過过還还沒没麼么裡里裏里後后點点開开問问題题學学習习"
+    "書书體体電电腦脑機机網网頁页視视頻频經经濟济發发現现實实際际關关係系種种樣样讓让應应該该"
+    "長长從从動动將将兩两與与並并當当歡欢樂乐氣气東东車车門门見见聽听讀读寫写語语話话認认識识"
+    "記记設设計计論论請请謝谢錢钱買买賣卖號号業业務务報报導导師师員员園园國国圖图區区萬万億亿"
+    "幾几歲岁頭头飛飞馬马魚鱼鳥鸟龍龙風风雲云陽阳陰阴義义愛爱戰战爭争歷历傳传統统廣广場场聲声"
+    "變变邊边遠远運运進进選选連连達达轉转輕轻較较難难雙双權权歸归獨独燈灯熱热無无麵面處处壓压"
+    "廠厂簡简單单節节範范類类總总結结給给線线練练紅红級级約约細细終终組组維维綠绿續续產产質质"
+    "貨货費费資资賽赛購购覺觉觀观親亲規规覽览環环準准隨随險险隊队陸陆離离響响順顺須须預预領领"
+    "顏颜願愿飯饭館馆驗验鐘钟鐵铁錯错鍵键閱阅閉闭間间聞闻陣阵華华葉叶藝艺藥药蘭兰蟲虫術术衛卫"
+    "裝装製制複复標标樹树橋桥檢检歐欧殺杀滿满漢汉濃浓燒烧爾尔狀状獲获畫画盡尽監监碼码確确禮礼"
+    "穩稳積积筆笔築筑糧粮紀纪純纯紙纸絕绝絲丝綜综緊紧編编緣缘縣县織织聯联職职腳脚舊旧蘇苏補补"
+    "誰谁課课調调談谈證证護护讚赞豐丰貓猫負负財财責责貴贵貿贸趕赶軟软載载輸输辦办農农郵邮鄉乡"
+    "醫医釋释針针鋼钢錄录鏡镜閃闪陳陈隻只雞鸡雜杂靈灵靜静韓韩頂顶項项額额顯显飲饮養养騎骑驚惊"
+    "髮发鬧闹黃黄齊齐齒齿龜龟嗎吗於于講讲據据專专團团雖虽蓋盖則则剛刚劃划勞劳勢势協协參参圍围壞坏"
+    "夠够寶宝審审層层島岛帶带幫帮廳厅張张彈弹態态憶忆懷怀戲戏擇择擊击擴扩攝摄敗败數数斷断條条"
+    "極极構构樓楼決决況况減减測测溫温灣湾災灾爺爷牆墙獎奖異异療疗瘋疯盤盘眾众礎础稱称窮穷競竞"
+    "簽签絡络緒绪罰罚聖圣聰聪膚肤興兴舉举艱艰獻献蘋苹衝冲觸触訊讯訓训託托許许評评詞词試试詩诗"
+    "詳详誤误豬猪貝贝貧贫賞赏賠赔贏赢跡迹踐践躍跃辭辞適适遺遗鄰邻鎮镇隱隐飽饱驅驱麗丽檔档滾滚"
+)
+
+_CJK = "一-鿿"
+_CJK_OR_MARK = re.compile(f"[{_CJK}，。！？、；：…“”‘’（）《》]")
+_FULLWIDTH_MARKS = {",": "，", ".": "。", "!": "！", "?": "？", ";": "；", ":": "："}
+
+
+def _build_table() -> Dict[int, str]:
+    """按配置构建字符替换表"""
+    table: Dict[int, str] = {}
+    if NORMALIZE_CONFIG["halfwidth"]:
+        # 全角字母和数字（U+FF10-FF19、FF21-FF3A、FF41-FF5A）以及全角空格
+        for start, end in ((0xFF10, 0xFF19), (0xFF21, 0xFF3A), (0xFF41, 0xFF5A)):
+            for code in range(start, end + 1):
+                table[code] = chr(code - 0xFEE0)
+        table[0x3000] = " "
+    if NORMALIZE_CONFIG["simplified"]:
+        for traditional, simplified in zip(
+            _TRADITIONAL_PAIRS[0::2], _TRADITIONAL_PAIRS[1::2]
+        ):
+            table[ord(traditional)] = simplified
+    return table
+
+
+def _build_pattern() -> re.Pattern:
+    """把各项规则合并为一个正则表达式，按命名分组区分"""
+    rules = []
+    if NORMALIZE_CONFIG["punctuation"]:
+        rules.append(r"(?P<ellipsis>\.{3,}|。{3,}|…{2,})")
+        rules.append(f"(?P<mark>(?<=[{_CJK}])(?P<half>[,.!?;:])(?P=half)*(?!\\d))")
+        rules.append(r"(?P<repeat>(?P<repeated>[，！？、；])(?P=repeated)+)")
+    fillers = "|".join(re.escape(word) for word in NORMALIZE_CONFIG["fillers"])
+    if fillers:
+        rules.append(f"(?P<filler>(?P<first>{fillers})(?:[，、, ]*(?:{fillers}))+)")
+    rules.append(r"(?P<space>\s+)")
+    return re.compile("|".join(rules))
+
+
+_TABLE = _build_table()
+_PATTERN = _build_pattern()
+
+# 规范化规则和配置的摘要，保存在结果中，配置变化后已保存的结果不再使用
+VERSION = hashlib.sha1(
+    json.dumps([_RULES_VERSION, NORMALIZE_CONFIG], sort_keys=True).encode("utf-8")
+).hexdigest()[:12]
+
+
+def _replace(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind == "ellipsis":
+        return "…"
+    if kind == "mark":
+        return _FULLWIDTH_MARKS[match.group("half")]
+    if kind == "repeat":
+        return match.group("repeated")
+    if kind == "filler":
+        return match.group("first")
+    # 空白：中文之间删除，其他情况保留一个空格
+    text, start, end = match.string, match.start(), match.end()
+    before = text[start - 1] if start > 0 else ""
+    after = text[end] if end < len(text) else ""
+    if _CJK_OR_MARK.match(before) and _CJK_OR_MARK.match(after):
+        return ""
+    return " "
+
+
+def normalize_texts(texts: List[str]) -> List[str]:
+    """规范化多段文本，全部拼接后一次完成替换"""
+    if not texts:
+        return []
+    joined = _SEPARATOR.join(text.replace(_SEPARATOR, "") for text in texts)
+    joined = _PATTERN.sub(_replace, joined.translate(_TABLE))
+    return [text.strip() for text in joined.split(_SEPARATOR)]
+
+
+def normalize_subtitle(subtitle_data: Dict[str, Any]) -> Dict[str, Any]:
+    """规范化字幕JSON中所有条目的文本，返回新的字幕数据，normalized 字段为规则版本
+
+    未启用时原样返回
+    """
+    if not NORMALIZE_CONFIG["enabled"] or subtitle_data.get("normalized") == VERSION:
+        return subtitle_data
+    body = subtitle_data.get("body", [])
+    contents = normalize_texts([item.get("content", "") for item in body])
+    return dict(
+        subtitle_data,
+        normalized=VERSION,
+        body=[dict(item, content=content) for item, content in zip(body, contents)],
+    )
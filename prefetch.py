@@ -0,0 +1,186 @@
+"""
+预取
+网页中输入视频链接后，/api/preview 立即返回视频信息和可用的字幕语言，并在后台下载字幕内容；
+点击"获取字幕"时直接使用预取的结果，不再依次等待视频信息、字幕列表、字幕内容三个请求
+预取结果保存在共享状态中，多进程部署时任意进程预取的结果都可以使用
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import PREFETCH_CONFIG
+from metrics import metrics
+from shared_state import SharedState, get_shared_state
+
+
+def _content_key(subtitle: Dict[str, Any]) -> str:
+    """预取的字幕内容在共享状态中的键，没有字幕id时使用字幕地址的哈希"""
+    subtitle_id = str(subtitle.get("id_str") or subtitle.get("id") or "")
+    if not subtitle_id:
+        subtitle_id = hashlib.sha1(subtitle["subtitle_url"].encode("utf-8")).hexdigest()
+    return f"prefetch:content:{subtitle_id}"
+
+
+class Prefetcher:
+    """缓存字幕列表，并在后台线程中预先下载字幕内容"""
+
+    def __init__(
+        self,
+        state: Optional[SharedState] = None,
+        service_factory: Optional[Callable[[], Any]] = None,
+    ):
+        self._state = state
+        self._service_factory = service_factory
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_state(self) -> SharedState:
+        return self._state or get_shared_state()
+
+    def _new_service(self) -> Any:
+        if self._service_factory is not None:
+            return self._service_factory()
+        from bilibili_subtitle_service import BilibiliSubtitleService
+
+        return BilibiliSubtitleService()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """首次使用时创建线程池；fork之后线程不会被继承，需要重新创建"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(
+                    max_workers=PREFETCH_CONFIG["workers"],
+                    thread_name_prefix="prefetch",
+                )
+                self._pid = os.getpid()
+                self._inflight = {}
+            return self._executor
+
+    def subtitle_list(
+        self, service: Any, video_info: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """获取字幕列表，预览之后短时间内再次获取时使用缓存的结果"""
+        cache_key = f"prefetch:subtitles:{video_info['aid']}:{video_info['cid']}"
+        state = self._get_state()
+        if not service.refresh:
+            cached = state.get(cache_key)
+            if cached is not None:
+                metrics.inc("cache_requests_total", cache="subtitle_list", result="hit")
+                return cached
+            metrics.inc("cache_requests_total", cache="subtitle_list", result="miss")
+
+        subtitles = service.get_subtitle_list(video_info["aid"], video_info["cid"])
+        if subtitles:
+            state.set(cache_key, subtitles, ttl=PREFETCH_CONFIG["ttl"])
+        return subtitles
+
+    def preview(self, service: Any, url: str) -> Dict[str, Any]:
+        """获取视频信息和字幕列表，并在后台预取第一个字幕（点击获取字幕时使用的字幕）
+
+        Returns:
+            Dict: video_info、subtitles 和 prefetching（是否开始了后台预取）
+        """
+        video_info = service.get_video_info(url)
+        subtitles = self.subtitle_list(service, video_info)
+        prefetching = (
+            bool(subtitles)
+            and PREFETCH_CONFIG["enabled"]
+            and self.warm(video_info, subtitles[0])
+        )
+        return {
+            "video_info": video_info,
+            "subtitles": subtitles,
+            "prefetching": prefetching,
+        }
+
+    def warm(self, video_info: Dict[str, Any], subtitle: Dict[str, Any]) -> bool:
+        """在后台下载字幕内容，返回是否提交了下载
+
+        已经预取过、正在预取或已保存且字幕id未变化的字幕不重复下载
+        """
+        key = _content_key(subtitle)
+        if self._get_state().get(key) is not None:
+            return False
+
+        from transcript_store import get_store
+
+        store = get_store()
+        previous = store.previous_subtitle(video_info, subtitle) if store else None
+        subtitle_id = str(subtitle.get("id_str") or subtitle.get("id") or "")
+        if previous and subtitle_id and previous.get("subtitle_id") == subtitle_id:
+            return False
+
+        executor = self._get_executor()
+        with self._lock:
+            if key in self._inflight:
+                return False
+            future = executor.submit(self._fetch, key, subtitle)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._done(key))
+        return True
+
+    def _done(self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _fetch(self, key: str, subtitle: Dict[str, Any]) -> None:
+        try:
+            result = self._new_service().fetch_subtitle_content(
+                subtitle["subtitle_url"]
+            )
+            self._get_state().set(
+                key,
+                {
+                    "content": result["content"],
+                    "etag": result["etag"],
+                    "last_modified": result["last_modified"],
+                },
+                ttl=PREFETCH_CONFIG["ttl"],
+            )
+        except Exception as e:
+            # 预取失败不影响之后的正常获取
+            print(f"⚠️  预取字幕失败: {e}")
+
+    def subtitle_content(
+        self,
+        service: Any,
+        subtitle: Dict[str, Any],
+        previous: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """获取字幕内容，优先使用预取的结果，返回值与 get_subtitle_content_if_changed 相同
+
+        同一进程中的预取还在进行时等待其完成，避免重复下载
+        """
+        if service.refresh:
+            return service.get_subtitle_content_if_changed(subtitle, previous)
+
+        key = _content_key(subtitle)
+        with self._lock:
+            future = self._inflight.get(key) if self._pid == os.getpid() else None
+        if future is not None:
+            try:
+                future.result(timeout=PREFETCH_CONFIG["wait_timeout"])
+            except Exception:
+                pass
+
+        prefetched = self._get_state().get(key)
+        if prefetched is None:
+            metrics.inc("cache_requests_total", cache="prefetch", result="miss")
+            return service.get_subtitle_content_if_changed(subtitle, previous)
+
+        metrics.inc("cache_requests_total", cache="prefetch", result="hit")
+        return prefetched["content"], {
+            "subtitle_id": str(subtitle.get("id_str") or subtitle.get("id") or ""),
+            "etag": prefetched["etag"],
+            "last_modified": prefetched["last_modified"],
+            "changed": not previous or previous.get("content") != prefetched["content"],
+        }
+
+
+# 默认的预取器
+prefetcher = Prefetcher()
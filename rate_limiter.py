@@ -0,0 +1,56 @@
+"""
+跨进程共享限速
+同一台机器上的所有Web工作进程、命令行任务和队列工作进程共用一组令牌桶，
+api.bilibili.com 接口和字幕CDN分别限速，合计请求速率不会随进程数增加而超过配置
+令牌桶保存在共享状态数据库中（见shared_state.py）
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+from config import RATE_LIMIT_CONFIG
+from metrics import metrics
+from shared_state import SharedState, get_shared_state
+
+
+class SharedRateLimiter:
+    """保存在共享状态中的令牌桶限速器"""
+
+    def __init__(
+        self, name: str, rate: float, burst: float, state: Optional[SharedState] = None
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.state = state
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """取得令牌，额度不足时等待，返回等待的秒数"""
+        state = self.state or get_shared_state()
+        wait = state.reserve_tokens(
+            f"ratelimit:{self.name}", self.rate, self.burst, tokens
+        )
+        if wait > 0:
+            time.sleep(wait)
+        metrics.observe("rate_limit_wait_seconds", wait, bucket=self.name)
+        return wait
+
+
+_limiters: Dict[str, SharedRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(bucket: str) -> Optional[SharedRateLimiter]:
+    """返回指定令牌桶（'api' 或 'cdn'）的限速器，未启用限速时返回None"""
+    if not RATE_LIMIT_CONFIG["enabled"]:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(bucket)
+        if limiter is None:
+            limiter = _limiters[bucket] = SharedRateLimiter(
+                bucket,
+                RATE_LIMIT_CONFIG[f"{bucket}_rate"],
+                RATE_LIMIT_CONFIG[f"{bucket}_burst"],
+            )
+    return limiter
@@ -0,0 +1,171 @@
+"""
+跨进程共享状态
+基于SQLite的键值存储，支持过期时间和原子计数
+多个Web工作进程、命令行任务共享同一份缓存数据
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+from config import STATE_CONFIG
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SharedState:
+    """基于SQLite的跨进程键值存储，值以JSON保存"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or STATE_CONFIG["path"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接，不复用父进程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取值，不存在或已过期时返回default"""
+        row = (
+            self._connect()
+            .execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return default
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """写入值，ttl为过期秒数，不指定时永不过期"""
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._connect().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), expires_at),
+        )
+
+    def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        """返回键以prefix开头且未过期的所有键值"""
+        rows = (
+            self._connect()
+            .execute(
+                "SELECT key, value FROM kv WHERE substr(key, 1, ?) = ? "
+                "AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+                (len(prefix), prefix, time.time()),
+            )
+            .fetchall()
+        )
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """原子地增加计数并返回新值"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + amount
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, "
+                "NULL)",
+                (key, json.dumps(value)),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def reserve_tokens(
+        self, name: str, rate: float, capacity: float, tokens: float = 1.0
+    ) -> float:
+        """从共享令牌桶中预留令牌，返回调用方需要等待的秒数
+
+        令牌不足时仍然预留（余额变为负数），调用方等待返回的时间后再发送请求，
+        多个进程按预留的先后顺序依次获得额度，不会同时醒来争抢
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM buckets WHERE name = ?", (name,)
+            ).fetchone()
+            available = (
+                capacity
+                if row is None
+                else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            )
+            available -= tokens
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, "
+                "?, ?)",
+                (name, available, now),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return 0.0 if available >= 0 else -available / rate
+
+    def purge_expired(self) -> int:
+        """删除已过期的键，返回删除数量"""
+        return (
+            self._connect()
+            .execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            .rowcount
+        )
+
+
+_shared_state: Optional[SharedState] = None
+_shared_state_lock = threading.Lock()
+
+
+def get_shared_state() -> SharedState:
+    """返回默认的共享状态实例"""
+    global _shared_state
+    with _shared_state_lock:
+        if _shared_state is None:
+            _shared_state = SharedState()
+    return _shared_state
+
+
+# 视频库版本号，每次保存或删除视频时递增
+LIBRARY_GENERATION_KEY = "library:generation"
+
+
+def library_generation() -> int:
+    """返回当前视频库版本号"""
+    return get_shared_state().get(LIBRARY_GENERATION_KEY, 0)
+
+
+def bump_library_generation(*_: Any) -> int:
+    """视频库发生变化时调用，使各进程中依赖视频库的缓存失效"""
+    return get_shared_state().incr(LIBRARY_GENERATION_KEY)
@@ -0,0 +1,382 @@
+"""
+静态站点导出
+把视频库渲染为静态HTML页面和JSON数据，可以交给任意静态文件服务器，阅读时不需要运行Web服务
+搜索索引按词的哈希分成若干分片并预压缩，浏览器只加载查询词所在的分片
+导出目录中的 manifest.json 记录每个视频的内容指纹和索引词，再次导出时只重新渲染有变化的视频，
+只重写受影响的索引分片
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from background_writer import atomic_write_bytes
+from chapters import detect_chapters
+from config import SITE_CONFIG
+from http_cache import SIDECAR_SUFFIXES, write_precompressed_sidecars
+from keywords import _STOP_CHARS, _STOP_WORDS, extract_terms
+from transcript_cache import parse_srt
+
+TEMPLATE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "templates", "site"
+)
+
+# 输出格式变化时修改，使已导出的页面全部重新渲染
+_FORMAT_VERSION = "1"
+
+_VIDEO_URL = re.compile(r"^# Video URL: (\S+)", re.MULTILINE)
+
+
+def shard_of(term: str, shards: int) -> int:
+    """词所在的索引分片：按码位计算的32位FNV-1a哈希，浏览器中使用相同的算法"""
+    value = 0x811C9DC5
+    for char in term:
+        value ^= ord(char)
+        value = (value * 0x01000193) & 0xFFFFFFFF
+    return value % shards
+
+
+def _strip_header(text: str) -> str:
+    """去掉保存时添加的 # Video URL / # Video Title 信息行"""
+    lines = text.split("\n")
+    while lines and (lines[0].startswith("# ") or not lines[0].strip()):
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def iter_docs_site_videos(docs_dir: str = "docs") -> Iterator[Dict[str, Any]]:
+    """逐个读取docs目录中的视频"""
+    for item in sorted(os.listdir(docs_dir)) if os.path.isdir(docs_dir) else []:
+        video_dir = os.path.join(docs_dir, item)
+        contents = {}
+        for kind, name in (("srt", "srt.srt"), ("article", "article.txt")):
+            try:
+                with open(os.path.join(video_dir, name), "r", encoding="utf-8") as f:
+                    contents[kind] = f.read()
+            except OSError:
+                contents[kind] = ""
+        if not contents["srt"] and not contents["article"]:
+            continue
+        match = _VIDEO_URL.search(contents["srt"] or contents["article"])
+        yield {
+            "title": item,
+            "bvid": match.group(1).rstrip("/").rsplit("/", 1)[-1] if match else None,
+            "author": None,
+            "updated_at": max(
+                os.stat(os.path.join(video_dir, name)).st_mtime
+                for name in os.listdir(video_dir)
+                if name in ("srt.srt", "article.txt")
+            ),
+            "srt": contents["srt"],
+            "article": _strip_header(contents["article"]),
+        }
+
+
+def iter_store_site_videos() -> Iterator[Dict[str, Any]]:
+    """逐个读取字幕存储中的视频，每个视频使用最近更新的一条记录"""
+    from transcript_store import get_store
+
+    store = get_store()
+    if store is None:
+        raise Exception("字幕存储未启用，请使用 --source docs")
+    latest: Dict[str, Dict[str, Any]] = {}
+    for record in store.iter_entries():
+        latest[record["bvid"]] = record
+    for record in sorted(latest.values(), key=lambda r: (r["title"] or "", r["bvid"])):
+        yield {
+            "title": record["title"] or record["bvid"],
+            "bvid": record["bvid"],
+            "author": record["author"],
+            "updated_at": record["updated_at"],
+            "srt": store.get_content(record, "srt"),
+            "article": store.get_content(record, "article"),
+        }
+
+
+def _template_version() -> str:
+    """输出格式和模板的摘要，模板修改后全部页面重新渲染"""
+    digest = hashlib.sha1(_FORMAT_VERSION.encode("utf-8"))
+    for name in sorted(os.listdir(TEMPLATE_DIR)):
+        with open(os.path.join(TEMPLATE_DIR, name), "rb") as f:
+            digest.update(name.encode("utf-8") + f.read())
+    return digest.hexdigest()[:12]
+
+
+def _fingerprint(video: Dict[str, Any]) -> str:
+    fields = [video[key] for key in ("title", "bvid", "author", "srt", "article")]
+    return hashlib.sha1(
+        json.dumps(fields, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def _slug(video: Dict[str, Any], used: Set[str]) -> str:
+    """页面文件名：优先使用BV号，没有BV号或重复时使用标题的哈希"""
+    slug = (
+        video["bvid"]
+        if video["bvid"] and re.fullmatch(r"[A-Za-z0-9]+", video["bvid"])
+        else None
+    )
+    if not slug or slug in used:
+        slug = "v" + hashlib.sha1(video["title"].encode("utf-8")).hexdigest()[:12]
+    return slug
+
+
+def _article_blocks(article: str) -> List[Dict[str, str]]:
+    """把文章拆分为标题和段落，## 开头的行为章节标题"""
+    blocks = []
+    for part in article.split("\n\n"):
+        part = part.strip()
+        if not part:
+            continue
+        if part.startswith("## "):
+            blocks.append({"kind": "heading", "text": part[3:]})
+        else:
+            blocks.append({"kind": "paragraph", "text": part})
+    return blocks
+
+
+def _clock(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+class SiteExporter:
+    """增量导出静态站点"""
+
+    def __init__(self, output_dir: Optional[str] = None, shards: Optional[int] = None):
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+        self.output_dir = output_dir or SITE_CONFIG["output"]
+        self.shards = shards or SITE_CONFIG["shards"]
+        self.env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            autoescape=select_autoescape(["html"]),
+        )
+        self.env.filters["clock"] = _clock
+        self.manifest_path = os.path.join(self.output_dir, "manifest.json")
+
+    def _write(self, relative_path: str, content: str) -> None:
+        """原子写入文件并生成预压缩副本"""
+        path = os.path.join(self.output_dir, relative_path)
+        atomic_write_bytes(path, content.encode("utf-8"))
+        write_precompressed_sidecars(path, content)
+
+    def _remove(self, relative_path: str) -> None:
+        path = os.path.join(self.output_dir, relative_path)
+        for suffix in [""] + list(SIDECAR_SUFFIXES.values()):
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                pass
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _render_video(self, video: Dict[str, Any], slug: str) -> str:
+        cues = parse_srt(video["srt"])
+        return self.env.get_template("video.html").render(
+            video=video,
+            slug=slug,
+            video_url=(
+                f"https://www.bilibili.com/video/{video['bvid']}"
+                if video["bvid"]
+                else None
+            ),
+            chapters=detect_chapters(cues),
+            blocks=_article_blocks(video["article"]),
+            cues=cues,
+        )
+
+    def _load_shard(self, shard: int) -> Dict[str, List[List[int]]]:
+        try:
+            with open(
+                os.path.join(self.output_dir, "search", f"{shard}.json"),
+                "r",
+                encoding="utf-8",
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def export(
+        self, videos: Iterator[Dict[str, Any]], full: bool = False
+    ) -> Dict[str, int]:
+        """导出视频并更新搜索索引
+
+        Args:
+            videos: iter_docs_site_videos 或 iter_store_site_videos 返回的视频
+            full: 忽略上次导出的记录，重新渲染全部页面并重建索引
+
+        Returns:
+            Dict: rendered、unchanged、removed 视频数和重写的索引分片数 shards
+        """
+        version = _template_version()
+        manifest = self._load_manifest()
+        rebuild_index = full or manifest.get("shards") != self.shards
+        rerender = rebuild_index or manifest.get("version") != version
+        previous: Dict[str, Dict[str, Any]] = manifest.get("videos", {})
+        next_id = manifest.get("next_id", 0)
+
+        entries: Dict[str, Dict[str, Any]] = {}
+        library = []
+        # 有变化的视频的新索引词，以及需要从索引中移除的视频
+        added_terms: Dict[int, Counter] = {}
+        stale_ids: Set[int] = set()
+        dirty_shards: Set[int] = set(range(self.shards)) if rebuild_index else set()
+        summary = {"rendered": 0, "unchanged": 0, "removed": 0, "shards": 0}
+
+        used: Set[str] = set()
+        for video in videos:
+            slug = _slug(video, used)
+            used.add(slug)
+            fingerprint = _fingerprint(video)
+            old = previous.get(slug)
+            if old is not None:
+                video_id = old["id"]
+            else:
+                video_id, next_id = next_id, next_id + 1
+            entry = {
+                "id": video_id,
+                "fingerprint": fingerprint,
+                "terms": old["terms"] if old else [],
+            }
+
+            page = os.path.join("videos", f"{slug}.html")
+            changed = old is None or old["fingerprint"] != fingerprint
+            if (
+                changed
+                or rerender
+                or not os.path.exists(os.path.join(self.output_dir, page))
+            ):
+                self._write(page, self._render_video(video, slug))
+                summary["rendered"] += 1
+            else:
+                summary["unchanged"] += 1
+
+            if changed or rebuild_index:
+                terms = extract_terms(
+                    f"{video['title']} {video['article']}", segmenter="ngram"
+                )
+                added_terms[video_id] = terms
+                if old:
+                    stale_ids.add(video_id)
+                    dirty_shards.update(
+                        shard_of(term, self.shards) for term in old["terms"]
+                    )
+                dirty_shards.update(shard_of(term, self.shards) for term in terms)
+                entry["terms"] = sorted(terms)
+
+            entries[slug] = entry
+            library.append(
+                {
+                    "id": video_id,
+                    "slug": slug,
+                    "title": video["title"],
+                    "bvid": video["bvid"],
+                    "author": video["author"],
+                    "updated_at": int(video["updated_at"]),
+                }
+            )
+
+        for slug, old in previous.items():
+            if slug not in entries:
+                self._remove(os.path.join("videos", f"{slug}.html"))
+                stale_ids.add(old["id"])
+                dirty_shards.update(
+                    shard_of(term, self.shards) for term in old["terms"]
+                )
+                summary["removed"] += 1
+
+        # 只重写包含有变化的词的分片：移除旧的倒排记录，加入新的
+        for shard in sorted(dirty_shards):
+            postings = {} if rebuild_index else self._load_shard(shard)
+            if stale_ids:
+                for term in list(postings):
+                    postings[term] = [
+                        item for item in postings[term] if item[0] not in stale_ids
+                    ]
+                    if not postings[term]:
+                        del postings[term]
+            for video_id, terms in added_terms.items():
+                for term, count in terms.items():
+                    if shard_of(term, self.shards) == shard:
+                        postings.setdefault(term, []).append([video_id, count])
+            self._write(
+                os.path.join("search", f"{shard}.json"),
+                json.dumps(
+                    postings, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+                ),
+            )
+            summary["shards"] += 1
+        # 分片数减少后删除多余的分片
+        for shard in range(self.shards, manifest.get("shards") or 0):
+            self._remove(os.path.join("search", f"{shard}.json"))
+
+        self._write(
+            "library.json",
+            json.dumps(
+                {
+                    "shards": self.shards,
+                    "videos": library,
+                },
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ),
+        )
+        self._write(
+            "index.html",
+            self.env.get_template("index.html").render(
+                count=len(library),
+                stop_chars="".join(sorted(_STOP_CHARS)),
+                stop_words=sorted(_STOP_WORDS),
+            ),
+        )
+        # 清单最后写入，中途失败时下次导出会重新处理
+        self._write_manifest(
+            {
+                "version": version,
+                "shards": self.shards,
+                "next_id": next_id,
+                "videos": entries,
+            }
+        )
+        return summary
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        atomic_write_bytes(
+            self.manifest_path,
+            json.dumps(manifest, ensure_ascii=False, separators=(",", ":")).encode(
+                "utf-8"
+            ),
+        )
+
+
+def export_site(
+    output_dir: Optional[str] = None,
+    source: str = "docs",
+    docs_dir: str = "docs",
+    full: bool = False,
+) -> Dict[str, int]:
+    """把视频库导出为静态站点
+
+    Args:
+        output_dir: 输出目录
+        source: 'docs'（docs目录）或 'store'（字幕存储，包含作者信息）
+        docs_dir: source为docs时读取的目录
+        full: 重新渲染全部页面并重建索引
+    """
+    videos = (
+        iter_store_site_videos()
+        if source == "store"
+        else iter_docs_site_videos(docs_dir)
+    )
+    return SiteExporter(output_dir).export(videos, full)
@@ -3,36 +3,84 @@
 Web服务启动脚本
 """
 
+import argparse
 import os
 import sys
-from web_interface import app
+
+from config import SERVER_CONFIG
 
 def main():
+    parser = argparse.ArgumentParser(description="启动 Bilibili 字幕获取 Web 服务")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        default=os.getenv('WEB_MODE', '') == 'production',
+        help="使用多进程、多线程的生产环境服务，而不是Flask开发服务器",
+    )
+    parser.add_argument("--host", default=SERVER_CONFIG['host'], help="监听地址")
+    parser.add_argument(
+        "--port", type=int, default=SERVER_CONFIG['port'], help="监听端口"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_CONFIG['workers'],
+        help="工作进程数（生产模式）",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=SERVER_CONFIG['threads'],
+        help="每个工作进程的线程数（生产模式）",
+    )
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help="不在fork前预加载应用，由每个工作进程各自加载（生产模式）",
+    )
+    args = parser.parse_args()
+
     print("🚀 启动 Bilibili 字幕获取 Web 服务")
     print("=" * 50)
-    
+
     # 检查Cookie配置
-    from config import BILIBILI_COOKIES
-    if not BILIBILI_COOKIES:
+    from config import BILIBILI_COOKIE_POOL
+
+    if not BILIBILI_COOKIE_POOL:
         print("⚠️  警告: 未配置Cookie，请在.env文件中配置BILIBILI_COOKIES")
         print("   参考 COOKIE_SETUP.md 了解如何获取Cookie")
     else:
-        print("✅ Cookie配置已加载")
-    
+        print(f"✅ Cookie配置已加载，共 {len(BILIBILI_COOKIE_POOL)} 个账号")
+
     print()
-    print("📱 Web界面地址: http://localhost:8080")
+    print(f"📱 Web界面地址: http://localhost:{args.port}")
     print("🛑 按 Ctrl+C 停止服务")
     print("=" * 50)
-    
+
     # 确保必要目录存在
     os.makedirs('docs', exist_ok=True)
     os.makedirs('templates', exist_ok=True)
-    
+
+    if args.production:
+        from wsgi_server import serve
+
+        serve(
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            threads=args.threads,
+            preload=not args.no_preload,
+        )
+        print("🛑 服务已停止")
+        return
+
+    from web_interface import app
+
     try:
-        app.run(debug=True, host='0.0.0.0', port=8080)
+        app.run(debug=True, host=args.host, port=args.port)
     except KeyboardInterrupt:
         print("\n🛑 服务已停止")
         sys.exit(0)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -10,13 +10,13 @@ from bilibili_subtitle_service import BilibiliSubtitleService
 def test_extract_video_id():
     """测试视频ID提取功能"""
     service = BilibiliSubtitleService()
-    
+
     test_cases = [
         ("https://www.bilibili.com/video/BV1bK411W7t8", {'type': 'bvid', 'id': 'BV1bK411W7t8'}),
         ("https://www.bilibili.com/video/av12345", {'type': 'aid', 'id': 12345}),
         ("https://www.bilibili.com/list/watchlater?bvid=BV1bK411W7t8&oid=123", {'type': 'bvid', 'id': 'BV1bK411W7t8'}),
     ]
-    
+
     print("测试视频ID提取功能:")
     for url, expected in test_cases:
         try:
@@ -28,29 +28,1211 @@ def test_extract_video_id():
     print()
 
 
+def test_av_bv_conversion():
+    """测试av号与BV号的本地转换"""
+    from video_id import av_to_bv, bv_to_av
+
+    test_cases = [
+        (170001, "BV17x411w7KC"),
+        (80433022, "BV1GJ411x7h7"),
+    ]
+
+    print("测试av号与BV号转换:")
+    for aid, bvid in test_cases:
+        ok = av_to_bv(aid) == bvid and bv_to_av(bvid) == aid
+        print(f"  {'✅' if ok else '❌'} av{aid} <-> {bvid}")
+        assert ok
+    print()
+
+
+def test_wbi_sign():
+    """测试WBI签名"""
+    from wbi import get_mixin_key, sign_params
+
+    img_key = "7cd084941338484aae1ad9425b84077c"
+    sub_key = "4932caff0ff746eab6f01bf08b70ac45"
+    signed = sign_params(
+        {'foo': '114', 'bar': '514', 'zab': 1919810}, img_key, sub_key, wts=1702204169
+    )
+
+    print("测试WBI签名:")
+    checks = [
+        (
+            "mixin_key",
+            get_mixin_key(img_key, sub_key) == "ea1db124af3c7062474693fa704f4ff8",
+        ),
+        ("w_rid", signed['w_rid'] == "8f6f2b5b3d485fe1886cec6a0be8c5d4"),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
 def test_time_conversion():
     """测试时间转换功能"""
     service = BilibiliSubtitleService()
-    
+
     test_cases = [
         (0, "00:00:00,000", "00:00"),
         (61.5, "00:01:01,500", "01:01"),
         (3661.123, "01:01:01,123", "61:01"),
     ]
-    
+
     print("测试时间转换功能:")
     for seconds, expected_srt, expected_readable in test_cases:
         srt_result = service._seconds_to_srt_time(seconds)
         readable_result = service._seconds_to_readable_time(seconds)
-        
+
         srt_status = "✅" if srt_result == expected_srt else "❌"
         readable_status = "✅" if readable_result == expected_readable else "❌"
-        
+
         print(f"  {srt_status} {seconds}s -> SRT: {srt_result} (期望: {expected_srt})")
         print(f"  {readable_status} {seconds}s -> 可读: {readable_result} (期望: {expected_readable})")
     print()
 
 
+def test_normalize():
+    """测试字幕文本规范化及保存结果的复用"""
+    import os
+    import tempfile
+    from bilibili_subtitle_service import BilibiliSubtitleService
+    from normalize import normalize_texts
+    from transcript_store import TranscriptStore
+
+    print("测试文本规范化:")
+    texts = normalize_texts(
+        [
+            '這個 問題 很重要,我們來看',
+            '嗯嗯，呃 今天用ＧＰＵ　訓練...',
+            '价格是3.5元!!!',
+            'Hello,  world.',
+        ]
+    )
+    raw = {'body': [{'from': 0.0, 'to': 1.0, 'content': '這個問題,,很重要'}]}
+    service = BilibiliSubtitleService.__new__(BilibiliSubtitleService)
+    normalized = service.normalize_subtitle(raw)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TranscriptStore(os.path.join(tmp, 'store'), compression='gzip')
+        video_info = {
+            'bvid': 'BV1xx411c7mD',
+            'aid': 1,
+            'cid': 2,
+            'title': '测试',
+            'author': '作者',
+        }
+        store.put(video_info, {'lan': 'zh-CN'}, raw, '', '', None, normalized)
+        previous = store.previous_subtitle(video_info, {'lan': 'zh-CN'})
+        reused = service.normalize_subtitle(previous['content'], previous)
+    checks = [
+        ("繁体转简体并删除中文之间的空格", texts[0] == '这个问题很重要，我们来看'),
+        ("合并语气词、全角转半角、省略号", texts[1] == '嗯今天用GPU 训练…'),
+        ("中文后的标点转全角，数字中的小数点不变", texts[2] == '价格是3.5元！'),
+        ("英文只合并空白", texts[3] == 'Hello, world.'),
+        (
+            "规范化字幕条目",
+            normalized['body'][0]['content'] == '这个问题，很重要'
+            and raw['body'][0]['content'] == '這個問題,,很重要',
+        ),
+        ("复用已保存的结果", reused == normalized and reused is previous['normalized']),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_transcript_cache():
+    """测试按字节限制容量的LRU缓存"""
+    from transcript_cache import ByteLRUCache, parse_srt
+
+    print("测试字幕内容缓存:")
+    cache = ByteLRUCache(max_bytes=100)
+    cache.put('a', 1, 'A', 60)
+    cache.put('b', 1, 'B', 30)
+    cache.get('a', 1)
+    cache.put('c', 1, 'C', 30)  # 超出容量，淘汰最久未使用的b
+
+    checks = [
+        (
+            "淘汰最久未使用的条目",
+            cache.get('b', 1) is None and cache.get('a', 1) == 'A',
+        ),
+        ("版本变化视为未命中", cache.get('c', 2) is None),
+        ("容量统计", cache.stats()['current_bytes'] == 60),
+        (
+            "解析SRT",
+            parse_srt("1\n00:00:01,500 --> 00:00:02,000\n你好\n")
+            == [{'from': 1.5, 'to': 2.0, 'content': '你好'}],
+        ),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_metrics():
+    """测试性能指标的合并和Prometheus格式输出"""
+    from metrics import Metrics, merge_snapshots, render_prometheus
+
+    print("测试性能指标:")
+    first, second = Metrics(enabled=True), Metrics(enabled=True)
+    first.inc('bilibili_requests_total', endpoint='view')
+    second.inc('bilibili_requests_total', 2, endpoint='view')
+    first.observe('stage_seconds', 0.02, stage='format_subtitle')
+    second.observe('stage_seconds', 3.0, stage='format_subtitle')
+    text = render_prometheus(merge_snapshots([first.snapshot(), second.snapshot()]))
+
+    checks = [
+        ("合并多个进程的计数", 'bilibili_requests_total{endpoint="view"} 3' in text),
+        (
+            "直方图累计桶",
+            'stage_seconds_bucket{stage="format_subtitle",le="0.025"} 1' in text,
+        ),
+        (
+            "直方图+Inf桶",
+            'stage_seconds_bucket{stage="format_subtitle",le="+Inf"} 2' in text,
+        ),
+        ("直方图计数", 'stage_seconds_count{stage="format_subtitle"} 2' in text),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_background_writer():
+    """测试后台写入在fsync失败时的处理"""
+    import os
+    import tempfile
+    from unittest import mock
+    from background_writer import BackgroundWriter
+
+    print("测试后台写入:")
+    real_fsync = os.fsync
+    failures = []
+
+    def flaky_fsync(fd):
+        # 第一次同步失败，模拟磁盘错误
+        if not failures:
+            failures.append(fd)
+            raise OSError(5, 'Input/output error')
+        return real_fsync(fd)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = BackgroundWriter(batch_size=10, flush_interval=0.2, enabled=True)
+        first, second = os.path.join(tmp, 'a.txt'), os.path.join(tmp, 'b.txt')
+        with mock.patch('os.fsync', side_effect=flaky_fsync):
+            writer.submit(first, '第一个文件')
+            writer.submit(second, '第二个文件')
+            writer.flush()
+        # 写入线程仍在运行，之后的任务可以完成
+        writer.submit(first, '重新写入')
+        writer.flush()
+        with open(first, encoding='utf-8') as f:
+            rewritten = f.read()
+        writer.submit(second, '屏障之前')
+        reached = writer.barrier(timeout=5)
+        with open(second, encoding='utf-8') as f:
+            before_barrier = f.read()
+        leftovers = [name for name in os.listdir(tmp) if name.endswith('.tmp')]
+        writer.close()
+        checks = [
+            ("注入了fsync失败", len(failures) == 1),
+            ("记录错误", writer.errors == 1),
+            ("其他文件正常写入", os.path.exists(second)),
+            ("不留下临时文件", not leftovers),
+            ("写入线程继续工作", rewritten == '重新写入'),
+            ("屏障等待此前的写入", reached and before_barrier == '屏障之前'),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_shared_rate_limiter():
+    """测试使用同一状态文件的两个限速器共用一个令牌桶"""
+    import os
+    import tempfile
+    from unittest import mock
+    from rate_limiter import SharedRateLimiter
+    from shared_state import SharedState
+
+    print("测试跨进程限速:")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'shared.sqlite3')
+        # 两个实例各自连接同一个数据库文件，相当于两个进程
+        first = SharedRateLimiter('api', rate=10, burst=2, state=SharedState(path))
+        second = SharedRateLimiter('api', rate=10, burst=2, state=SharedState(path))
+        other = SharedRateLimiter('cdn', rate=10, burst=2, state=SharedState(path))
+        with mock.patch('time.sleep'):
+            waits = [
+                first.acquire(),
+                second.acquire(),
+                first.acquire(),
+                second.acquire(),
+            ]
+            other_wait = other.acquire()
+    checks = [
+        ("突发额度由两个实例共用", waits[:2] == [0.0, 0.0]),
+        ("额度用完后按顺序等待", 0.05 < waits[2] < waits[3] < 0.25),
+        ("不同令牌桶互不影响", other_wait == 0.0),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_work_queue():
+    """测试任务队列的领取、确认和租约过期后重新领取"""
+    import os
+    import tempfile
+    from work_queue import WorkQueue
+
+    print("测试任务队列:")
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = WorkQueue(os.path.join(tmp, 'queue.sqlite3'))
+        queue.enqueue(['url-a', 'url-b', 'url-a'])
+        first = queue.claim('worker-1')
+        second = queue.claim('worker-2')
+
+        # 模拟worker-1崩溃：租约过期后任务可以被重新领取
+        queue.visibility_timeout = 0
+        queue.extend(first['id'], 'worker-1')
+        reclaimed = queue.claim('worker-2')
+
+        # 续约时的心跳不能覆盖主循环登记的完成数
+        queue.heartbeat('worker-2', 3, 1)
+        queue.heartbeat('worker-2')
+        counters = tuple(
+            queue._connect()
+            .execute(
+                "SELECT jobs_done, jobs_failed FROM workers "
+                "WHERE worker_id = 'worker-2'"
+            )
+            .fetchone()
+        )
+
+        checks = [
+            (
+                "相同链接只入队一次",
+                queue.stats()['pending'] + queue.stats()['leased'] == 2,
+            ),
+            ("不同进程领取不同任务", first['url'] != second['url']),
+            (
+                "租约过期后重新领取",
+                reclaimed is not None and reclaimed['id'] == first['id'],
+            ),
+            ("原进程不能确认已被接手的任务", not queue.ack(first['id'], 'worker-1')),
+            ("新进程确认任务", queue.ack(reclaimed['id'], 'worker-2')),
+            ("心跳保留完成和失败数", counters == (3, 1)),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_dedupe():
+    """测试MinHash近似重复检测"""
+    import os
+    import tempfile
+    from dedupe import DedupeIndex
+
+    print("测试近似重复检测:")
+    sentences = [
+        f"第{i}段字幕讲的是第{i * 7 % 13}个知识点和相关的例子" for i in range(200)
+    ]
+    original = ' '.join(sentences)
+    clip = ' '.join(sentences[:190])
+    unrelated = ' '.join(f"另一个视频的内容编号{i}与前面完全不同" for i in range(200))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = DedupeIndex(os.path.join(tmp, 'dedupe.sqlite3'))
+        index.add('原视频', original)
+        index.add('无关视频', unrelated)
+        matches = index.add('剪辑版', clip)
+        checks = [
+            ("发现近似重复", [match['doc'] for match in matches] == ['原视频']),
+            ("双向记录", index.duplicates_of('原视频')[0]['doc'] == '剪辑版'),
+            ("无关视频不重复", index.duplicates_of('无关视频') == []),
+            ("分组", index.groups() == [['剪辑版', '原视频']]),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_keywords():
+    """测试增量维护的TF-IDF关键词和相关视频"""
+    import os
+    import tempfile
+    from config import KEYWORDS_CONFIG
+    from keywords import KeywordIndex, extract_terms
+
+    print("测试关键词索引:")
+    segmenter = KEYWORDS_CONFIG['segmenter']
+    KEYWORDS_CONFIG['segmenter'] = 'ngram'
+    try:
+        texts = {
+            '神经网络入门': "神经网络由很多神经元组成 训练神经网络需要梯度下降 今天我们讲反向传播",
+            '梯度下降详解': "梯度下降是训练模型的方法 学习率决定梯度下降的步长 反向传播计算梯度",
+            '红烧肉做法': "红烧肉需要五花肉和冰糖 先把五花肉焯水 再小火慢炖红烧肉",
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            index = KeywordIndex(os.path.join(tmp, 'keywords.sqlite3'))
+            for doc, text in texts.items():
+                index.add(doc, text)
+            related = index.related('神经网络入门')
+            index.remove('梯度下降详解')
+            df_after_remove = dict(index._connect().execute('SELECT term, df FROM df'))
+
+            fresh = KeywordIndex(os.path.join(tmp, 'fresh.sqlite3'))
+            fresh.add('神经网络入门', texts['神经网络入门'])
+            fresh.add('红烧肉做法', texts['红烧肉做法'])
+            checks = [
+                (
+                    "提取二元组和英文单词",
+                    extract_terms("我们学习Python的梯度 the")
+                    == {'python': 1, '学习': 1, '梯度': 1},
+                ),
+                (
+                    "关键词",
+                    index.keywords_of('红烧肉做法')[0][0]
+                    in ('红烧', '烧肉', '五花', '花肉'),
+                ),
+                (
+                    "相关视频",
+                    [item['doc'] for item in related] == ['梯度下降详解']
+                    and '梯度' in related[0]['shared'],
+                ),
+                (
+                    "删除后减少文档频率",
+                    df_after_remove
+                    == dict(fresh._connect().execute('SELECT term, df FROM df')),
+                ),
+                ("删除后不再相关", index.related('神经网络入门') == []),
+            ]
+    finally:
+        KEYWORDS_CONFIG['segmenter'] = segmenter
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_library_stats():
+    """测试增量维护的视频库统计"""
+    import os
+    import tempfile
+    from library_stats import LibraryStats, transcript_stats
+
+    print("测试视频库统计:")
+    srt = (
+        "1\n00:00:00,000 --> 00:00:30,000\n第一句字幕\n\n"
+        "2\n00:00:30,000 --> 00:01:00,000\n第二句\n"
+    )
+    fields = transcript_stats(srt)
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = LibraryStats(os.path.join(tmp, 'stats.sqlite3'))
+        stats.record('视频A', **fields)
+        stats.record('视频A', author='作者甲', language='zh-CN')
+        stats.record(
+            '视频B', author='作者甲', language='ai-zh', seconds=3540, chars=100, cues=10
+        )
+        stats.record(
+            '视频C', author='作者乙', language='zh-CN', seconds=60, chars=5, cues=1
+        )
+        # 重新获取字幕后只更新变化的字段
+        stats.record('视频C', seconds=120)
+        stats.remove('视频C')
+        summary = stats.summary(days=7)
+
+        fresh = LibraryStats(os.path.join(tmp, 'fresh.sqlite3'))
+        fresh.record('视频A', author='作者甲', language='zh-CN', **fields)
+        fresh.record(
+            '视频B', author='作者甲', language='ai-zh', seconds=3540, chars=100, cues=10
+        )
+        checks = [
+            ("解析字幕", fields == {'seconds': 60.0, 'chars': 8, 'cues': 2}),
+            (
+                "总数",
+                (summary['videos'], summary['hours'], summary['characters'])
+                == (2, 1.0, 108),
+            ),
+            (
+                "作者",
+                summary['author_count'] == 1
+                and summary['authors'] == [{'author': '作者甲', 'videos': 2}],
+            ),
+            (
+                "语言",
+                sorted(item['language'] for item in summary['languages'])
+                == ['ai-zh', 'zh-CN'],
+            ),
+            (
+                "入库数量",
+                len(summary['ingestion']) == 7
+                and summary['ingestion'][-1]['videos'] == 2,
+            ),
+            ("增量更新与重建一致", summary == fresh.summary(days=7)),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_chunker():
+    """测试按句子对齐、相互重叠的分块"""
+    from chunker import chunk_segments
+
+    print("测试知识库分块:")
+    segments = [
+        {
+            'from': i * 10.0,
+            'to': i * 10.0 + 10,
+            'content': f"第{i:02d}句话。第{i:02d}句补充。",
+        }
+        for i in range(20)
+    ]
+    chunks = chunk_segments(segments, max_chars=40, overlap_chars=8)
+    checks = [
+        ("不超过最大字数", all(len(chunk['text']) <= 40 for chunk in chunks)),
+        ("按句子切分", all(chunk['text'].endswith('。') for chunk in chunks)),
+        ("相邻块重叠", chunks[1]['text'][:7] in chunks[0]['text']),
+        ("时间范围", chunks[0]['start'] == 0.0 and chunks[-1]['end'] == 200.0),
+        ("时间按字数插值", chunks[1]['start'] == 24.615),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_chapters():
+    """测试按词汇连贯性切分章节"""
+    from bilibili_subtitle_service import BilibiliSubtitleService
+    from chapters import detect_chapters
+
+    print("测试章节切分:")
+    topics = [
+        ['神经网络', '反向传播', '梯度下降', '激活函数'],
+        ['红烧肉', '五花肉', '冰糖', '焯水'],
+        ['量子力学', '波函数', '薛定谔', '叠加态'],
+    ]
+    body = []
+    for t, words in enumerate(topics):
+        for i in range(120):
+            start = (t * 120 + i) * 3.0
+            body.append(
+                {
+                    'from': start,
+                    'to': start + 2.5,
+                    'content': f"这里讲{words[i % 4]}和{words[(i + 1) % 4]}",
+                }
+            )
+    chapters = detect_chapters(body)
+    article = BilibiliSubtitleService.__new__(
+        BilibiliSubtitleService
+    ).format_as_article({'body': body})
+    checks = [
+        ("切分为三章", len(chapters) == 3),
+        (
+            "边界接近话题切换处",
+            [
+                abs(chapter['start_cue'] - 120 * i) <= 20
+                for i, chapter in enumerate(chapters)
+            ]
+            == [True] * 3,
+        ),
+        (
+            "章节覆盖全部字幕",
+            chapters[0]['start_cue'] == 0 and chapters[-1]['end_cue'] == len(body),
+        ),
+        (
+            "标题来自本章内容",
+            '红烧肉' in chapters[1]['title'] or '五花肉' in chapters[1]['title'],
+        ),
+        (
+            "文章包含章节标题",
+            article.startswith('## 00:00 ') and article.count('\n## ') == 2,
+        ),
+        ("短视频不切分", detect_chapters(body[:40]) == []),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_export_site():
+    """测试增量导出静态站点"""
+    import json
+    import os
+    import shutil
+    import tempfile
+    from site_export import SiteExporter, iter_docs_site_videos, shard_of
+
+    print("测试静态站点导出:")
+
+    def save(docs, title, bvid, text):
+        os.makedirs(os.path.join(docs, title), exist_ok=True)
+        with open(os.path.join(docs, title, 'srt.srt'), 'w', encoding='utf-8') as f:
+            f.write(
+                f"# Video URL: https://www.bilibili.com/video/{bvid}\n"
+                f"1\n00:00:01,000 --> 00:00:05,000\n{text}\n"
+            )
+        with open(os.path.join(docs, title, 'article.txt'), 'w', encoding='utf-8') as f:
+            f.write(
+                f"# Video URL: https://www.bilibili.com/video/{bvid}\n"
+                f"# Video Title: {title}\n\n{text}"
+            )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        docs, output = os.path.join(tmp, 'docs'), os.path.join(tmp, 'site')
+        save(docs, '量子计算入门', 'BV1aa411111a', '量子比特可以处于叠加态')
+        save(docs, '机器学习<基础>', 'BV1bb411111b', '梯度下降是常用的优化方法')
+        exporter = SiteExporter(output, shards=8)
+        first = exporter.export(iter_docs_site_videos(docs))
+
+        save(docs, '量子计算入门', 'BV1aa411111a', '量子纠缠是一种关联')
+        second = exporter.export(iter_docs_site_videos(docs))
+        with open(
+            os.path.join(output, 'search', f"{shard_of('纠缠', 8)}.json"),
+            encoding='utf-8',
+        ) as f:
+            postings = json.load(f)
+        with open(
+            os.path.join(output, 'search', f"{shard_of('叠加', 8)}.json"),
+            encoding='utf-8',
+        ) as f:
+            stale = json.load(f)
+        with open(
+            os.path.join(output, 'videos', 'BV1bb411111b.html'), encoding='utf-8'
+        ) as f:
+            page = f.read()
+
+        shutil.rmtree(os.path.join(docs, '量子计算入门'))
+        third = exporter.export(iter_docs_site_videos(docs))
+        with open(os.path.join(output, 'library.json'), encoding='utf-8') as f:
+            library = json.load(f)
+        checks = [
+            ("首次导出", first['rendered'] == 2 and first['shards'] == 8),
+            (
+                "只重新渲染变化的视频",
+                (second['rendered'], second['unchanged']) == (1, 1),
+            ),
+            ("索引包含新词", '纠缠' in postings and postings['纠缠'][0][1] == 1),
+            ("索引移除旧词", '叠加' not in stale),
+            ("页面转义标题", '机器学习&lt;基础&gt;' in page),
+            (
+                "删除视频",
+                third['removed'] == 1
+                and not os.path.exists(
+                    os.path.join(output, 'videos', 'BV1aa411111a.html')
+                ),
+            ),
+            (
+                "视频列表",
+                [video['slug'] for video in library['videos']] == ['BV1bb411111b'],
+            ),
+            ("预压缩副本", os.path.exists(os.path.join(output, 'library.json.gz'))),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_negative_cache():
+    """测试"视频不存在"和"没有字幕"结果的缓存、过期，以及未登录时不缓存"""
+    import os
+    import tempfile
+    import time
+    from unittest import mock
+    from bilibili_subtitle_service import BilibiliSubtitleService
+    from config import NEGATIVE_CACHE_CONFIG
+    from shared_state import SharedState
+
+    print("测试失败结果缓存:")
+    requests_made = []
+
+    def view_response(api_url):
+        requests_made.append('view')
+        return mock.Mock(json=lambda: {'code': -404, 'message': '啥都木有'})
+
+    def player_response(api_url, params):
+        requests_made.append(f"player:{params['cid']}")
+        return {'code': 0, 'data': {'subtitle': {'subtitles': []}}}
+
+    def attempts(func, *args):
+        # 返回调用是否请求了接口
+        count = len(requests_made)
+        try:
+            func(*args)
+        except Exception:
+            pass
+        return len(requests_made) > count
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SharedState(os.path.join(tmp, 'shared.sqlite3'))
+        service = BilibiliSubtitleService(
+            cookies={'SESSDATA': 'test'}, metadata_cache=cache
+        )
+        anonymous = BilibiliSubtitleService(metadata_cache=cache)
+        anonymous.has_cookies = False
+        with (
+            mock.patch.object(
+                BilibiliSubtitleService, '_api_get', side_effect=view_response
+            ),
+            mock.patch.object(
+                BilibiliSubtitleService, '_wbi_get', side_effect=player_response
+            ),
+        ):
+            missing = [
+                attempts(service.get_video_info_by_bvid, 'BV1bK411W7t8')
+                for _ in range(2)
+            ]
+            no_subtitle = [attempts(service.get_subtitle_list, 1, 2) for _ in range(2)]
+            anonymous_calls = [
+                attempts(anonymous.get_subtitle_list, 1, 3) for _ in range(2)
+            ]
+
+            # 超过缓存时间后重新请求
+            later = (
+                time.time()
+                + max(
+                    NEGATIVE_CACHE_CONFIG['not_found_ttl'],
+                    NEGATIVE_CACHE_CONFIG['no_subtitle_ttl'],
+                )
+                + 1
+            )
+            with mock.patch('time.time', return_value=later):
+                expired = [
+                    attempts(service.get_video_info_by_bvid, 'BV1bK411W7t8'),
+                    attempts(service.get_subtitle_list, 1, 2),
+                ]
+    checks = [
+        ("视频不存在时缓存", missing == [True, False]),
+        ("没有字幕时缓存", no_subtitle == [True, False]),
+        ("未登录时不缓存没有字幕", anonymous_calls == [True, True]),
+        ("过期后重新请求", expired == [True, True]),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_prefetch():
+    """测试预览后后台预取字幕，获取字幕时不再重复请求"""
+    import os
+    import tempfile
+    from prefetch import Prefetcher
+    from shared_state import SharedState
+
+    print("测试字幕预取:")
+    requests_made = []
+
+    class StubService:
+        refresh = False
+
+        def get_video_info(self, url):
+            requests_made.append('view')
+            return {
+                'aid': 1,
+                'cid': 2,
+                'bvid': 'BV1bK411W7t8',
+                'title': '预取测试',
+                'author': 'up',
+                'pages': [],
+            }
+
+        def get_subtitle_list(self, aid, cid):
+            requests_made.append('subtitles')
+            return [
+                {
+                    'lan': 'zh',
+                    'lan_doc': '中文',
+                    'subtitle_url': '//cdn/a.json',
+                    'id_str': 'prefetch-test',
+                }
+            ]
+
+        def fetch_subtitle_content(self, url):
+            requests_made.append('content')
+            return {
+                'content': {'body': [{'from': 0, 'to': 1, 'content': '你好'}]},
+                'etag': '"a"',
+                'last_modified': None,
+            }
+
+        def get_subtitle_content_if_changed(self, subtitle, previous=None):
+            requests_made.append('content')
+            return {'body': []}, {'changed': True}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prefetcher = Prefetcher(
+            SharedState(os.path.join(tmp, 'shared.sqlite3')), StubService
+        )
+        service = StubService()
+        preview = prefetcher.preview(service, 'BV1bK411W7t8')
+        subtitles = prefetcher.subtitle_list(service, preview['video_info'])
+        content, validators = prefetcher.subtitle_content(service, subtitles[0])
+
+        checks = [
+            (
+                "预览返回字幕语言",
+                [s['lan'] for s in preview['subtitles']] == ['zh']
+                and preview['prefetching'],
+            ),
+            (
+                "使用预取的字幕内容",
+                content['body'][0]['content'] == '你好' and validators['etag'] == '"a"',
+            ),
+            ("不重复请求", requests_made == ['view', 'subtitles', 'content']),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_danmaku():
+    """测试弹幕分段的解析和按时间分组"""
+    from danmaku import DanmakuTrack, iter_segment
+
+    def varint(value):
+        out = bytearray()
+        while True:
+            byte, value = value & 0x7F, value >> 7
+            out.append(byte | 0x80 if value else byte)
+            if not value:
+                return bytes(out)
+
+    def elem(progress, content, mode=1):
+        text = content.encode('utf-8')
+        body = (
+            b'\x08'
+            + varint(987654321)
+            + b'\x10'
+            + varint(progress)
+            + b'\x18'
+            + varint(mode)
+            + b'\x32\x03abc'
+            + b'\x3a'
+            + varint(len(text))
+            + text
+        )
+        return b'\x0a' + varint(len(body)) + body
+
+    print("测试弹幕解析:")
+    segment = b''.join(
+        [
+            elem(12500, '前方高能'),
+            elem(3000, '开头'),
+            elem(11000, '前方高能'),
+            elem(14000, '哈哈'),
+            elem(15000, '{"高级弹幕"}', mode=7),
+        ]
+    )
+    track = DanmakuTrack()
+    track.add_segment(iter_segment(segment))
+    subtitle_data = track.to_subtitle_data(bucket_seconds=10)
+    checks = [
+        ("跳过非文本弹幕", len(track) == 4),
+        ("按时间排序", list(track.times) == [3000, 11000, 12500, 14000]),
+        ("弹幕密度", track.density(10) == [1, 3]),
+        ("弹幕高峰", track.peaks(10, limit=1)[0]['comments'][0] == '前方高能'),
+        (
+            "合并为字幕",
+            [cue['content'] for cue in subtitle_data['body']]
+            == ['开头', '前方高能 ×2 / 哈哈'],
+        ),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_video_content_paging():
+    """测试按字节分页读取视频内容"""
+    import os
+    import tempfile
+    from web_interface import app
+
+    print("测试按字节分页:")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.makedirs(os.path.join('docs', '分页'))
+            with open(
+                os.path.join('docs', '分页', 'article.txt'), 'w', encoding='utf-8'
+            ) as f:
+                f.write('中文字幕abc')
+            client = app.test_client()
+
+            def page(offset, length):
+                return client.get(
+                    f'/api/video_content/分页/article?offset={offset}&length={length}'
+                ).get_json()
+
+            pages, offset = [], 0
+            while offset is not None and len(pages) < 20:
+                data = page(offset, 2)
+                pages.append(data['content'])
+                offset = data['next_offset']
+            first = page(0, 7)
+            middle = page(1, 6)
+        finally:
+            os.chdir(cwd)
+    checks = [
+        ("长度小于一个字符时仍然前进", pages == ['中', '文', '字', '幕', 'ab', 'c']),
+        (
+            "结尾对齐到字符边界",
+            (first['content'], first['next_offset'], first['total_bytes'])
+            == ('中文', 6, 15),
+        ),
+        (
+            "跳过起始处的残缺字符",
+            (middle['content'], middle['next_offset']) == ('文', 6),
+        ),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_http_cache():
+    """测试内容接口的条件请求、预压缩副本的选择和文件重写后副本失效"""
+    import gzip
+    import os
+    import tempfile
+    from http_cache import write_precompressed_sidecars
+    from web_interface import app
+
+    print("测试HTTP缓存:")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            file_path = os.path.join('docs', '缓存', 'article.txt')
+            os.makedirs(os.path.dirname(file_path))
+
+            def save(content, mtime):
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.utime(file_path, (mtime, mtime))
+
+            first, second = '第一版字幕内容。' * 200, '第二版字幕内容。' * 200
+            save(first, 1700000000)
+            write_precompressed_sidecars(file_path, first)
+            client = app.test_client()
+            raw_url = '/api/video_content/缓存/article?raw=1'
+            json_url = '/api/video_content/缓存/article'
+
+            compressed = client.get(raw_url, headers={'Accept-Encoding': 'gzip'})
+            revalidated = client.get(
+                raw_url,
+                headers={
+                    'Accept-Encoding': 'gzip',
+                    'If-None-Match': compressed.headers['ETag'],
+                },
+            )
+            identity = client.get(raw_url, headers={'Accept-Encoding': 'identity'})
+            json_first = client.get(json_url, headers={'Accept-Encoding': 'gzip'})
+            json_revalidated = client.get(
+                json_url,
+                headers={
+                    'Accept-Encoding': 'gzip',
+                    'If-None-Match': json_first.headers['ETag'],
+                },
+            )
+
+            # 重写文件后旧的预压缩副本不再使用，旧的ETag不再命中
+            save(second, 1700000100)
+            stale = client.get(
+                raw_url,
+                headers={
+                    'Accept-Encoding': 'gzip',
+                    'If-None-Match': compressed.headers['ETag'],
+                },
+            )
+            write_precompressed_sidecars(file_path, second)
+            refreshed = client.get(raw_url, headers={'Accept-Encoding': 'gzip'})
+        finally:
+            os.chdir(cwd)
+    checks = [
+        (
+            "使用gzip副本",
+            compressed.headers.get('Content-Encoding') == 'gzip'
+            and gzip.decompress(compressed.get_data()).decode('utf-8') == first,
+        ),
+        (
+            "If-None-Match命中返回304",
+            revalidated.status_code == 304 and not revalidated.get_data(),
+        ),
+        (
+            "不接受压缩时发送原文件",
+            'Content-Encoding' not in identity.headers
+            and identity.get_data().decode('utf-8') == first
+            and identity.headers['ETag'] != compressed.headers['ETag'],
+        ),
+        (
+            "响应按Accept-Encoding区分缓存",
+            'Accept-Encoding' in compressed.headers.get('Vary', ''),
+        ),
+        (
+            "JSON响应压缩并支持304",
+            json_first.headers.get('Content-Encoding') == 'gzip'
+            and json_revalidated.status_code == 304,
+        ),
+        (
+            "重写后不使用过期副本",
+            stale.status_code == 200
+            and 'Content-Encoding' not in stale.headers
+            and stale.get_data().decode('utf-8') == second,
+        ),
+        (
+            "重新生成副本后使用新内容",
+            refreshed.headers.get('Content-Encoding') == 'gzip'
+            and gzip.decompress(refreshed.get_data()).decode('utf-8') == second,
+        ),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_library_diff():
+    """测试视频库推送的增量计算"""
+    from web_interface import _library_diff
+
+    print("测试视频库增量:")
+    previous = {
+        'A': {'title': 'A', 'has_article': True, 'updated_at': 1},
+        'B': {'title': 'B', 'has_article': True, 'updated_at': 1},
+    }
+    current = [
+        {'title': 'B', 'has_article': True, 'updated_at': 2},
+        {'title': 'C', 'has_article': False, 'updated_at': 1},
+    ]
+    changes = _library_diff(previous, current)
+    checks = [
+        ("新增", [video['title'] for video in changes['added']] == ['C']),
+        ("更新", [video['title'] for video in changes['updated']] == ['B']),
+        ("删除", changes['deleted'] == ['A']),
+        (
+            "无变化时为空",
+            not any(_library_diff({v['title']: v for v in current}, current).values()),
+        ),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_library_index():
+    """测试按变化序号增量读取的视频库索引"""
+    import os
+    import shutil
+    import tempfile
+    from library_index import LibraryIndex
+
+    print("测试视频库索引:")
+    with tempfile.TemporaryDirectory() as tmp:
+        docs = os.path.join(tmp, 'docs')
+        for doc, header in (
+            ('视频A', ''),
+            ('旧视频', '# Video URL: https://www.bilibili.com/video/av170001\n'),
+        ):
+            os.makedirs(os.path.join(docs, doc))
+            with open(os.path.join(docs, doc, 'srt.srt'), 'w', encoding='utf-8') as f:
+                f.write(header + '1\n00:00:00,000 --> 00:00:01,000\n字幕\n')
+        index = LibraryIndex(os.path.join(tmp, 'index.sqlite3'), docs)
+        index.record('视频A', 'BV1xx411c7mD', 123, 'zh-CN')
+        seq, first = index.changes_since(0)
+
+        # 升级前保存的目录由首次对比补录，只读取第一行中的视频链接
+        reconciled = index.reconcile()
+        legacy = index.get('旧视频')
+        shutil.rmtree(os.path.join(docs, '视频A'))
+        index.remove('视频A')
+        latest, changes = index.changes_since(seq)
+        checks = [
+            (
+                "记录视频",
+                [
+                    (row['doc'], row['cid'], row['has_subtitle'], row['has_article'])
+                    for row in first
+                ]
+                == [('视频A', 123, 1, 0)],
+            ),
+            ("补录旧目录", reconciled == 1 and legacy['store_key'] == 'BV17x411w7KC'),
+            (
+                "增量读取",
+                [(row['doc'], row['deleted']) for row in changes]
+                == [('旧视频', 0), ('视频A', 1)],
+            ),
+            (
+                "没有变化时为空",
+                index.changes_since(latest)[1] == [] and index.reconcile() == 0,
+            ),
+            ("删除后不可查询", index.get('视频A') is None),
+        ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_graceful_shutdown():
+    """测试WSGI工作进程收到SIGTERM后等待进行中的请求完成"""
+    import os
+    import signal
+    import subprocess
+    import sys
+    import tempfile
+    import threading
+    import urllib.request
+
+    print("测试优雅退出:")
+    tmp = tempfile.mkdtemp()
+    saved = os.path.join(tmp, 'saved.txt')
+    # 慢请求处理完后通过后台写入保存文件
+    code = f"""
+import sys, time
+from background_writer import writer
+from wsgi_server import _create_listen_socket, _run_worker
+
+def app(environ, start_response):
+    print('started', flush=True)
+    time.sleep(1)
+    writer.submit({saved!r}, 'saved')
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'done']
+
+sock = _create_listen_socket('127.0.0.1', 0)
+print(sock.getsockname()[1], flush=True)
+_run_worker(app, '', sock, '127.0.0.1', 0, 2, multiprocess=False, graceful_timeout=10)
+"""
+    process = subprocess.Popen(
+        [sys.executable, '-c', code],
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    responses = []
+    try:
+        port = int(process.stdout.readline())
+
+        def fetch():
+            with urllib.request.urlopen(
+                f'http://127.0.0.1:{port}/', timeout=10
+            ) as response:
+                responses.append(response.read())
+
+        client = threading.Thread(target=fetch)
+        client.start()
+        started = process.stdout.readline().strip()
+        process.send_signal(signal.SIGTERM)
+        client.join(10)
+        exit_code = process.wait(10)
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+
+    checks = [
+        ("请求已开始处理", started == 'started'),
+        ("SIGTERM后请求完成", responses == [b'done']),
+        ("正常退出", exit_code == 0),
+        ("请求提交的文件已写入", os.path.exists(saved)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
+def test_daemon():
+    """测试常驻进程的转发判断和请求处理"""
+    import os
+    import socket
+    import tempfile
+    import threading
+    from config import DAEMON_CONFIG
+    from daemon import SubtitleDaemon
+    from daemon_client import forward_to_daemon, request, should_forward
+
+    print("测试常驻进程:")
+    socket_path = os.path.join(tempfile.mkdtemp(), 'daemon.sock')
+    original_socket = DAEMON_CONFIG['socket']
+    DAEMON_CONFIG['socket'] = socket_path
+    try:
+        no_daemon = forward_to_daemon(['BV1bK411W7t8'])
+        server = SubtitleDaemon(socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if request({'command': 'ping'}) is not None:
+                break
+            threading.Event().wait(0.05)
+        status = request({'command': 'ping'})
+        exit_code = forward_to_daemon(['https://example.com/video'])
+
+        # 退出时等待正在处理的请求完成
+        finished = []
+
+        def slow_handle(conn):
+            with conn:
+                threading.Event().wait(1.5)
+                finished.append(True)
+
+        server._handle = slow_handle
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        threading.Event().wait(0.1)
+        server.stop()
+        thread.join(5)
+        finished_at_exit = list(finished)
+        client.close()
+    finally:
+        DAEMON_CONFIG['socket'] = original_socket
+
+    checks = [
+        (
+            "只转发视频链接",
+            should_forward(['BV1bK411W7t8', '-l', 'zh'])
+            and not should_forward(['worker']),
+        ),
+        ("追踪参数不转发", not should_forward(['BV1bK411W7t8', '--trace'])),
+        (
+            "性能指标参数不转发",
+            not should_forward(['BV1bK411W7t8', '--metrics-json=m.json']),
+        ),
+        ("未运行时在当前进程处理", no_daemon is None),
+        ("状态查询", status is not None and status['pid'] == os.getpid()),
+        ("转发并返回退出码", exit_code == 1),
+        ("退出前等待进行中的请求", finished_at_exit == [True]),
+        ("退出后删除socket", not thread.is_alive() and not os.path.exists(socket_path)),
+    ]
+    for name, ok in checks:
+        print(f"  {'✅' if ok else '❌'} {name}")
+    print()
+    assert all(ok for _, ok in checks)
+
+
 def test_real_video():
     """测试真实视频（需要网络连接）"""
     service = BilibiliSubtitleService()
@@ -99,11 +1281,34 @@ def test_real_video():
 if __name__ == "__main__":
     print("开始测试 BilibiliSubtitleService")
     print("=" * 50)
-    
+
     test_extract_video_id()
+    test_av_bv_conversion()
+    test_wbi_sign()
     test_time_conversion()
-    
+    test_normalize()
+    test_transcript_cache()
+    test_metrics()
+    test_background_writer()
+    test_shared_rate_limiter()
+    test_work_queue()
+    test_dedupe()
+    test_keywords()
+    test_library_stats()
+    test_chunker()
+    test_chapters()
+    test_export_site()
+    test_negative_cache()
+    test_prefetch()
+    test_danmaku()
+    test_video_content_paging()
+    test_http_cache()
+    test_library_diff()
+    test_library_index()
+    test_graceful_shutdown()
+    test_daemon()
+
     print("注意: 以下测试需要网络连接")
     test_real_video()
-    
-    print("测试完成!")
\ No newline at end of file
+
+    print("测试完成!")
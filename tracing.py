@@ -0,0 +1,166 @@
+"""
+性能追踪
+为处理流程的各阶段记录追踪区间（span），每个任务（一个视频）结束后写出：
+- <任务>.trace.json：Chrome Trace格式，可在 chrome://tracing 或 https://ui.perfetto.dev 中查看
+- <任务>.folded：折叠栈格式，可直接交给 flamegraph.pl / speedscope 生成火焰图
+- <任务>.prof：开启cProfile时的性能分析结果，可用 snakeviz 等工具查看
+默认关闭，关闭时被追踪的函数只多一次属性判断
+"""
+
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from config import TRACE_CONFIG
+
+
+class Tracer:
+    """按任务收集追踪区间，每个线程同时只处理一个任务"""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        trace_dir: Optional[str] = None,
+        profile: Optional[bool] = None,
+    ):
+        self.enabled = False
+        self.trace_dir = ""
+        self.profile = False
+        self._local = threading.local()
+        self.configure(enabled, trace_dir, profile)
+
+    def configure(
+        self,
+        enabled: Optional[bool] = None,
+        trace_dir: Optional[str] = None,
+        profile: Optional[bool] = None,
+    ) -> None:
+        """修改配置，未指定的项使用配置文件中的值；开启cProfile时同时开启追踪"""
+        self.profile = TRACE_CONFIG["profile"] if profile is None else profile
+        self.enabled = (
+            TRACE_CONFIG["enabled"] if enabled is None else enabled
+        ) or self.profile
+        self.trace_dir = trace_dir or TRACE_CONFIG["dir"]
+
+    @contextmanager
+    def job(self, name: str) -> Iterator[None]:
+        """追踪一个任务，结束后把该任务的追踪结果写入文件"""
+        if not self.enabled or getattr(self._local, "job", None) is not None:
+            yield
+            return
+
+        job: Dict[str, Any] = {"events": [], "folded": {}, "stack": []}
+        self._local.job = job
+        profiler = cProfile.Profile() if self.profile else None
+        started_at = time.time()
+        try:
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # 同一时间只能有一个cProfile，其他线程的任务只记录追踪区间
+                    profiler = None
+            with self.span(name):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self._local.job = None
+            self._local.last_trace = self._write(name, started_at, job, profiler)
+
+    def last_trace(self) -> Optional[str]:
+        """当前线程最近一个任务的追踪结果路径（不含扩展名）"""
+        return getattr(self._local, "last_trace", None)
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[None]:
+        """记录一个区间，不在任务中时不记录"""
+        job = getattr(self._local, "job", None) if self.enabled else None
+        if job is None:
+            yield
+            return
+
+        # 栈中每一帧为 [名称, 开始时间, 子区间耗时]
+        frame = [name, time.perf_counter(), 0.0]
+        job["stack"].append(frame)
+        try:
+            yield
+        finally:
+            job["stack"].pop()
+            duration = time.perf_counter() - frame[1]
+            if job["stack"]:
+                job["stack"][-1][2] += duration
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": frame[1] * 1e6,
+                "dur": duration * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = {key: str(value) for key, value in args.items()}
+            job["events"].append(event)
+
+            # 折叠栈只记录自身耗时（微秒），子区间的耗时计入子区间
+            stack_key = ";".join([item[0] for item in job["stack"]] + [name])
+            self_time = int((duration - frame[2]) * 1e6)
+            job["folded"][stack_key] = job["folded"].get(stack_key, 0) + self_time
+
+    def traced(self, name: Optional[str] = None) -> Callable:
+        """把函数调用记录为一个区间的装饰器，name默认为函数名"""
+
+        def decorator(func: Callable) -> Callable:
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def _write(
+        self,
+        name: str,
+        started_at: float,
+        job: Dict[str, Any],
+        profiler: Optional[cProfile.Profile],
+    ) -> Optional[str]:
+        """写出任务的追踪结果并返回文件路径前缀，写入失败不影响任务本身"""
+        safe_name = re.sub(r"[^\w.-]+", "_", name)[:60]
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(started_at))
+        base = os.path.join(
+            self.trace_dir, f"{stamp}-{int(started_at * 1000) % 1000:03d}-{safe_name}"
+        )
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            with open(base + ".trace.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {"traceEvents": job["events"], "displayTimeUnit": "ms"},
+                    f,
+                    ensure_ascii=False,
+                )
+            with open(base + ".folded", "w", encoding="utf-8") as f:
+                for stack, micros in sorted(job["folded"].items()):
+                    f.write(f"{stack} {micros}\n")
+            if profiler is not None:
+                profiler.dump_stats(base + ".prof")
+        except OSError as e:
+            print(f"⚠️  写入追踪结果失败: {e}")
+            return None
+        return base
+
+
+# 默认的追踪器
+tracer = Tracer()
@@ -0,0 +1,166 @@
+"""
+字幕内容内存缓存
+按字节数限制容量的LRU缓存，缓存已读取的文本和解析后的字幕条目
+缓存项通过文件的mtime和大小校验，保存或删除视频时主动失效
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import CACHE_CONFIG
+from metrics import metrics
+
+# SRT时间轴，例如 00:01:02,345 --> 00:01:04,000
+SRT_TIME_PATTERN = re.compile(
+    r"(\d+):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d+):(\d{2}):(\d{2})[,.](\d{3})"
+)
+
+
+class ByteLRUCache:
+    """按字节数限制容量的线程安全LRU缓存"""
+
+    def __init__(self, max_bytes: int, name: Optional[str] = None):
+        self.max_bytes = max_bytes
+        # 指定名称时命中情况同时记录到性能指标中
+        self.name = name
+        self._entries: "OrderedDict[Any, Tuple[Any, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any, version: Any) -> Optional[Any]:
+        """获取缓存值，版本不一致时视为未命中并移除旧值"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                value, result = None, "miss"
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value, result = entry[0], "hit"
+        if self.name:
+            metrics.inc("cache_requests_total", cache=self.name, result=result)
+        return value
+
+    def put(self, key: Any, version: Any, value: Any, size: int) -> None:
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        # 单个值超过总容量时不缓存
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, version, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Callable[[Any], bool]) -> int:
+        """移除所有满足条件的缓存项，返回移除的数量"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中率等统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _remove(self, key: Any) -> None:
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+
+transcript_cache = ByteLRUCache(
+    CACHE_CONFIG["transcript_cache_bytes"], name="transcript"
+)
+
+
+def _file_version(file_path: str) -> Tuple[int, int]:
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def parse_srt(text: str) -> List[Dict[str, Any]]:
+    """将SRT文本解析为字幕条目列表，格式与B站字幕JSON的body一致"""
+    cues = []
+    for block in text.split("\n\n"):
+        # 忽略以#开头的附加信息行（例如视频链接）
+        lines = [
+            line
+            for line in block.strip().split("\n")
+            if line and not line.startswith("#")
+        ]
+        for i, line in enumerate(lines):
+            match = SRT_TIME_PATTERN.search(line)
+            if match:
+                h1, m1, s1, ms1, h2, m2, s2, ms2 = (int(g) for g in match.groups())
+                cues.append(
+                    {
+                        "from": h1 * 3600 + m1 * 60 + s1 + ms1 / 1000,
+                        "to": h2 * 3600 + m2 * 60 + s2 + ms2 / 1000,
+                        "content": "\n".join(lines[i + 1 :]).strip(),
+                    }
+                )
+                break
+    return cues
+
+
+def load_text(file_path: str) -> str:
+    """读取文本文件，优先使用缓存"""
+    key = ("text", os.path.abspath(file_path))
+    version = _file_version(file_path)
+    content = transcript_cache.get(key, version)
+    if content is None:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        transcript_cache.put(key, version, content, sys.getsizeof(content))
+    return content
+
+
+def load_cues(file_path: str) -> List[Dict[str, Any]]:
+    """读取并解析SRT文件，优先使用缓存"""
+    key = ("cues", os.path.abspath(file_path))
+    version = _file_version(file_path)
+    cues = transcript_cache.get(key, version)
+    if cues is None:
+        cues = parse_srt(load_text(file_path))
+        # 每个条目约为一个字典、两个浮点数和一段文本
+        size = sum(sys.getsizeof(cue["content"]) + 300 for cue in cues)
+        transcript_cache.put(key, version, cues, size)
+    return cues
+
+
+def invalidate_path(path: str) -> int:
+    """使指定文件或目录下所有文件的缓存失效"""
+    prefix = os.path.abspath(path)
+    return transcript_cache.invalidate(
+        lambda key: key[1] == prefix or key[1].startswith(prefix + os.sep)
+    )
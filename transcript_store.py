@@ -0,0 +1,488 @@
+"""
+字幕内容存储
+按 (bvid, cid, lang) 索引的内容寻址存储，内容按哈希去重并压缩保存
+索引保存在SQLite中，按视频ID查找无需遍历目录
+提供导出功能，可以重新生成 docs/<视频标题>/ 目录结构
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from background_writer import atomic_write_bytes
+from config import STORE_CONFIG
+from filenames import sanitize_filename
+
+try:
+    import zstandard  # 可选依赖，未安装时使用gzip
+except ImportError:
+    zstandard = None
+
+
+# 每条记录保存的内容类型
+CONTENT_KINDS = ("raw", "normalized", "srt", "article")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    bvid TEXT NOT NULL,
+    cid INTEGER NOT NULL,
+    lang TEXT NOT NULL,
+    aid INTEGER,
+    title TEXT,
+    author TEXT,
+    lang_doc TEXT,
+    raw_hash TEXT NOT NULL,
+    srt_hash TEXT NOT NULL,
+    article_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    subtitle_id TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    normalized_hash TEXT,
+    normalize_version TEXT,
+    PRIMARY KEY (bvid, cid, lang)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+"""
+
+# 内容哈希列上的索引，删除记录时按哈希检查内容是否仍被引用；补充旧版本缺少的列之后创建
+INDEXES = """
+CREATE INDEX IF NOT EXISTS transcripts_raw_hash ON transcripts (raw_hash);
+CREATE INDEX IF NOT EXISTS transcripts_srt_hash ON transcripts (srt_hash);
+CREATE INDEX IF NOT EXISTS transcripts_article_hash ON transcripts (article_hash);
+CREATE INDEX IF NOT EXISTS transcripts_normalized_hash ON transcripts (normalized_hash);
+"""
+
+# 旧版本索引中缺少的列，打开时自动补充
+MIGRATED_COLUMNS = {
+    "subtitle_id": "TEXT",
+    "etag": "TEXT",
+    "last_modified": "TEXT",
+    "normalized_hash": "TEXT",
+    "normalize_version": "TEXT",
+}
+
+
+class TranscriptStore:
+    """按视频ID索引的压缩字幕存储"""
+
+    def __init__(self, root: Optional[str] = None, compression: Optional[str] = None):
+        self.root = root or STORE_CONFIG["root"]
+        self.objects_dir = os.path.join(self.root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        compression = compression or STORE_CONFIG["compression"]
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression == "zstd" and zstandard is None:
+            raise Exception("未安装zstandard，无法使用zstd压缩")
+        self.codec = compression
+
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {
+                row["name"] for row in conn.execute("PRAGMA table_info(transcripts)")
+            }
+            for name, column_type in MIGRATED_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(
+                        f"ALTER TABLE transcripts ADD COLUMN {name} {column_type}"
+                    )
+            conn.executescript(INDEXES)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的数据库连接；fork之后重新连接，不复用父进程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                os.path.join(self.root, "index.sqlite3"),
+                timeout=30,
+                isolation_level=None,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func: Any) -> Any:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    @staticmethod
+    def video_key(video_info: Dict[str, Any]) -> str:
+        """视频的存储键，优先使用BV号"""
+        return video_info.get("bvid") or f"av{video_info['aid']}"
+
+    def _blob_path(self, digest: str, codec: str) -> str:
+        suffix = ".zst" if codec == "zstd" else ".gz"
+        return os.path.join(self.objects_dir, digest[:2], digest + suffix)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=STORE_CONFIG["level"]).compress(data)
+        return gzip.compress(data, compresslevel=STORE_CONFIG["level"], mtime=0)
+
+    @staticmethod
+    def _decompress(data: bytes, codec: str) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise Exception("该内容使用zstd压缩，需要安装zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _ensure_blob(self, conn: sqlite3.Connection, text: str) -> str:
+        """在事务中保存一段文本，返回其SHA-256哈希；相同内容只保存一份
+
+        与引用它的记录在同一个事务中写入，删除记录时清理内容的事务不会在两者之间删除它
+        """
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone():
+            return digest
+
+        compressed = self._compress(data)
+        atomic_write_bytes(self._blob_path(digest, self.codec), compressed)
+        conn.execute(
+            "INSERT INTO blobs (hash, codec, size, stored_size) VALUES (?, ?, ?, ?)",
+            (digest, self.codec, len(data), len(compressed)),
+        )
+        return digest
+
+    def put_blob(self, text: str) -> str:
+        """保存一段文本，返回其SHA-256哈希；相同内容只保存一份"""
+        return self._transaction(lambda conn: self._ensure_blob(conn, text))
+
+    def get_blob(self, digest: str) -> str:
+        """按哈希读取文本"""
+        row = (
+            self._connect()
+            .execute("SELECT codec FROM blobs WHERE hash = ?", (digest,))
+            .fetchone()
+        )
+        if row is None:
+            raise Exception(f"内容不存在: {digest}")
+        with open(self._blob_path(digest, row["codec"]), "rb") as f:
+            return self._decompress(f.read(), row["codec"]).decode("utf-8")
+
+    def put(
+        self,
+        video_info: Dict[str, Any],
+        subtitle: Dict[str, Any],
+        subtitle_content: Dict[str, Any],
+        srt_content: str,
+        article_content: str,
+        validators: Optional[Dict[str, Any]] = None,
+        normalized: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """保存一个视频某种语言的字幕
+
+        Args:
+            video_info: get_video_info返回的视频信息
+            subtitle: get_subtitle_list中选中的字幕
+            subtitle_content: 原始字幕JSON
+            srt_content: SRT格式字幕
+            article_content: 文章格式文本
+            validators: 字幕的id、ETag、Last-Modified，用于下次处理时判断字幕是否变化
+            normalized: 规范化后的字幕JSON，字幕未变化时直接使用，不重新规范化
+
+        Returns:
+            Dict[str, Any]: 保存后的索引记录
+        """
+        # 排序键保证相同字幕生成相同的哈希
+        raw_text = json.dumps(
+            subtitle_content, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        normalized_text = (
+            json.dumps(
+                normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+            )
+            if normalized
+            else None
+        )
+        validators = validators or {}
+        record: Dict[str, Any] = {
+            "bvid": self.video_key(video_info),
+            "cid": video_info["cid"],
+            "lang": subtitle.get("lan", ""),
+            "aid": video_info["aid"],
+            "title": video_info["title"],
+            "author": video_info.get("author"),
+            "lang_doc": subtitle.get("lan_doc"),
+            "updated_at": time.time(),
+            "subtitle_id": validators.get("subtitle_id")
+            or str(subtitle.get("id_str") or subtitle.get("id") or "")
+            or None,
+            "etag": validators.get("etag"),
+            "last_modified": validators.get("last_modified"),
+            "normalize_version": normalized.get("normalized") if normalized else None,
+        }
+
+        def insert(conn: sqlite3.Connection) -> None:
+            # 内容和记录在同一个事务中写入
+            for kind, text in (
+                ("raw", raw_text),
+                ("srt", srt_content),
+                ("article", article_content),
+                ("normalized", normalized_text),
+            ):
+                record[f"{kind}_hash"] = (
+                    self._ensure_blob(conn, text) if text is not None else None
+                )
+            conn.execute(
+                f"INSERT OR REPLACE INTO transcripts ({', '.join(record)}) "
+                f"VALUES ({', '.join('?' for _ in record)})",
+                tuple(record.values()),
+            )
+
+        self._transaction(insert)
+        return record
+
+    def get(
+        self, bvid: str, cid: Optional[int] = None, lang: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """查找一条记录，未指定cid或语言时返回最近更新的一条"""
+        entries = self.find(bvid, cid, lang)
+        return entries[0] if entries else None
+
+    def previous_subtitle(
+        self, video_info: Dict[str, Any], subtitle: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """返回已保存的同一字幕的校验信息和原始内容，供条件刷新使用"""
+        record = self.get(
+            self.video_key(video_info), video_info["cid"], subtitle.get("lan", "")
+        )
+        if record is None:
+            return None
+        try:
+            content = json.loads(self.get_content(record, "raw"))
+            normalized = (
+                json.loads(self.get_content(record, "normalized"))
+                if record.get("normalized_hash")
+                else None
+            )
+        except Exception:
+            return None
+        return {
+            "subtitle_id": record.get("subtitle_id"),
+            "etag": record.get("etag"),
+            "last_modified": record.get("last_modified"),
+            "content": content,
+            "normalized": normalized,
+        }
+
+    def find(
+        self, bvid: str, cid: Optional[int] = None, lang: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """查找视频的所有记录，按更新时间倒序"""
+        sql = "SELECT * FROM transcripts WHERE bvid = ?"
+        params: List[Any] = [bvid]
+        if cid is not None:
+            sql += " AND cid = ?"
+            params.append(cid)
+        if lang is not None:
+            sql += " AND lang = ?"
+            params.append(lang)
+        sql += " ORDER BY updated_at DESC"
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def get_content(self, record: Dict[str, Any], kind: str) -> str:
+        """读取记录中的某种内容 ('raw'、'normalized'、'srt' 或 'article')"""
+        if kind not in CONTENT_KINDS:
+            raise ValueError(f"不支持的内容类型: {kind}")
+        if not record.get(f"{kind}_hash"):
+            raise Exception(f"该记录没有保存{kind}内容")
+        return self.get_blob(record[f"{kind}_hash"])
+
+    def iter_entries(self, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """按更新时间顺序逐条读取记录，since不为空时只返回之后更新的记录"""
+        cursor = self._connect().execute(
+            "SELECT * FROM transcripts WHERE updated_at > ? ORDER BY updated_at, "
+            "bvid, cid, lang",
+            (since if since is not None else -1.0,),
+        )
+        for row in cursor:
+            yield dict(row)
+
+    def list_entries(self) -> List[Dict[str, Any]]:
+        """列出所有记录"""
+        return [
+            dict(row)
+            for row in self._connect().execute(
+                "SELECT * FROM transcripts ORDER BY bvid, cid, lang"
+            )
+        ]
+
+    def delete(
+        self, bvid: str, cid: Optional[int] = None, lang: Optional[str] = None
+    ) -> int:
+        """删除记录并清理不再被引用的内容，返回删除的记录数"""
+        where = "bvid = ?"
+        params: List[Any] = [bvid]
+        if cid is not None:
+            where += " AND cid = ?"
+            params.append(cid)
+        if lang is not None:
+            where += " AND lang = ?"
+            params.append(lang)
+        hash_columns = [f"{kind}_hash" for kind in CONTENT_KINDS]
+
+        def remove(conn: sqlite3.Connection) -> int:
+            # 删除记录和清理内容在同一个事务中，保存记录的事务不会在检查引用之后插入
+            rows = conn.execute(
+                f"SELECT {', '.join(hash_columns)} FROM transcripts WHERE {where}",
+                params,
+            ).fetchall()
+            conn.execute(f"DELETE FROM transcripts WHERE {where}", params)
+            self._release_blobs(
+                conn,
+                {row[column] for row in rows for column in hash_columns if row[column]},
+            )
+            return len(rows)
+
+        return self._transaction(remove)
+
+    def _release_blobs(self, conn: sqlite3.Connection, hashes: Set[str]) -> int:
+        """在事务中删除给定内容中已没有记录引用的部分，每个哈希只做几次索引查询"""
+        orphans = []
+        for digest in hashes:
+            referenced = any(
+                conn.execute(
+                    f"SELECT 1 FROM transcripts WHERE {kind}_hash = ? LIMIT 1",
+                    (digest,),
+                ).fetchone()
+                for kind in CONTENT_KINDS
+            )
+            if referenced:
+                continue
+            row = conn.execute(
+                "SELECT hash, codec FROM blobs WHERE hash = ?", (digest,)
+            ).fetchone()
+            if row is not None:
+                orphans.append(row)
+        self._remove_blobs(conn, orphans)
+        return len(orphans)
+
+    def collect_garbage(self) -> int:
+        """扫描全部内容，删除没有任何记录引用的部分，返回删除的数量
+
+        删除记录时已经清理了相应的内容，只在维护时需要调用
+        """
+
+        def collect(conn: sqlite3.Connection) -> int:
+            orphans = conn.execute(
+                "SELECT hash, codec FROM blobs WHERE hash NOT IN ("
+                "SELECT raw_hash FROM transcripts UNION SELECT srt_hash FROM "
+                "transcripts "
+                "UNION SELECT article_hash FROM transcripts "
+                "UNION SELECT normalized_hash FROM transcripts WHERE normalized_hash "
+                "IS NOT NULL)"
+            ).fetchall()
+            self._remove_blobs(conn, orphans)
+            return len(orphans)
+
+        return self._transaction(collect)
+
+    def _remove_blobs(self, conn: sqlite3.Connection, rows: List[sqlite3.Row]) -> None:
+        """在事务提交前删除文件，事务持有写锁期间其他进程不会重新引用或写入这些内容"""
+        conn.executemany(
+            "DELETE FROM blobs WHERE hash = ?", [(row["hash"],) for row in rows]
+        )
+        for row in rows:
+            try:
+                os.remove(self._blob_path(row["hash"], row["codec"]))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """返回记录数、原始大小和压缩后大小"""
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        blobs, size, stored_size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) "
+            "FROM blobs"
+        ).fetchone()
+        return {
+            "entries": entries,
+            "blobs": blobs,
+            "size": size,
+            "stored_size": stored_size,
+            "codec": self.codec,
+        }
+
+    def export_docs(
+        self, docs_dir: str = "docs", bvid: Optional[str] = None
+    ) -> List[str]:
+        """将存储中的内容导出为 docs/<视频标题>/ 目录结构
+
+        标题相同的视频会导出到带BV号后缀的目录，避免互相覆盖。
+
+        Args:
+            docs_dir: 导出目录
+            bvid: 只导出指定视频，不指定时导出全部
+
+        Returns:
+            List[str]: 导出的目录列表
+        """
+        records = self.find(bvid) if bvid else self.list_entries()
+        # 每个视频只导出最近更新的一条
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            current = latest.get(record["bvid"])
+            if current is None or record["updated_at"] > current["updated_at"]:
+                latest[record["bvid"]] = record
+
+        exported = []
+        used_titles = set()
+        for record in sorted(latest.values(), key=lambda r: r["updated_at"]):
+            safe_title = sanitize_filename(record["title"] or record["bvid"])
+            if safe_title in used_titles:
+                safe_title = f"{safe_title}_{record['bvid']}"
+            used_titles.add(safe_title)
+
+            video_dir = os.path.join(docs_dir, safe_title)
+            video_url = f"https://www.bilibili.com/video/{record['bvid']}"
+            srt = f"# Video URL: {video_url}\n{self.get_content(record, 'srt')}"
+            article = (
+                f"# Video URL: {video_url}\n# Video Title: {record['title']}\n\n"
+                f"{self.get_content(record, 'article')}"
+            )
+            atomic_write_bytes(os.path.join(video_dir, "srt.srt"), srt.encode("utf-8"))
+            atomic_write_bytes(
+                os.path.join(video_dir, "article.txt"), article.encode("utf-8")
+            )
+            exported.append(video_dir)
+        return exported
+
+
+_default_store: Optional[TranscriptStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_store() -> Optional[TranscriptStore]:
+    """返回默认的存储实例，未启用时返回None"""
+    global _default_store
+    if not STORE_CONFIG["enabled"]:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TranscriptStore()
+    return _default_store
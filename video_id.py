@@ -0,0 +1,54 @@
+"""
+av号与BV号互相转换
+本地计算，不需要请求接口
+算法与B站当前使用的编码方式一致（支持超过2^30的新av号）
+"""
+
+XOR_CODE = 23442827791579
+MASK_CODE = 2251799813685247
+MAX_AID = 1 << 51
+BASE = 58
+ALPHABET = "FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf"
+ALPHABET_INDEX = {char: i for i, char in enumerate(ALPHABET)}
+BVID_LENGTH = 12
+
+
+def _swap(chars: list) -> list:
+    """BV号中第3、9位和第4、7位互换"""
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return chars
+
+
+def av_to_bv(aid: int) -> str:
+    """将av号转换为BV号"""
+    if not 0 < aid < MAX_AID:
+        raise ValueError(f"无效的av号: {aid}")
+
+    chars = list("BV1000000000")
+    index = BVID_LENGTH - 1
+    value = (MAX_AID | aid) ^ XOR_CODE
+    while value > 0:
+        chars[index] = ALPHABET[value % BASE]
+        value //= BASE
+        index -= 1
+    return "".join(_swap(chars))
+
+
+def bv_to_av(bvid: str) -> int:
+    """将BV号转换为av号"""
+    bvid = normalize_bvid(bvid)
+    value = 0
+    for char in _swap(list(bvid))[3:]:
+        value = value * BASE + ALPHABET_INDEX[char]
+    return (value & MASK_CODE) ^ XOR_CODE
+
+
+def normalize_bvid(bvid: str) -> str:
+    """规范化BV号前缀的大小写并校验格式"""
+    if len(bvid) != BVID_LENGTH or bvid[:2].upper() != "BV":
+        raise ValueError(f"无效的BV号: {bvid}")
+    bvid = "BV" + bvid[2:]
+    if any(char not in ALPHABET_INDEX for char in bvid[3:]):
+        raise ValueError(f"无效的BV号: {bvid}")
+    return bvid
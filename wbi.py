@@ -0,0 +1,131 @@
+"""
+WBI签名
+为 /x/player/wbi/v2 等接口生成 w_rid/wts 参数
+img_key/sub_key 从 /x/web-interface/nav 获取，由调用方负责缓存
+"""
+
+import hashlib
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+# 由img_key和sub_key打乱生成mixin_key的下标表
+MIXIN_KEY_ENC_TAB = [
+    46,
+    47,
+    18,
+    2,
+    53,
+    8,
+    23,
+    32,
+    15,
+    50,
+    10,
+    31,
+    58,
+    3,
+    45,
+    35,
+    27,
+    43,
+    5,
+    49,
+    33,
+    9,
+    42,
+    19,
+    29,
+    28,
+    14,
+    39,
+    12,
+    38,
+    41,
+    13,
+    37,
+    48,
+    7,
+    16,
+    24,
+    55,
+    40,
+    61,
+    26,
+    17,
+    0,
+    1,
+    60,
+    51,
+    30,
+    4,
+    22,
+    25,
+    54,
+    21,
+    56,
+    59,
+    6,
+    63,
+    57,
+    62,
+    11,
+    36,
+    20,
+    34,
+    44,
+    52,
+]
+
+# 参数值中需要过滤掉的字符
+FILTERED_CHARS = str.maketrans("", "", "!'()*")
+
+# 表示签名无效、需要刷新密钥的错误码
+SIGNATURE_ERROR_CODES = {-352, -403, -412}
+
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+
+
+def get_mixin_key(img_key: str, sub_key: str) -> str:
+    """由img_key和sub_key生成mixin_key"""
+    raw = img_key + sub_key
+    return "".join(raw[i] for i in MIXIN_KEY_ENC_TAB)[:32]
+
+
+def sign_params(
+    params: Dict[str, Any], img_key: str, sub_key: str, wts: Optional[int] = None
+) -> Dict[str, Any]:
+    """为请求参数添加wts和w_rid签名
+
+    Args:
+        params: 原始请求参数
+        img_key: nav接口返回的img_key
+        sub_key: nav接口返回的sub_key
+        wts: 签名时间戳，不指定时使用当前时间
+
+    Returns:
+        Dict[str, Any]: 按键排序并添加了签名的参数
+    """
+    signed = dict(params)
+    signed["wts"] = int(time.time()) if wts is None else wts
+    signed = {key: str(signed[key]).translate(FILTERED_CHARS) for key in sorted(signed)}
+    query = urlencode(signed)
+    signed["w_rid"] = hashlib.md5(
+        (query + get_mixin_key(img_key, sub_key)).encode("utf-8")
+    ).hexdigest()
+    return signed
+
+
+def parse_nav_keys(nav_data: Dict[str, Any]) -> Tuple[str, str]:
+    """从nav接口的返回中提取img_key和sub_key
+
+    未登录时nav接口返回-101，但仍然包含wbi_img，因此不检查返回码。
+    """
+    wbi_img = (nav_data.get("data") or {}).get("wbi_img") or {}
+    img_url = wbi_img.get("img_url", "")
+    sub_url = wbi_img.get("sub_url", "")
+    if not img_url or not sub_url:
+        raise Exception("获取WBI签名密钥失败")
+    img_key = img_url.rsplit("/", 1)[-1].split(".")[0]
+    sub_key = sub_url.rsplit("/", 1)[-1].split(".")[0]
+    return img_key, sub_key
@@ -6,65 +6,181 @@ Web界面服务
 
 import os
 import json
-from flask import Flask, render_template, request, jsonify, send_file
+import base64
+import hashlib
+import threading
+import time
+from flask import Flask, Response, render_template, request, jsonify, send_file
 from bilibili_subtitle_service import BilibiliSubtitleService
-from config import BILIBILI_COOKIES
+from config import (
+    BILIBILI_COOKIE_POOL,
+    HTTP_CONFIG,
+    LIBRARY_EVENTS_CONFIG,
+    WRITER_CONFIG,
+)
+from http_cache import (
+    file_etag,
+    is_sidecar,
+    json_response,
+    send_text_file,
+    write_precompressed_sidecars,
+)
+from background_writer import is_temp_file, writer
+from chapters import detect_chapters
+from dedupe import get_dedupe_index, index_srt_file
+from filenames import sanitize_filename
+from keywords import get_keyword_index, index_keywords_file
+from library_index import get_library_index, reconcile_library, record_saved_video
+from library_stats import get_library_stats, record_srt_file, record_video_metadata
+from metrics import metrics, render_prometheus
+from prefetch import prefetcher
+from tracing import tracer
+from shared_state import bump_library_generation, library_generation
+from transcript_store import get_store
+from transcript_cache import invalidate_path, load_cues, load_text, transcript_cache
 import zipfile
 import tempfile
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 app = Flask(__name__)
 
-def sanitize_filename(filename: str) -> str:
-    """清理文件名，移除不合法字符"""
-    import re
-    filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-    filename = filename.strip('. ')
-    return filename or 'untitled'
 
+@tracer.traced()
+@metrics.timed('stage_seconds', stage='save_content')
 def save_content(video_title: str, content_type: str, content: str) -> str:
     """保存内容到指定目录"""
     safe_title = sanitize_filename(video_title)
     save_dir = os.path.join('docs', safe_title)
-    os.makedirs(save_dir, exist_ok=True)
-    
+
     extension = 'txt' if content_type == 'article' else content_type
     filename = f"{content_type}.{extension}"
     file_path = os.path.join(save_dir, filename)
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    return file_path
 
-def extract_video_id_from_url(video_title: str) -> Optional[str]:
-    """从保存的文件中提取视频ID"""
-    safe_title = sanitize_filename(video_title)
-    video_dir = os.path.join('docs', safe_title)
-    
-    if not os.path.exists(video_dir):
+    # 交给后台线程写入，文件重命名到位后再生成压缩副本并使缓存失效
+    return writer.submit(file_path, content, callback=_after_write)
+
+
+def _after_write(file_path: str, content: str) -> None:
+    """文件写入完成后的处理"""
+    write_precompressed_sidecars(file_path, content)
+    invalidate_path(file_path)
+    index_srt_file(file_path, content)
+    index_keywords_file(file_path, content)
+    record_srt_file(file_path, content)
+
+
+def _encode_cursor(title: str) -> str:
+    """将分页位置编码为不透明的游标"""
+    return base64.urlsafe_b64encode(title.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    """解析分页游标，无效游标视为从头开始"""
+    if not cursor:
         return None
-    
-    # 查找可能包含视频信息的文件
     try:
-        for file in os.listdir(video_dir):
-            if file.endswith('.txt') or file.endswith('.srt'):
-                file_path = os.path.join(video_dir, file)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        # 尝试从内容中提取BV号或其他视频标识
-                        import re
-                        bv_match = re.search(r'BV[a-zA-Z0-9]+', content)
-                        if bv_match:
-                            return f"https://www.bilibili.com/video/{bv_match.group()}"
-                except:
-                    continue
-    except OSError:
-        pass
-    
-    return None
+        return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (ValueError, UnicodeError):
+        return None
+
+
+def _read_byte_range(
+    file_path: str, offset: int, length: int
+) -> Tuple[str, Optional[int], int]:
+    """按字节范围读取UTF-8文本，边界自动对齐到完整字符
+
+    Returns:
+        Tuple[str, Optional[int], int]: (文本内容, 下一页偏移量, 文件总字节数)
+    """
+    total = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        # 多读几个字节，起始处跳过残缺字符后仍能读到一个完整字符
+        data = f.read(length + 8)
+
+    # 跳过起始处残缺字符的后续字节
+    start = 0
+    while start < len(data) and (data[start] & 0xC0) == 0x80:
+        start += 1
+
+    end = min(length, len(data))
+    while end < len(data) and (data[end] & 0xC0) == 0x80:
+        end -= 1
+    if end <= start and start < len(data):
+        # length小于一个字符时至少返回一个完整字符，保证下一页偏移量前进
+        end = start + 1
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end += 1
+
+    next_offset = offset + end if offset + end < total else None
+    return data[start:end].decode('utf-8'), next_offset, total
+
+
+# 当前进程内的视频列表，按视频库索引的变化序号增量更新
+_library_lock = threading.Lock()
+_library_seq: Optional[int] = None
+_library_rows: Dict[str, Dict] = {}
+_library_memo: Tuple[Optional[str], List[Dict]] = (None, [])
+
+
+def _library_version() -> str:
+    """视频库的版本：保存或删除视频时递增的共享版本号"""
+    return f"{library_generation():x}"
+
+
+def _library_index() -> Tuple[str, List[Dict]]:
+    """返回docs目录中的全部视频及其版本
+
+    版本不变时直接使用缓存；版本变化时只从视频库索引读取上次之后变化的视频，
+    不遍历docs目录。进程中第一次调用时与docs目录对比一次，补录升级前保存的视频。
+    """
+    global _library_memo, _library_seq
+    version = _library_version()
+    with _library_lock:
+        if _library_memo[0] == version:
+            return _library_memo
+
+        if _library_seq is None:
+            if reconcile_library():
+                version = _library_version()
+            _library_seq = 0
+        _library_seq, changes = get_library_index().changes_since(_library_seq)
+        for row in changes:
+            if row['deleted']:
+                _library_rows.pop(row['doc'], None)
+            else:
+                _library_rows[row['doc']] = row
+
+        dedupe_index = get_dedupe_index()
+        duplicates = dedupe_index.duplicates_map() if dedupe_index else {}
+        keyword_index = get_keyword_index()
+        keywords = keyword_index.keywords_map() if keyword_index else {}
+
+        videos = []
+        for doc in sorted(_library_rows):
+            row = _library_rows[doc]
+            videos.append(
+                {
+                    'title': doc,
+                    'has_article': bool(row['has_article']),
+                    'has_subtitle': bool(row['has_subtitle']),
+                    # 重新获取字幕后变化，推送时据此判断视频是否更新
+                    'updated_at': row['updated_at'],
+                    'video_url': row['video_url'],
+                    # 字幕近似重复的其他视频
+                    'duplicates': [
+                        {'title': match['doc'], 'similarity': match['similarity']}
+                        for match in duplicates.get(doc, [])
+                    ],
+                    # 权重最高的几个关键词
+                    'keywords': keywords.get(doc, []),
+                }
+            )
+
+        _library_memo = (version, videos)
+        return _library_memo
+
 
 @app.route('/')
 def index():
@@ -73,139 +189,558 @@ def index():
 
 @app.route('/api/videos')
 def get_video_list():
-    """获取docs文件夹中的视频列表"""
+    """获取docs文件夹中的视频列表
+
+    查询参数:
+        q: 按标题过滤（不区分大小写）
+        has_article / has_subtitle: 为1时只返回包含对应文件的视频
+        limit: 每页条数，不指定时返回全部
+        cursor: 上一页返回的next_cursor
+    """
     try:
         docs_dir = 'docs'
         if not os.path.exists(docs_dir):
-            return jsonify({'success': True, 'videos': []})
-        
+            return json_response(
+                {'success': True, 'videos': [], 'next_cursor': None, 'version': None}
+            )
+
+        keyword = request.args.get('q', '').strip().lower()
+        require_article = request.args.get('has_article') == '1'
+        require_subtitle = request.args.get('has_subtitle') == '1'
+        cursor = _decode_cursor(request.args.get('cursor'))
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, HTTP_CONFIG['max_page_size']))
+
+        version, library = _library_index()
+
+        # 视频列表按标题排序，游标即上一页最后一个标题
         videos = []
-        for item in os.listdir(docs_dir):
-            item_path = os.path.join(docs_dir, item)
-            if os.path.isdir(item_path):
-                # 检查文件夹中是否有文章或字幕文件
-                has_article = os.path.exists(os.path.join(item_path, 'article.txt'))
-                has_subtitle = os.path.exists(os.path.join(item_path, 'srt.srt'))
-                
-                if has_article or has_subtitle:
-                    # 尝试获取视频链接
-                    video_url = extract_video_id_from_url(item)
-                    
-                    videos.append({
-                        'title': item,
-                        'has_article': has_article,
-                        'has_subtitle': has_subtitle,
-                        'video_url': video_url
-                    })
-        
-        return jsonify({'success': True, 'videos': videos})
-        
+        for video in library:
+            if cursor is not None and video['title'] <= cursor:
+                continue
+            if keyword and keyword not in video['title'].lower():
+                continue
+            if (require_article and not video['has_article']) or (
+                require_subtitle and not video['has_subtitle']
+            ):
+                continue
+
+            videos.append(video)
+            # 多取一条用于判断是否还有下一页
+            if limit is not None and len(videos) > limit:
+                break
+
+        next_cursor = None
+        if limit is not None and len(videos) > limit:
+            videos = videos[:limit]
+            next_cursor = _encode_cursor(videos[-1]['title'])
+
+        return json_response(
+            {
+                'success': True,
+                'videos': videos,
+                'next_cursor': next_cursor,
+                'version': version,
+            },
+            etag=f"{version}-{hashlib.sha1(request.query_string).hexdigest()[:12]}",
+        )
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+def _library_diff(previous: Dict[str, Dict], current: List[Dict]) -> Dict[str, List]:
+    """比较两个版本的视频列表，返回新增、更新的视频和删除的标题"""
+    titles = set()
+    added, updated = [], []
+    for video in current:
+        titles.add(video['title'])
+        old = previous.get(video['title'])
+        if old is None:
+            added.append(video)
+        elif old != video:
+            updated.append(video)
+    deleted = [title for title in previous if title not in titles]
+    return {'added': added, 'updated': updated, 'deleted': deleted}
+
+
+def _sse(event: str, data: Dict, event_id: Optional[str] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+# 当前进程中的推送连接数限制，每个连接占用一个工作线程
+_event_streams = threading.BoundedSemaphore(LIBRARY_EVENTS_CONFIG['max_streams'])
+
+
+@app.route('/api/library/events')
+def library_events():
+    """以Server-Sent Events推送视频库的变化
+
+    查询参数:
+        version: 客户端已有的视频列表版本（/api/videos 返回的version），与当前版本不同时先发送完整列表；
+            重连时的Last-Event-ID优先
+
+    事件:
+        reset: 完整的视频列表 {version, videos}
+        library: 变化的视频 {version, added, updated, deleted}
+
+    任何进程（包括命令行）保存或删除视频都会递增共享的视频库版本号，各推送连接据此发现变化
+    """
+    if not _event_streams.acquire(blocking=False):
+        return Response('推送连接数已达上限', status=503, headers={'Retry-After': '30'})
+
+    # 浏览器自动重连时通过Last-Event-ID带上最后收到的版本
+    client_version = request.headers.get('Last-Event-ID') or request.args.get('version')
+
+    def stream():
+        os.makedirs('docs', exist_ok=True)
+        # 浏览器断线后的重连间隔（毫秒）
+        yield "retry: 3000\n\n"
+        version, library = _library_index()
+        if version != client_version:
+            yield _sse('reset', {'version': version, 'videos': library}, version)
+        known = {video['title']: video for video in library}
+
+        started_at = last_sent = time.monotonic()
+        while time.monotonic() - started_at < LIBRARY_EVENTS_CONFIG['max_age']:
+            time.sleep(LIBRARY_EVENTS_CONFIG['poll_interval'])
+            if _library_version() != version:
+                version, library = _library_index()
+                changes = _library_diff(known, library)
+                known = {video['title']: video for video in library}
+                if any(changes.values()):
+                    yield _sse('library', dict(changes, version=version), version)
+                    last_sent = time.monotonic()
+                    continue
+            if time.monotonic() - last_sent >= LIBRARY_EVENTS_CONFIG['heartbeat']:
+                # 注释行作为心跳，客户端断开后写入失败，连接随之结束
+                yield ": ping\n\n"
+                last_sent = time.monotonic()
+
+    response = Response(
+        stream(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+    response.call_on_close(_event_streams.release)
+    return response
+
+
+@app.route('/api/related/<video_title>')
+def get_related_videos(video_title: str):
+    """获取视频的关键词和字幕内容相关的其他视频
+
+    查询参数:
+        limit: 返回的相关视频数，默认为10
+    """
+    try:
+        keyword_index = get_keyword_index()
+        if keyword_index is None:
+            return jsonify({'success': False, 'error': '关键词索引未启用'})
+
+        safe_title = sanitize_filename(video_title)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+        return jsonify(
+            {
+                'success': True,
+                'keywords': [
+                    {'term': term, 'weight': round(weight, 4)}
+                    for term, weight in keyword_index.keywords_of(safe_title)
+                ],
+                'related': [
+                    {
+                        'title': item['doc'],
+                        'score': item['score'],
+                        'shared': item['shared'],
+                    }
+                    for item in keyword_index.related(safe_title, limit)
+                ],
+            }
+        )
+
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+
 @app.route('/api/video_content/<video_title>/<content_type>')
 def get_video_content(video_title: str, content_type: str):
-    """获取指定视频的内容"""
+    """获取指定视频的内容
+
+    查询参数:
+        raw: 为1时直接返回文本文件（使用预压缩副本，支持Range请求）
+        format: 为cues时返回解析后的字幕条目列表（仅字幕）
+        offset, length: 按字节分页，边界对齐到完整字符
+        start, count: 按段落分页（段落以空行分隔）
+    """
     try:
         safe_title = sanitize_filename(video_title)
         video_dir = os.path.join('docs', safe_title)
-        
+
         if not os.path.exists(video_dir):
             return jsonify({'success': False, 'error': '视频文件夹不存在'})
-        
+
         filename = 'article.txt' if content_type == 'article' else 'srt.srt'
         file_path = os.path.join(video_dir, filename)
-        
+
         if not os.path.exists(file_path):
             return jsonify({'success': False, 'error': f'{content_type}文件不存在'})
-        
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        return jsonify({
+
+        if request.args.get('raw') == '1':
+            mimetype = (
+                'text/plain' if content_type == 'article' else 'application/x-subrip'
+            )
+            return send_text_file(file_path, mimetype)
+
+        stat = os.stat(file_path)
+        result = {
             'success': True,
-            'content': content,
             'content_type': content_type,
-            'video_title': video_title
-        })
-        
+            'video_title': video_title,
+        }
+
+        if request.args.get('format') == 'cues' and content_type != 'article':
+            result['cues'] = load_cues(file_path)
+            return json_response(
+                result, etag=file_etag(stat), last_modified=stat.st_mtime
+            )
+
+        if 'offset' in request.args or 'length' in request.args:
+            offset = max(0, request.args.get('offset', 0, type=int))
+            length = max(1, request.args.get('length', 64 * 1024, type=int))
+            content, next_offset, total_bytes = _read_byte_range(
+                file_path, offset, length
+            )
+            result.update({'next_offset': next_offset, 'total_bytes': total_bytes})
+        else:
+            content = load_text(file_path)
+
+            if 'start' in request.args or 'count' in request.args:
+                paragraphs = content.split('\n\n')
+                start = max(0, request.args.get('start', 0, type=int))
+                count = max(1, request.args.get('count', 50, type=int))
+                content = '\n\n'.join(paragraphs[start : start + count])
+                next_start = start + count if start + count < len(paragraphs) else None
+                result.update(
+                    {'next_start': next_start, 'total_paragraphs': len(paragraphs)}
+                )
+
+        result['content'] = content
+        return json_response(result, etag=file_etag(stat), last_modified=stat.st_mtime)
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/chapters/<video_title>')
+def get_video_chapters(video_title: str):
+    """获取视频的章节目录：每章的开始/结束时间、标题和关键词"""
+    try:
+        safe_title = sanitize_filename(video_title)
+        file_path = os.path.join('docs', safe_title, 'srt.srt')
+
+        if not os.path.exists(file_path):
+            return jsonify({'success': False, 'error': '字幕文件不存在'})
+
+        stat = os.stat(file_path)
+        chapters = [
+            {key: chapter[key] for key in ('index', 'from', 'to', 'title', 'keywords')}
+            for chapter in detect_chapters(load_cues(file_path))
+        ]
+        return json_response(
+            {'success': True, 'video_title': video_title, 'chapters': chapters},
+            etag=file_etag(stat),
+            last_modified=stat.st_mtime,
+        )
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/transcripts/<bvid>')
+def get_transcripts(bvid: str):
+    """按视频ID查询字幕存储中的记录"""
+    store = get_store()
+    if not store:
+        return jsonify({'success': False, 'error': '字幕存储未启用'})
+
+    entries = store.find(
+        bvid, request.args.get('cid', type=int), request.args.get('lang')
+    )
+    return json_response({'success': True, 'bvid': bvid, 'entries': entries})
+
+
+@app.route('/api/transcripts/<bvid>/<content_type>')
+def get_transcript_content(bvid: str, content_type: str):
+    """按视频ID读取字幕存储中的内容 (raw、normalized、srt 或 article)"""
+    try:
+        store = get_store()
+        if not store:
+            return jsonify({'success': False, 'error': '字幕存储未启用'})
+
+        record = store.get(
+            bvid, request.args.get('cid', type=int), request.args.get('lang')
+        )
+        if not record:
+            return jsonify({'success': False, 'error': '字幕记录不存在'})
+
+        # 内容按哈希寻址，哈希即可作为ETag
+        return json_response(
+            {
+                'success': True,
+                'bvid': bvid,
+                'cid': record['cid'],
+                'lang': record['lang'],
+                'content_type': content_type,
+                'content': store.get_content(record, content_type),
+            },
+            etag=record[f'{content_type}_hash'],
+        )
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/cache_stats')
+def get_cache_stats():
+    """获取字幕内容缓存的命中率等统计信息"""
+    return jsonify(
+        {
+            'success': True,
+            'transcript_cache': transcript_cache.stats(),
+            'writer': writer.stats(),
+        }
+    )
+
+
+@app.route('/api/stats')
+def get_library_stats_summary():
+    """获取视频库的汇总统计：视频数、字幕时长、字数、语言、作者和每天入库数量
+
+    查询参数:
+        days: 返回最近多少天的入库数量
+    """
+    try:
+        library_stats = get_library_stats()
+        if library_stats is None:
+            return jsonify({'success': False, 'error': '视频库统计未启用'})
+        days = request.args.get('days', type=int)
+        return jsonify(
+            dict(
+                library_stats.summary(min(max(days, 1), 366) if days else None),
+                success=True,
+            )
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/metrics')
+def get_metrics():
+    """以Prometheus文本格式输出所有工作进程合并后的性能指标"""
+    return Response(
+        render_prometheus(metrics.collect()), mimetype='text/plain; version=0.0.4'
+    )
+
+
+@app.route('/api/accounts')
+def get_account_stats():
+    """获取Cookie账号池中各账号的负载和健康状态"""
+    from cookie_pool import get_cookie_pool
+
+    return jsonify({'success': True, 'accounts': get_cookie_pool().stats()})
+
+
+@app.route('/api/preview')
+def preview_video():
+    """输入链接后立即调用：返回视频信息和可用的字幕语言，并在后台预取字幕内容"""
+    try:
+        url = request.args.get('url', '').strip()
+        if not url:
+            return jsonify({'success': False, 'error': '请输入有效的视频链接'})
+
+        if not BILIBILI_COOKIE_POOL:
+            return jsonify(
+                {
+                    'success': False,
+                    'error': '未配置Cookie，请在.env文件中配置BILIBILI_COOKIES',
+                }
+            )
+
+        result = prefetcher.preview(BilibiliSubtitleService(), url)
+        video_info = result['video_info']
+        return jsonify(
+            {
+                'success': True,
+                'video_info': {
+                    'title': video_info['title'],
+                    'author': video_info['author'],
+                    'aid': video_info['aid'],
+                    'bvid': video_info['bvid'],
+                    'pages': [
+                        {
+                            'page': page.get('page'),
+                            'part': page.get('part'),
+                            'duration': page.get('duration'),
+                        }
+                        for page in video_info.get('pages') or []
+                    ],
+                },
+                'subtitles': [
+                    {'lan': subtitle['lan'], 'lan_doc': subtitle['lan_doc']}
+                    for subtitle in result['subtitles']
+                ],
+                'prefetching': result['prefetching'],
+            }
+        )
+
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+
 @app.route('/api/process', methods=['POST'])
 def process_video():
-    """处理视频字幕获取请求"""
+    """处理视频字幕获取请求，开启追踪时每个请求写出一份追踪结果"""
+    url = str((request.get_json(silent=True) or {}).get('url', '')).strip()
+    with tracer.job(url.rstrip('/').rsplit('/', 1)[-1] or 'process'):
+        return _process_video()
+
+
+def _process_video():
+    """获取并保存视频字幕"""
     try:
         data = request.get_json()
         url = data.get('url', '').strip()
         with_timestamp = data.get('with_timestamp', False)
-        
+        refresh = bool(data.get('refresh', False))
+        danmaku = bool(data.get('danmaku', False))
+
         if not url:
             return jsonify({'success': False, 'error': '请输入有效的视频链接'})
-        
+
         # 检查Cookie配置
-        if not BILIBILI_COOKIES:
+        if not BILIBILI_COOKIE_POOL:
             return jsonify({
                 'success': False, 
                 'error': '未配置Cookie，请在.env文件中配置BILIBILI_COOKIES'
             })
-        
-        service = BilibiliSubtitleService()
-        
+
+        service = BilibiliSubtitleService(refresh=refresh)
+
         # 获取视频信息
         video_info = service.get_video_info(url)
-        
-        # 获取字幕列表
-        subtitle_list = service.get_subtitle_list(video_info['aid'], video_info['cid'])
-        
-        if not subtitle_list:
+
+        # 获取字幕列表，预览过的视频使用缓存的结果
+        subtitle_list = prefetcher.subtitle_list(service, video_info)
+
+        if not subtitle_list and not danmaku:
             return jsonify({
                 'success': False,
                 'error': '该视频没有可用的字幕'
             })
-        
-        # 使用第一个可用字幕
-        selected_subtitle = subtitle_list[0]
-        
-        # 获取字幕内容
-        subtitle_content = service.get_subtitle_content(selected_subtitle['subtitle_url'])
-        
-        # 生成两种格式
-        srt_content = service.format_subtitle(subtitle_content, "srt")
-        article_content = service.format_as_article(subtitle_content, with_timestamp)
-        
+
+        store = get_store()
+        peaks = None
+        previous = None
+        if subtitle_list:
+            # 使用第一个可用字幕
+            selected_subtitle = subtitle_list[0]
+
+            # 获取字幕内容，优先使用预览时预取的内容，已保存且未变化的字幕不重新下载
+            previous = (
+                store.previous_subtitle(video_info, selected_subtitle)
+                if store
+                else None
+            )
+            subtitle_content, validators = prefetcher.subtitle_content(
+                service, selected_subtitle, previous
+            )
+        else:
+            # 没有字幕时使用弹幕，按时间分组合并为字幕格式
+            track = service.get_video_danmaku(video_info)
+            if not len(track):
+                return jsonify(
+                    {'success': False, 'error': '该视频没有可用的字幕，也没有弹幕'}
+                )
+            selected_subtitle = {'lan': 'danmaku', 'lan_doc': '弹幕'}
+            subtitle_content, validators = track.to_subtitle_data(), {'changed': True}
+            peaks = track.peaks()
+
+        # 规范化字幕文本后生成两种格式，字幕未变化时使用已保存的规范化结果
+        normalized = service.normalize_subtitle(subtitle_content, previous)
+        srt_content = service.format_subtitle(normalized, "srt")
+        article_content = service.format_as_article(normalized, with_timestamp)
+
         # 在字幕内容中添加视频链接信息（用于后续提取）
         srt_content_with_url = f"# Video URL: {url}\n{srt_content}"
         article_content_with_url = f"# Video URL: {url}\n# Video Title: {video_info['title']}\n\n{article_content}"
-        
+
         # 保存文件
         srt_path = save_content(video_info['title'], 'srt', srt_content_with_url)
         article_path = save_content(video_info['title'], 'article', article_content_with_url)
-        
-        return jsonify({
-            'success': True,
-            'video_info': {
-                'title': video_info['title'],
-                'author': video_info['author'],
-                'aid': video_info['aid']
-            },
-            'subtitle_info': {
-                'language': selected_subtitle['lan_doc'],
-                'subtitle_count': len(subtitle_content.get('body', [])),
-                'article_length': len(article_content)
-            },
-            'files': {
-                'srt_path': srt_path,
-                'article_path': article_path
+        writer.submit_call(
+            record_video_metadata,
+            sanitize_filename(video_info['title']),
+            video_info,
+            selected_subtitle,
+        )
+        writer.submit_call(
+            record_saved_video,
+            sanitize_filename(video_info['title']),
+            video_info,
+            selected_subtitle,
+        )
+
+        if store:
+            writer.submit_call(
+                store.put,
+                video_info,
+                selected_subtitle,
+                subtitle_content,
+                srt_content,
+                article_content,
+                validators,
+                normalized,
+            )
+
+        # 等这个视频的文件和记录写完再返回，返回的路径可以立即下载；不等待其他请求之后提交的写入
+        if not writer.barrier(WRITER_CONFIG['barrier_timeout']):
+            return jsonify(
+                {'success': False, 'error': '保存文件超时，请稍后刷新视频列表'}
+            )
+
+        return jsonify(
+            {
+                'success': True,
+                'video_info': {
+                    'title': video_info['title'],
+                    'author': video_info['author'],
+                    'aid': video_info['aid'],
+                },
+                'subtitle_info': {
+                    'language': selected_subtitle['lan_doc'],
+                    'subtitle_count': len(subtitle_content.get('body', [])),
+                    'article_length': len(article_content),
+                    'danmaku_peaks': peaks,
+                },
+                'files': {'srt_path': srt_path, 'article_path': article_path},
             }
-        })
-        
+        )
+
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
+
 @app.route('/api/download/<path:filename>')
 def download_file(filename):
     """下载文件"""
@@ -224,24 +759,26 @@ def download_all_files(video_title):
     try:
         safe_title = sanitize_filename(video_title)
         video_dir = os.path.join('docs', safe_title)
-        
+
         if not os.path.exists(video_dir):
             return jsonify({'error': '文件夹不存在'}), 404
-        
+
         # 创建临时ZIP文件
         temp_dir = tempfile.gettempdir()
         zip_filename = f"{safe_title}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
         zip_path = os.path.join(temp_dir, zip_filename)
-        
+
         with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
             for root, dirs, files in os.walk(video_dir):
                 for file in files:
+                    if is_sidecar(file) or is_temp_file(file):
+                        continue
                     file_path = os.path.join(root, file)
                     arcname = os.path.relpath(file_path, video_dir)
                     zipf.write(file_path, arcname)
-        
+
         return send_file(zip_path, as_attachment=True, download_name=zip_filename)
-        
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -251,19 +788,47 @@ def delete_video(video_title: str):
     try:
         safe_title = sanitize_filename(video_title)
         video_dir = os.path.join('docs', safe_title)
-        
+
         if not os.path.exists(video_dir):
             return jsonify({'success': False, 'error': '视频文件夹不存在'})
-        
+
+        # 先写完队列中的内容，避免删除后又被重新创建
+        writer.flush()
+
+        # 同时删除字幕存储中这个目录对应的记录（视频、分P和字幕语言）
+        store = get_store()
+        library_index = get_library_index()
+        entry = library_index.get(safe_title)
+        if store and entry and entry['store_key']:
+            if entry['cid'] is not None:
+                store.delete(entry['store_key'], entry['cid'], entry['lang'])
+            else:
+                # 升级前保存的视频没有记录分P，只删除标题与目录名相同的记录
+                for record in store.find(entry['store_key']):
+                    if sanitize_filename(record['title']) == safe_title:
+                        store.delete(record['bvid'], record['cid'], record['lang'])
+
         # 删除整个文件夹
         import shutil
         shutil.rmtree(video_dir)
-        
+        invalidate_path(video_dir)
+        dedupe_index = get_dedupe_index()
+        if dedupe_index:
+            dedupe_index.remove(safe_title)
+        keyword_index = get_keyword_index()
+        if keyword_index:
+            keyword_index.remove(safe_title)
+        library_stats = get_library_stats()
+        if library_stats:
+            library_stats.remove(safe_title)
+        library_index.remove(safe_title)
+        bump_library_generation()
+
         return jsonify({
             'success': True,
             'message': f'已成功删除视频"{video_title}"的所有文件'
         })
-        
+
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
@@ -278,4 +843,4 @@ if __name__ == '__main__':
     print("📱 访问地址: http://localhost:8080")
     print("⚠️  请确保已配置Cookie信息")
     
-    app.run(debug=True, host='0.0.0.0', port=8080) 
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=8080)
@@ -0,0 +1,325 @@
+"""
+持久化任务队列
+基于SQLite的多进程任务队列，支持租约（lease）、确认（ack）和可见性超时
+工作进程领取任务后持有一段时间的租约，处理期间定期续约；进程崩溃后租约过期，任务自动被其他工作进程重新领取
+多台机器共享同一文件系统时，把 QUEUE_PATH 指向共享目录并使用 QUEUE_JOURNAL_MODE=DELETE
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import QUEUE_CONFIG
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    available_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_url ON jobs (url, status);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    jobs_done INTEGER NOT NULL DEFAULT 0,
+    jobs_failed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# 任务状态
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class WorkQueue:
+    """基于SQLite的持久化任务队列"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or QUEUE_CONFIG["path"]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.visibility_timeout = QUEUE_CONFIG["visibility_timeout"]
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接；fork之后重新连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={QUEUE_CONFIG['journal_mode']}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, func: Any) -> Any:
+        """在写事务中执行，领取任务等操作需要原子地读取并修改"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def enqueue(
+        self,
+        urls: Iterable[str],
+        options: Optional[Dict[str, Any]] = None,
+        unique: bool = True,
+    ) -> List[int]:
+        """添加任务，返回新任务的id
+
+        Args:
+            urls: 视频链接
+            options: 处理选项（language、with_timestamp、refresh）
+            unique: 为True时跳过已在队列中等待或处理中的相同链接
+        """
+        options_json = json.dumps(options or {}, ensure_ascii=False, sort_keys=True)
+        now = time.time()
+
+        def insert(conn: sqlite3.Connection) -> List[int]:
+            ids = []
+            for url in urls:
+                if (
+                    unique
+                    and conn.execute(
+                        "SELECT 1 FROM jobs WHERE url = ? AND status IN (?, ?)",
+                        (url, PENDING, LEASED),
+                    ).fetchone()
+                ):
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO jobs (url, options, max_attempts, available_at, "
+                    "created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, options_json, QUEUE_CONFIG["max_attempts"], now, now, now),
+                )
+                ids.append(cursor.lastrowid)
+            return ids
+
+        return self._transaction(insert)
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取一个可处理的任务并加上租约，没有任务时返回None
+
+        租约过期的任务视为处理该任务的进程已崩溃，可以被重新领取
+        """
+        now = time.time()
+
+        def claim_one(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            # 租约过期且已达到最大尝试次数的任务不再重试
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = COALESCE(last_error, ?), "
+                "lease_owner = NULL, "
+                "updated_at = ? WHERE status = ? AND lease_expires_at <= ? AND "
+                "attempts >= max_attempts",
+                (FAILED, "处理超时", now, LEASED, now),
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) "
+                "OR (status = ? AND lease_expires_at <= ?) ORDER BY available_at, id "
+                "LIMIT 1",
+                (PENDING, now, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (LEASED, worker_id, now + self.visibility_timeout, now, row["id"]),
+            )
+            job = dict(row)
+            job["options"] = json.loads(job["options"])
+            job["attempts"] += 1
+            return job
+
+        return self._transaction(claim_one)
+
+    def extend(self, job_id: int, worker_id: str) -> bool:
+        """续约，返回False表示租约已过期并被其他进程领取"""
+        now = time.time()
+        return (
+            self._connect()
+            .execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + self.visibility_timeout, now, job_id, LEASED, worker_id),
+            )
+            .rowcount
+            == 1
+        )
+
+    def ack(
+        self, job_id: int, worker_id: str, result: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """确认任务完成；租约已被其他进程接手时返回False"""
+        return (
+            self._connect()
+            .execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL, "
+                "updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (
+                    DONE,
+                    json.dumps(result or {}, ensure_ascii=False),
+                    time.time(),
+                    job_id,
+                    LEASED,
+                    worker_id,
+                ),
+            )
+            .rowcount
+            == 1
+        )
+
+    def nack(self, job_id: int, worker_id: str, error: str) -> Optional[str]:
+        """任务失败，未达到最大尝试次数时延迟后重试
+
+        Returns:
+            Optional[str]: 任务的新状态；租约已被其他进程接手时返回None
+        """
+        now = time.time()
+
+        def fail(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? "
+                "AND lease_owner = ?",
+                (job_id, LEASED, worker_id),
+            ).fetchone()
+            if row is None:
+                return None
+            retry = row["attempts"] < row["max_attempts"]
+            # 指数退避，避免持续失败的任务占满队列
+            delay = QUEUE_CONFIG["retry_backoff"] * (2 ** (row["attempts"] - 1))
+            status = PENDING if retry else FAILED
+            conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, "
+                "lease_expires_at = NULL, "
+                "available_at = ?, updated_at = ? WHERE id = ?",
+                (status, error, now + delay if retry else now, now, job_id),
+            )
+            return status
+
+        return self._transaction(fail)
+
+    def retry_failed(self) -> int:
+        """把所有失败的任务重新放回队列，返回数量"""
+        now = time.time()
+        return (
+            self._connect()
+            .execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, "
+                "updated_at = ? WHERE status = ?",
+                (PENDING, now, now, FAILED),
+            )
+            .rowcount
+        )
+
+    def purge_done(self, older_than: float = 0) -> int:
+        """删除已完成的任务，返回删除数量"""
+        return (
+            self._connect()
+            .execute(
+                "DELETE FROM jobs WHERE status = ? AND updated_at <= ?",
+                (DONE, time.time() - older_than),
+            )
+            .rowcount
+        )
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        row = (
+            self._connect()
+            .execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            .fetchone()
+        )
+        return dict(row) if row else None
+
+    def list_jobs(
+        self, status: Optional[str] = None, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """列出最近更新的任务"""
+        if status:
+            rows = self._connect().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+                (status, limit),
+            )
+        else:
+            rows = self._connect().execute(
+                "SELECT * FROM jobs ORDER BY updated_at DESC LIMIT ?", (limit,)
+            )
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """各状态的任务数和活跃的工作进程数"""
+        counts = {status: 0 for status in (PENDING, LEASED, DONE, FAILED)}
+        for row in self._connect().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+        ):
+            counts[row["status"]] = row["n"]
+        counts["workers"] = self.active_workers()
+        return counts
+
+    def heartbeat(
+        self, worker_id: str, done: Optional[int] = None, failed: Optional[int] = None
+    ) -> None:
+        """登记工作进程仍在运行，done/failed为None时保持已登记的完成和失败数"""
+        self._connect().execute(
+            "INSERT INTO workers (worker_id, host, pid, heartbeat_at, jobs_done, "
+            "jobs_failed) "
+            "VALUES (?, ?, ?, ?, COALESCE(?, 0), COALESCE(?, 0)) ON "
+            "CONFLICT(worker_id) DO UPDATE SET "
+            "heartbeat_at = excluded.heartbeat_at, jobs_done = COALESCE(?, jobs_done), "
+            "jobs_failed = COALESCE(?, jobs_failed)",
+            (
+                worker_id,
+                socket.gethostname(),
+                os.getpid(),
+                time.time(),
+                done,
+                failed,
+                done,
+                failed,
+            ),
+        )
+
+    def unregister(self, worker_id: str) -> None:
+        self._connect().execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def active_workers(self) -> int:
+        """最近一个可见性超时内有心跳的工作进程数"""
+        return (
+            self._connect()
+            .execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at > ?",
+                (time.time() - self.visibility_timeout,),
+            )
+            .fetchone()[0]
+        )
+
+
+def new_worker_id() -> str:
+    """生成工作进程标识：主机名:进程号:随机后缀"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
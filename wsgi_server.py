@@ -0,0 +1,254 @@
+"""
+生产环境WSGI服务
+主进程监听端口后fork出多个工作进程，每个工作进程使用固定大小的线程池处理请求
+支持fork前预加载应用，收到SIGTERM/SIGINT时等待进行中的请求完成后再退出
+缓存、限流等需要跨进程共享的数据保存在共享状态数据库中（见shared_state.py）
+"""
+
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from config import SERVER_CONFIG
+
+
+def load_app(app_path: str = "web_interface:app") -> Callable:
+    """按 "模块:变量" 格式导入WSGI应用"""
+    module_name, _, attr = app_path.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "app")
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """使用固定大小线程池处理请求的WSGI服务器"""
+
+    multithread = True
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        app: Callable,
+        threads: int,
+        multiprocess: bool = False,
+        fd: Optional[int] = None,
+        graceful_timeout: Optional[float] = None,
+    ):
+        self.multiprocess = multiprocess
+        self.graceful_timeout = (
+            SERVER_CONFIG["graceful_timeout"]
+            if graceful_timeout is None
+            else graceful_timeout
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 已接收但尚未处理完的连接数
+        self._active = 0
+        self._idle = threading.Condition()
+        super().__init__(host, port, app, handler=WSGIRequestHandler, fd=fd)
+        self._executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="wsgi"
+        )
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        with self._idle:
+            self._active += 1
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request: Any, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._idle:
+                self._active -= 1
+                self._idle.notify_all()
+
+    def server_close(self) -> None:
+        """停止接收新连接，等待已接收的请求处理完毕，最多等待graceful_timeout秒
+
+        serve_forever退出时werkzeug也会调用，重复调用时直接返回
+        """
+        super().server_close()
+        # 父类初始化时也会调用server_close，此时线程池尚未创建
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # 已提交的连接仍会处理，不再接受新任务
+        executor.shutdown(wait=False)
+        with self._idle:
+            if not self._idle.wait_for(
+                lambda: self._active == 0, self.graceful_timeout
+            ):
+                print(
+                    f"⚠️  {self._active} 个请求在 {self.graceful_timeout:g} 秒内未完成，不再等待",
+                    file=sys.stderr,
+                )
+
+
+def _create_listen_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(
+    app: Optional[Callable],
+    app_path: str,
+    sock: socket.socket,
+    host: str,
+    port: int,
+    threads: int,
+    multiprocess: bool,
+    graceful_timeout: Optional[float] = None,
+) -> None:
+    """工作进程主循环，收到SIGTERM后停止接收新连接并等待已有请求完成"""
+    if app is None:
+        app = load_app(app_path)
+    server = PooledWSGIServer(
+        host,
+        port,
+        app,
+        threads,
+        multiprocess=multiprocess,
+        fd=sock.fileno(),
+        graceful_timeout=graceful_timeout,
+    )
+
+    def handle_term(signum: int, frame: Any) -> None:
+        # shutdown会等待serve_forever退出，不能在处理请求的主线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_term)
+    # 多进程时Ctrl+C由主进程统一处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN if multiprocess else handle_term)
+    server.serve_forever()
+    # 等待进行中的请求完成，它们提交的文件也要在下面写完
+    server.server_close()
+
+    # 写完后台队列中的内容再退出
+    from background_writer import writer
+
+    writer.close()
+
+
+def serve(
+    app_path: str = "web_interface:app",
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    workers: Optional[int] = None,
+    threads: Optional[int] = None,
+    preload: Optional[bool] = None,
+) -> None:
+    """启动多进程、多线程的WSGI服务
+
+    Args:
+        app_path: WSGI应用，格式为 "模块:变量"
+        host: 监听地址
+        port: 监听端口
+        workers: 工作进程数
+        threads: 每个工作进程的线程数
+        preload: 是否在fork前加载应用，加载一次后由各工作进程共享
+    """
+    host = host or SERVER_CONFIG["host"]
+    port = port or SERVER_CONFIG["port"]
+    workers = max(1, workers or SERVER_CONFIG["workers"])
+    threads = max(1, threads or SERVER_CONFIG["threads"])
+    preload = SERVER_CONFIG["preload"] if preload is None else preload
+    graceful_timeout = SERVER_CONFIG["graceful_timeout"]
+
+    app = load_app(app_path) if preload else None
+    sock = _create_listen_socket(host, port)
+
+    # 不支持fork的平台只运行一个进程
+    if not hasattr(os, "fork") or workers == 1:
+        print(f"✅ 已启动单进程服务，{threads} 个线程，监听 {host}:{port}")
+        try:
+            _run_worker(app, app_path, sock, host, port, threads, multiprocess=False)
+        finally:
+            sock.close()
+        return
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                _run_worker(app, app_path, sock, host, port, threads, multiprocess=True)
+            except BaseException as e:
+                print(f"❌ 工作进程异常退出: {e}", file=sys.stderr)
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        children[pid] = slot
+
+    def handle_stop(signum: int, frame: Any) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for slot in range(workers):
+        spawn(slot)
+    print(
+        f"✅ 已启动 {workers} 个工作进程，每个进程 {threads} 个线程，监听 {host}:{port}"
+    )
+
+    # 监控工作进程，异常退出时自动重启
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"⚠️  工作进程 {pid} 已退出，正在重启", file=sys.stderr)
+            # 避免启动即崩溃时反复重启占满CPU
+            time.sleep(1)
+            spawn(slot)
+
+    # 优雅退出：通知所有工作进程，超时后强制结束
+    print("\n🛑 正在停止服务，等待进行中的请求完成...")
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    # 工作进程最多等待graceful_timeout秒，再留出写完后台队列的时间
+    deadline = time.monotonic() + graceful_timeout + 10
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.1)
+        else:
+            children.pop(pid, None)
+
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    sock.close()